@@ -0,0 +1,262 @@
+"""
+Archivo frío de la bitácora.
+
+Las entradas que salen de la tabla en vivo se guardan en un JSONL comprimido
+por mes (bitacora-AAAA-MM.jsonl.gz) dentro de BITACORA_ARCHIVO_DIR, junto
+con un índice (indice.json) que dice qué meses hay y cuántas entradas tiene
+cada uno. Cada escritura agrega un miembro gzip nuevo al archivo del mes, así
+que se puede seguir agregando sin reescribir lo anterior.
+
+Si un archivado se corta entre escribir y borrar de la tabla, la siguiente
+corrida vuelve a escribir esas entradas: leer() descarta el duplicado por id
+y el total del mes queda marcado sin verificar hasta que recontar() lo
+corrige (archivar_bitacora y la purga lo llaman al terminar).
+"""
+import fcntl
+import gzip
+import heapq
+import json
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_datetime
+
+from a_usuarios.models import Usuario
+from .models import Bitacora
+
+
+def directorio_archivo():
+    # Se crea al escribir (_bloqueo); leer sin archivo no crea nada
+    return getattr(settings, 'BITACORA_ARCHIVO_DIR', os.path.join(settings.BASE_DIR, 'var', 'archivo'))
+
+
+def _ruta_mes(anio, mes):
+    return os.path.join(directorio_archivo(), f'bitacora-{anio:04d}-{mes:02d}.jsonl.gz')
+
+
+def _ruta_indice():
+    return os.path.join(directorio_archivo(), 'indice.json')
+
+
+@contextmanager
+def _bloqueo():
+    # Un solo proceso escribe en el archivo a la vez
+    os.makedirs(directorio_archivo(), exist_ok=True)
+    with open(os.path.join(directorio_archivo(), '.lock'), 'w') as candado:
+        fcntl.flock(candado, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(candado, fcntl.LOCK_UN)
+
+
+# Índice leído por última vez y la firma (stat) de indice.json con la que se leyó
+_indice = {'firma': None, 'datos': {}}
+
+
+def _cargar_indice():
+    try:
+        with open(_ruta_indice(), encoding='utf-8') as archivo:
+            return json.load(archivo)
+    except FileNotFoundError:
+        return {}
+
+
+def leer_indice():
+    """Índice del archivo; solo se vuelve a leer si indice.json cambió. No modificar el resultado."""
+    ruta = _ruta_indice()
+    try:
+        estado = os.stat(ruta)
+    except FileNotFoundError:
+        return {}
+    firma = (ruta, estado.st_ino, estado.st_mtime_ns, estado.st_size)
+    if _indice['firma'] != firma:
+        _indice.update(firma=firma, datos=_cargar_indice())
+    return _indice['datos']
+
+
+def _guardar_indice(indice):
+    temporal = _ruta_indice() + '.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(indice, archivo, indent=2, sort_keys=True)
+        archivo.flush()
+        os.fsync(archivo.fileno())
+    os.replace(temporal, _ruta_indice())
+
+
+def serializar(b):
+    """Entrada de bitácora como dict autocontenido (el usuario puede no existir después)."""
+    return {
+        'id': str(b.id),
+        'usuario': b.usuario_id,
+        'usuario_nombre': f"{b.usuario.nombre} {b.usuario.apellido}",
+        'usuario_email': b.usuario.email,
+        'accion': b.accion,
+        'timestamp': b.timestamp,
+        'ip': b.ip,
+        'modulo': b.modulo,
+        'detalles': b.detalles,
+        'objeto_tipo': b.objeto_tipo,
+        'objeto_id': b.objeto_id,
+    }
+
+
+def agregar(entradas):
+    """
+    Agrega entradas (instancias de Bitacora con usuario cargado) al archivo.
+
+    Devuelve cuántas se escribieron. Los archivos se sincronizan a disco
+    antes de volver, así que quien llama ya puede borrarlas de la tabla.
+    """
+    por_mes = {}
+    for b in entradas:
+        utc = b.timestamp.astimezone(dt_timezone.utc)
+        por_mes.setdefault((utc.year, utc.month), []).append(serializar(b))
+
+    if not por_mes:
+        return 0
+
+    with _bloqueo():
+        indice = _cargar_indice()
+        for (anio, mes), filas in por_mes.items():
+            ruta = _ruta_mes(anio, mes)
+            with open(ruta, 'ab') as crudo:
+                with gzip.GzipFile(fileobj=crudo, mode='wb') as comprimido:
+                    for fila in filas:
+                        comprimido.write((json.dumps(fila, cls=DjangoJSONEncoder) + '\n').encode('utf-8'))
+                crudo.flush()
+                os.fsync(crudo.fileno())
+
+            clave = f'{anio:04d}-{mes:02d}'
+            datos = indice.setdefault(clave, {'archivo': os.path.basename(ruta), 'total': 0})
+            datos['total'] += len(filas)
+            # Pueden ser entradas que ya estaban (archivado repetido); recontar() lo confirma
+            datos['verificado'] = False
+        _guardar_indice(indice)
+
+    return sum(len(filas) for filas in por_mes.values())
+
+
+def limite():
+    """Fin (exclusivo, UTC) del mes archivado más reciente, o None si no hay archivo."""
+    indice = leer_indice()
+    if not indice:
+        return None
+    anio, mes = (int(p) for p in max(indice).split('-'))
+    anio, mes = (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+    return datetime(anio, mes, 1, tzinfo=dt_timezone.utc)
+
+
+def recontar():
+    """Corrige el total de los meses sin verificar contando sus ids distintos. Devuelve los meses corregidos."""
+    corregidos = []
+    with _bloqueo():
+        indice = _cargar_indice()
+        for clave, datos in sorted(indice.items()):
+            if datos.get('verificado'):
+                continue
+            ids = set()
+            with gzip.open(os.path.join(directorio_archivo(), datos['archivo']), 'rt', encoding='utf-8') as archivo:
+                for linea in archivo:
+                    ids.add(json.loads(linea)['id'])
+            datos.update(total=len(ids), verificado=True)
+            corregidos.append(clave)
+        if corregidos:
+            _guardar_indice(indice)
+    return corregidos
+
+
+def _rango_mes(clave):
+    anio, mes = (int(p) for p in clave.split('-'))
+    return (datetime(anio, mes, 1, tzinfo=dt_timezone.utc),
+            datetime(anio + (mes == 12), mes % 12 + 1, 1, tzinfo=dt_timezone.utc))
+
+
+def _coincide(fila, filtros):
+    """Los mismos filtros que BitacoraFilter y la búsqueda (?search=) del listado, sobre una fila archivada."""
+    for campo in ('usuario', 'modulo', 'ip', 'objeto_tipo', 'objeto_id'):
+        if filtros.get(campo) is not None and str(fila.get(campo)) != str(filtros[campo]):
+            return False
+    if filtros.get('timestamp') is not None and fila['timestamp'] != filtros['timestamp']:
+        return False
+    if filtros.get('campo') is not None:
+        cambios = (fila.get('detalles') or {}).get('cambios')
+        if not isinstance(cambios, dict) or filtros['campo'] not in cambios:
+            return False
+    # Como SearchFilter: cada término debe aparecer en alguno de los campos (en el archivo el nombre
+    # del usuario incluye el apellido)
+    textos = [(fila.get(c) or '').lower() for c in ('accion', 'usuario_email', 'usuario_nombre')]
+    return all(any(termino.lower() in texto for texto in textos) for termino in filtros.get('buscar') or ())
+
+
+def _filas_mes(clave, desde, hasta, filtros):
+    filas = {}
+    with gzip.open(os.path.join(directorio_archivo(), leer_indice()[clave]['archivo']), 'rt', encoding='utf-8') as archivo:
+        for linea in archivo:
+            fila = json.loads(linea)
+            fila['timestamp'] = parse_datetime(fila['timestamp'])
+            if desde is not None and fila['timestamp'] < desde:
+                continue
+            if hasta is not None and fila['timestamp'] > hasta:
+                continue
+            if _coincide(fila, filtros):
+                # Si una corrida se interrumpió y se repitió, el id evita duplicados
+                filas[fila['id']] = fila
+    return filas
+
+
+def _meses(desde, hasta):
+    for clave in sorted(leer_indice(), reverse=True):
+        inicio_mes, fin_mes = _rango_mes(clave)
+        if (hasta is not None and inicio_mes > hasta) or (desde is not None and fin_mes <= desde):
+            continue
+        yield clave, inicio_mes, fin_mes
+
+
+def leer(desde=None, hasta=None, **filtros):
+    """
+    Entradas archivadas que cumplen los filtros, de la más reciente a la más antigua.
+
+    filtros: usuario, modulo, ip, objeto_tipo, objeto_id, timestamp, campo y
+    buscar (términos de ?search=). Se recorre un mes a la vez: solo las filas
+    del mes que pasan el filtro quedan en memoria para ordenarlas.
+    """
+    for clave, _, _ in _meses(desde, hasta):
+        filas = _filas_mes(clave, desde, hasta, filtros)
+        yield from sorted(filas.values(), key=lambda f: (f['timestamp'], f['id']), reverse=True)
+
+
+def contar(desde=None, hasta=None, **filtros):
+    """
+    Cuántas entradas archivadas devuelve leer() con los mismos filtros.
+
+    Los meses enteros dentro del rango y sin otros filtros salen del total del
+    índice; solo se descomprimen los meses de los bordes o con filtros.
+    """
+    filtrado = any(v for v in filtros.values())
+    total = 0
+    for clave, inicio_mes, fin_mes in _meses(desde, hasta):
+        entero = (desde is None or desde <= inicio_mes) and (hasta is None or hasta >= fin_mes)
+        if entero and not filtrado:
+            total += leer_indice()[clave]['total']
+        else:
+            total += len(_filas_mes(clave, desde, hasta, filtros))
+    return total
+
+
+def instancia(fila):
+    """Bitacora (sin guardar) de una fila archivada, para serializarla igual que una viva."""
+    usuario = Usuario(id=fila['usuario'], nombre=fila['usuario_nombre'], apellido='', email=fila['usuario_email'])
+    return Bitacora(
+        id=fila['id'], usuario=usuario, accion=fila['accion'], timestamp=fila['timestamp'], ip=fila['ip'],
+        modulo=fila['modulo'], detalles=fila['detalles'],
+        objeto_tipo=fila.get('objeto_tipo'), objeto_id=fila.get('objeto_id'),
+    )
+
+
+def combinar(vivas, archivadas):
+    """Une dos secuencias ya ordenadas de más reciente a más antigua."""
+    return heapq.merge(vivas, archivadas, key=lambda x: x[0], reverse=True)
@@ -1,5 +1,6 @@
 from rest_framework import viewsets
 from a_bitacora.utils import RegistroBitacora
+from a_bitacora.cambios import instantanea, diferencias, identificar
 from rest_framework.permissions import IsAuthenticated
 
 class BitacoraModelViewSet(viewsets.ModelViewSet):
@@ -18,6 +19,13 @@ class BitacoraModelViewSet(viewsets.ModelViewSet):
     def get_client_ip(self):
         return self.request.META.get('HTTP_X_FORWARDED_FOR', self.request.META.get('REMOTE_ADDR'))
 
+    def get_detalles_objeto(self, obj, **extra):
+        detalles = {'objeto': str(self.get_objeto_nombre(obj)), **extra}
+        # Una creación en lote (many=True) devuelve una lista: no hay un único objeto
+        if hasattr(obj, '_meta'):
+            detalles['objeto_tipo'], detalles['objeto_id'] = identificar(obj)
+        return detalles
+
     def perform_create(self, serializer):
         obj = serializer.save()
         try:
@@ -25,19 +33,23 @@ class BitacoraModelViewSet(viewsets.ModelViewSet):
                 usuario=self.request.user,
                 accion=f"Creó {self.bitacora_modulo.lower()}: {self.get_objeto_nombre(obj)}",
                 ip=self.get_client_ip(),
-                modulo=self.bitacora_modulo
+                modulo=self.bitacora_modulo,
+                detalles=self.get_detalles_objeto(obj)
             )
         except Exception as e:
             print(f"[Bitácora] Error al registrar creación: {e}")
 
     def perform_update(self, serializer):
+        # Estado en memoria antes y después de guardar; {campo: [anterior, nuevo]} va a detalles
+        antes = instantanea(serializer.instance)
         obj = serializer.save()
         try:
             RegistroBitacora.registrar(
                 usuario=self.request.user,
                 accion=f"Actualizó {self.bitacora_modulo.lower()}: {self.get_objeto_nombre(obj)}",
                 ip=self.get_client_ip(),
-                modulo=self.bitacora_modulo
+                modulo=self.bitacora_modulo,
+                detalles=self.get_detalles_objeto(obj, cambios=diferencias(antes, instantanea(obj)))
             )
         except Exception as e:
             print(f"[Bitácora] Error al registrar actualización: {e}")
@@ -49,7 +61,8 @@ class BitacoraModelViewSet(viewsets.ModelViewSet):
                 usuario=self.request.user,
                 accion=f"Eliminó {self.bitacora_modulo.lower()}: {nombre}",
                 ip=self.get_client_ip(),
-                modulo=self.bitacora_modulo
+                modulo=self.bitacora_modulo,
+                detalles=self.get_detalles_objeto(instance)
             )
         except Exception as e:
             print(f"[Bitácora] Error al registrar eliminación: {e}")
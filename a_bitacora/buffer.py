@@ -0,0 +1,273 @@
+import atexit
+import json
+import os
+import re
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, close_old_connections, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Bitacora
+from .resumen import escritura, registrar_en_resumen
+from .cambios import objeto_de
+
+
+class BufferBitacora:
+    """
+    Escritor de bitácora por lotes.
+
+    Las entradas se encolan en memoria y se agregan a un archivo spool
+    (solo anexado) antes de responder, así sobreviven a una caída del worker.
+    Un hilo en segundo plano las inserta con un bulk_create por lote cuando
+    se llena el lote o pasa el intervalo configurado.
+
+    Archivos en el directorio spool (<instancia> es el pid y un nonce de cada arranque):
+      bitacora-<instancia>.jsonl       entradas encoladas por esa instancia
+      bitacora-<instancia>-<n>.lote    lote en vuelo; se borra cuando se insertó
+
+    El nonce importa en contenedores, donde el worker suele volver a ser el
+    PID 1: sin él, un worker nuevo anexaría al spool del anterior y pisaría
+    sus lotes. Al arrancar se recupera todo lo que no es de esta instancia
+    y cuyo proceso ya no existe (el mismo pid con otro nonce es un
+    antecesor muerto).
+    """
+
+    def __init__(self):
+        self._pid = None
+        self._lock_inicio = threading.Lock()
+
+    def _config(self):
+        conf = getattr(settings, 'BITACORA_BUFFER', {})
+        return (
+            conf.get('TAMANO_LOTE', 200),
+            conf.get('INTERVALO', 2.0),
+            conf.get('DIRECTORIO_SPOOL', os.path.join(settings.BASE_DIR, 'var', 'bitacora')),
+        )
+
+    def _iniciar(self):
+        _, _, directorio = self._config()
+        os.makedirs(directorio, exist_ok=True)
+
+        pid = os.getpid()
+        self._directorio = directorio
+        self._lock = threading.Lock()
+        self._lock_vaciado = threading.Lock()
+        self._evento = threading.Event()
+        self._detenido = False
+        self._pendientes = []
+        self._fallidos = []
+        self._contador_lotes = 0
+        self._instancia = f'{pid}-{uuid.uuid4().hex[:8]}'
+        self._ruta_spool = os.path.join(directorio, f'bitacora-{self._instancia}.jsonl')
+        self._spool = open(self._ruta_spool, 'a', encoding='utf-8')
+        self._pid = pid
+
+        self._hilo = threading.Thread(target=self._ejecutar, name='bitacora-buffer', daemon=True)
+        self._hilo.start()
+        atexit.register(self.detener)
+
+    def encolar(self, usuario, accion, ip=None, modulo=None, detalles=None):
+        usuario_id = getattr(usuario, 'pk', None)
+        if usuario_id is None:
+            print(f"[Bitácora] Entrada descartada, no tiene usuario: {accion}")
+            return False
+
+        entrada = {
+            'id': str(uuid.uuid4()),
+            'usuario_id': usuario_id,
+            'accion': accion,
+            'timestamp': timezone.now(),
+            'ip': ip,
+            'modulo': modulo,
+            'detalles': detalles,
+        }
+        linea = json.dumps(entrada, cls=DjangoJSONEncoder) + '\n'
+
+        if self._pid != os.getpid():
+            # Primer uso en este proceso (o después de un fork)
+            with self._lock_inicio:
+                if self._pid != os.getpid():
+                    self._iniciar()
+
+        tamano_lote, _, _ = self._config()
+        with self._lock:
+            self._spool.write(linea)
+            self._spool.flush()
+            self._pendientes.append(entrada)
+            lleno = len(self._pendientes) >= tamano_lote
+
+        if lleno:
+            self._evento.set()
+        return True
+
+    def vaciar(self):
+        """Inserta lo que haya pendiente. Devuelve la cantidad de entradas escritas."""
+        if self._pid != os.getpid():
+            return 0
+
+        with self._lock_vaciado:
+            escritas = self._reintentar_fallidos()
+
+            with self._lock:
+                if not self._pendientes:
+                    return escritas
+                lote, self._pendientes = self._pendientes, []
+
+                # Rotar el spool: lo ya encolado pasa a ser el archivo del lote
+                self._spool.close()
+                ruta_lote = self._ruta_lote()
+                os.replace(self._ruta_spool, ruta_lote)
+                self._spool = open(self._ruta_spool, 'a', encoding='utf-8')
+
+            try:
+                self._insertar(lote)
+            except Exception:
+                # El lote sigue en disco; se reintenta en el próximo ciclo
+                self._fallidos.append((ruta_lote, lote))
+                raise
+            os.remove(ruta_lote)
+            return escritas + len(lote)
+
+    def _reintentar_fallidos(self):
+        escritas = 0
+        while self._fallidos:
+            ruta_lote, lote = self._fallidos[0]
+            self._insertar(lote)
+            os.remove(ruta_lote)
+            self._fallidos.pop(0)
+            escritas += len(lote)
+        return escritas
+
+    def detener(self):
+        if self._pid != os.getpid():
+            return
+        self._detenido = True
+        self._evento.set()
+        self._hilo.join(timeout=10)
+        try:
+            self.vaciar()
+        except Exception as e:
+            # Lo pendiente queda en disco y se recupera al próximo arranque
+            print(f"[Bitácora] Error al vaciar el buffer al cerrar: {e}")
+            return
+
+        with self._lock:
+            self._spool.close()
+            if not self._pendientes:
+                try:
+                    os.remove(self._ruta_spool)
+                except FileNotFoundError:
+                    # Ya se detuvo antes (detener() explícito y luego atexit)
+                    pass
+
+    def _ejecutar(self):
+        _, intervalo, _ = self._config()
+        try:
+            self._recuperar()
+        except Exception as e:
+            print(f"[Bitácora] Error al recuperar el spool: {e}")
+
+        while not self._detenido:
+            self._evento.wait(intervalo)
+            self._evento.clear()
+            try:
+                self.vaciar()
+            except Exception as e:
+                print(f"[Bitácora] Error al insertar lote: {e}")
+            finally:
+                close_old_connections()
+
+    def _ruta_lote(self):
+        self._contador_lotes += 1
+        return os.path.join(self._directorio, f'bitacora-{self._instancia}-{self._contador_lotes}.lote')
+
+    def _recuperar(self):
+        # Reinsertar spools y lotes de instancias que ya no existen
+        for nombre in sorted(os.listdir(self._directorio)):
+            partes = ARCHIVO_SPOOL.match(nombre)
+            if partes is None:
+                continue
+            pid, nonce = int(partes['pid']), partes['nonce']
+            if nonce is not None and f'{pid}-{nonce}' == self._instancia:
+                continue
+            # Mismo pid que este proceso pero otra instancia: el antecesor murió y su pid se reutilizó
+            if pid != self._pid and _proceso_vivo(pid):
+                continue
+
+            with self._lock:
+                ruta = self._ruta_lote()
+            try:
+                # El rename es atómico: si otro worker lo reclamó primero, falla
+                os.rename(os.path.join(self._directorio, nombre), ruta)
+            except FileNotFoundError:
+                continue
+
+            with open(ruta, encoding='utf-8') as archivo:
+                entradas = [json.loads(linea) for linea in archivo if linea.strip()]
+            try:
+                self._insertar(entradas)
+            except Exception as e:
+                # Ya es un lote de esta instancia: queda en disco y vaciar() lo reintenta
+                print(f"[Bitácora] Error al recuperar {nombre}, se reintentará: {e}")
+                with self._lock_vaciado:
+                    self._fallidos.append((ruta, entradas))
+                continue
+            os.remove(ruta)
+            print(f"[Bitácora] Recuperadas {len(entradas)} entradas de {nombre}")
+        close_old_connections()
+
+    def _insertar(self, entradas):
+        tamano_lote, _, _ = self._config()
+        objetos = [
+            Bitacora(
+                id=e['id'],
+                usuario_id=e['usuario_id'],
+                accion=e['accion'],
+                timestamp=parse_datetime(e['timestamp']) if isinstance(e['timestamp'], str) else e['timestamp'],
+                ip=e['ip'],
+                modulo=e['modulo'],
+                detalles=e['detalles'],
+                objeto_tipo=objeto_de(e['detalles'])[0],
+                objeto_id=objeto_de(e['detalles'])[1],
+            )
+            for e in entradas
+        ]
+        # ignore_conflicts: reinsertar un lote recuperado no duplica filas (el id ya viene fijado)
+        with escritura(objetos):
+            try:
+                with transaction.atomic():
+                    Bitacora.objects.bulk_create(objetos, batch_size=tamano_lote, ignore_conflicts=True)
+            except IntegrityError:
+                # Una fila inválida (ej. usuario eliminado) no debe tumbar todo el lote
+                insertados = []
+                for objeto in objetos:
+                    try:
+                        with transaction.atomic():
+                            Bitacora.objects.bulk_create([objeto], ignore_conflicts=True)
+                        insertados.append(objeto)
+                    except IntegrityError as e:
+                        print(f"[Bitácora] Entrada descartada ({objeto.accion}): {e}")
+                objetos = insertados
+            # Un lote recuperado tras una caída puede sumarse dos veces; resumir_bitacora lo corrige
+            registrar_en_resumen(objetos)
+
+
+# bitacora-<pid>[-<nonce>][-<n>].(jsonl|lote); sin nonce son archivos de versiones anteriores
+ARCHIVO_SPOOL = re.compile(r'^bitacora-(?P<pid>\d+)(?:-(?P<nonce>[0-9a-f]{8}))?(?:-\d+)?\.(?:jsonl|lote)$')
+
+
+def _proceso_vivo(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+buffer_bitacora = BufferBitacora()
@@ -0,0 +1,76 @@
+"""
+Diferencias por campo para las actualizaciones registradas en la bitácora.
+
+Se toma una instantánea de los campos concretos de la instancia antes y
+después de serializer.save(); ambas salen de la instancia en memoria, sin
+volver a consultar la base de datos.
+"""
+import copy
+import datetime
+import decimal
+import hashlib
+import uuid
+
+from django.conf import settings
+from django.db.models.fields.files import FieldFile
+
+# Nunca se copian a la bitácora
+CAMPOS_EXCLUIDOS = {'password', 'last_login'}
+
+
+def instantanea(instancia):
+    """Valores actuales de los campos concretos (las FK como su id)."""
+    valores = {}
+    for campo in instancia._meta.concrete_fields:
+        if campo.name in CAMPOS_EXCLUIDOS:
+            continue
+        valor = getattr(instancia, campo.attname)
+        if isinstance(valor, FieldFile):
+            valor = valor.name or None
+        elif isinstance(valor, (dict, list)):
+            # Los JSONField son mutables y el serializer podría modificarlos en sitio
+            valor = copy.deepcopy(valor)
+        valores[campo.name] = valor
+    return valores
+
+
+def _compactar(valor):
+    if isinstance(valor, (datetime.date, datetime.time)):
+        return valor.isoformat()
+    if isinstance(valor, (decimal.Decimal, uuid.UUID)):
+        return str(valor)
+    if isinstance(valor, (bytes, memoryview)):
+        valor = bytes(valor)
+        return {'sha256': hashlib.sha256(valor).hexdigest(), 'longitud': len(valor)}
+    if isinstance(valor, str):
+        maximo = getattr(settings, 'BITACORA_CAMBIOS_MAX_TEXTO', 200)
+        if len(valor) > maximo:
+            # Un extracto para leer y el hash para saber si dos versiones coinciden
+            return {
+                'extracto': valor[:maximo] + '…',
+                'sha256': hashlib.sha256(valor.encode('utf-8')).hexdigest(),
+                'longitud': len(valor),
+            }
+    return valor
+
+
+def diferencias(antes, despues):
+    """{campo: [anterior, nuevo]} solo con los campos que cambiaron."""
+    cambios = {}
+    for campo, nuevo in despues.items():
+        anterior = antes.get(campo)
+        if anterior != nuevo:
+            cambios[campo] = [_compactar(anterior), _compactar(nuevo)]
+    return cambios
+
+
+def identificar(instancia):
+    """Tipo ('app.modelo') e id del objeto, como quedan en Bitacora.objeto_tipo / objeto_id."""
+    return instancia._meta.label_lower, str(instancia.pk)
+
+
+def objeto_de(detalles):
+    """Extrae (objeto_tipo, objeto_id) de los detalles de una entrada, si los tiene."""
+    if not isinstance(detalles, dict):
+        return None, None
+    return detalles.get('objeto_tipo'), detalles.get('objeto_id')
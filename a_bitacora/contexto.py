@@ -0,0 +1,70 @@
+from contextvars import ContextVar
+
+_contexto_actual = ContextVar('contexto_bitacora', default=None)
+
+
+class ContextoBitacora:
+    """
+    Hechos de auditoría reunidos durante una petición.
+
+    BitacoraMiddleware abre el contexto con la ruta, el método y la IP; los
+    viewsets, decoradores y servicios le agregan acciones a través de
+    RegistroBitacora.registrar. Al terminar la petición se escribe una sola
+    entrada con todo lo reunido, o ninguna si la respuesta fue un error.
+    """
+
+    def __init__(self, metodo, ruta, ip):
+        self.metodo = metodo
+        self.ruta = ruta
+        self.ip = ip
+        self.vista = None
+        self.usuario = None
+        self.modulo = None
+        self.acciones = []
+        self.detalles = []
+
+    def agregar(self, accion, usuario=None, modulo=None, detalles=None):
+        if accion and accion not in self.acciones:
+            self.acciones.append(accion)
+        if self.usuario is None and getattr(usuario, 'is_authenticated', False):
+            self.usuario = usuario
+        if self.modulo is None and modulo:
+            self.modulo = modulo
+        if detalles:
+            self.detalles.append(detalles)
+
+    def entrada(self, usuario_peticion=None):
+        """Datos de la entrada a escribir, o None si no hay a quién atribuirla."""
+        usuario = self.usuario
+        if usuario is None and getattr(usuario_peticion, 'is_authenticated', False):
+            usuario = usuario_peticion
+        if usuario is None:
+            return None
+
+        detalles = {'metodo': self.metodo, 'ruta': self.ruta}
+        if self.vista:
+            detalles['vista'] = self.vista
+        if len(self.detalles) == 1 and isinstance(self.detalles[0], dict):
+            detalles.update(self.detalles[0])
+        elif self.detalles:
+            detalles['eventos'] = self.detalles
+
+        return {
+            'usuario': usuario,
+            'accion': '; '.join(self.acciones) or f"{self.metodo} en {self.ruta}",
+            'ip': self.ip,
+            'modulo': self.modulo,
+            'detalles': detalles,
+        }
+
+
+def obtener_contexto():
+    return _contexto_actual.get()
+
+
+def activar_contexto(contexto):
+    return _contexto_actual.set(contexto)
+
+
+def desactivar_contexto(token):
+    _contexto_actual.reset(token)
@@ -1,5 +1,5 @@
 from functools import wraps
-from .models import Bitacora
+from .utils import RegistroBitacora
 
 def registrar_accion(descripcion=None):
     def decorator(view_func):
@@ -19,7 +19,7 @@ def registrar_accion(descripcion=None):
                     else:
                         ip = request.META.get('REMOTE_ADDR')
 
-                    Bitacora.objects.create(
+                    RegistroBitacora.registrar(
                         usuario=request.user,
                         accion=accion_desc or f"{request.method} en {request.path}",
                         ip=ip
@@ -0,0 +1,22 @@
+import django_filters
+from .models import Bitacora, ResumenBitacora
+
+class BitacoraFilter(django_filters.FilterSet):
+    # Rango de fechas (inclusive); acepta fecha o fecha-hora ISO
+    desde = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='gte')
+    hasta = django_filters.IsoDateTimeFilter(field_name='timestamp', lookup_expr='lte')
+    # Entradas que cambiaron un campo; junto con objeto_tipo/objeto_id usa bitacora_objeto_ts_idx
+    campo = django_filters.CharFilter(field_name='detalles__cambios', lookup_expr='has_key')
+
+    class Meta:
+        model = Bitacora
+        fields = ['usuario', 'ip', 'modulo', 'timestamp', 'desde', 'hasta', 'objeto_tipo', 'objeto_id', 'campo']
+
+class ResumenBitacoraFilter(django_filters.FilterSet):
+    # El resumen es por hora: desde/hasta se aplican al inicio de cada hora
+    desde = django_filters.IsoDateTimeFilter(field_name='hora', lookup_expr='gte')
+    hasta = django_filters.IsoDateTimeFilter(field_name='hora', lookup_expr='lte')
+
+    class Meta:
+        model = ResumenBitacora
+        fields = ['usuario', 'modulo', 'desde', 'hasta']
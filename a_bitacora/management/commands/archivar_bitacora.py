@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from a_bitacora import archivo
+from a_bitacora.models import Bitacora
+from a_bitacora.particiones import es_particionada, particiones_existentes, rango_mes, eliminar_particion, nombre_particion
+from a_bitacora.reportes import iterar_bitacora
+
+
+class Command(BaseCommand):
+    help = 'Mueve al archivo comprimido (JSONL por mes) la bitácora más antigua que la retención'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses',
+            type=int,
+            default=getattr(settings, 'BITACORA_RETENCION_MESES', 12),
+            help='Meses completos que se mantienen en la tabla en vivo'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=2000,
+            help='Entradas leídas (y borradas) por lote'
+        )
+
+    def handle(self, *args, **options):
+        # Se archiva todo lo anterior al primer día del mes de corte
+        ahora = timezone.now()
+        anio, mes = ahora.year, ahora.month - options['meses']
+        while mes < 1:
+            anio, mes = anio - 1, mes + 12
+        corte, _ = rango_mes(anio, mes)
+        self.stdout.write(f'Archivando entradas anteriores a {corte:%Y-%m-%d}')
+
+        if es_particionada():
+            # Los meses con partición propia se archivan completos y se sueltan con DROP
+            for anio_p, mes_p in particiones_existentes():
+                inicio, fin = rango_mes(anio_p, mes_p)
+                if fin > corte:
+                    continue
+
+                queryset = Bitacora.objects.filter(timestamp__gte=inicio, timestamp__lt=fin)
+                esperadas = queryset.count()
+                escritas = sum(archivo.agregar(lote) for lote in self.lotes(queryset, options['lote']))
+                if escritas != esperadas:
+                    raise CommandError(
+                        f'{nombre_particion(anio_p, mes_p)}: se esperaban {esperadas} entradas y se archivaron {escritas}'
+                    )
+                eliminar_particion(anio_p, mes_p)
+                self.stdout.write(f'{nombre_particion(anio_p, mes_p)}: {escritas} entradas archivadas')
+
+        # Lo que quede (partición DEFAULT o tabla sin particionar) se archiva y borra por lotes
+        total = 0
+        for lote in self.lotes(Bitacora.objects.filter(timestamp__lt=corte), options['lote']):
+            archivo.agregar(lote)
+            Bitacora.objects.filter(id__in=[b.id for b in lote]).delete()
+            total += len(lote)
+        if total:
+            self.stdout.write(f'{total} entradas archivadas fuera de particiones')
+
+        # Si una corrida anterior se cortó antes de borrar, sus entradas se escribieron dos veces
+        for clave in archivo.recontar():
+            self.stdout.write(f'{clave}: total del índice recontado')
+
+        self.stdout.write(self.style.SUCCESS('Archivo de bitácora actualizado'))
+
+    def lotes(self, queryset, tamano):
+        lote = []
+        for b in iterar_bitacora(queryset, lote=tamano):
+            lote.append(b)
+            if len(lote) == tamano:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
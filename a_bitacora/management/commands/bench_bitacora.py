@@ -0,0 +1,96 @@
+import math
+import shutil
+import tempfile
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from a_usuarios.models import Usuario
+from a_especialidades.models import Especialidad
+from a_bitacora.buffer import buffer_bitacora
+
+
+class Command(BaseCommand):
+    help = 'Compara la latencia p50/p99 de un endpoint de escritura con la bitácora síncrona y con buffer'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--peticiones',
+            type=int,
+            default=200,
+            help='Número de peticiones medidas por modo'
+        )
+        parser.add_argument(
+            '--calentamiento',
+            type=int,
+            default=10,
+            help='Peticiones descartadas antes de medir'
+        )
+
+    def handle(self, *args, **options):
+        spool = tempfile.mkdtemp(prefix='bench-bitacora-')
+        try:
+            # Todo se revierte al final: ni el usuario, ni los formularios, ni la bitácora quedan en la base
+            with transaction.atomic():
+                self.comparar(options['peticiones'], options['calentamiento'], spool)
+                # Detenerlo aquí: el último vaciado también queda dentro de la transacción
+                buffer_bitacora.detener()
+                transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(spool, ignore_errors=True)
+
+    def comparar(self, peticiones, calentamiento, spool):
+        sufijo = uuid.uuid4().hex[:8]
+        usuario = Usuario.objects.create_user(
+            email=f'bench-{sufijo}@bench.local',
+            nombre='Bench',
+            apellido='Bitacora',
+            is_staff=True,
+        )
+        especialidad = Especialidad.objects.create(nombre=f'Bench {sufijo}', descripcion='')
+
+        cliente = APIClient()
+        cliente.force_authenticate(usuario)
+
+        # El hilo del buffer usa su propia conexión, fuera de la transacción: con lote e intervalo
+        # enormes no vacía solo, y el vaciar() de aquí inserta dentro de la transacción que se revierte
+        buffer = {'TAMANO_LOTE': 10 ** 9, 'INTERVALO': 10 ** 6, 'DIRECTORIO_SPOOL': spool}
+        for modo in ['sincrono', 'buffer']:
+            with override_settings(BITACORA_MODO=modo, BITACORA_BUFFER=buffer):
+                tiempos = self.medir(cliente, especialidad, peticiones, calentamiento)
+                if modo == 'buffer':
+                    buffer_bitacora.vaciar()
+            self.reportar(modo, tiempos)
+
+    def medir(self, cliente, especialidad, peticiones, calentamiento):
+        tiempos = []
+        for i in range(calentamiento + peticiones):
+            inicio = time.perf_counter()
+            respuesta = cliente.post(
+                '/api/historiales/formularios/',
+                {'nombre': f'Formulario bench {i}', 'especialidad': especialidad.id},
+                format='json',
+            )
+            transcurrido = time.perf_counter() - inicio
+            if respuesta.status_code != 201:
+                raise RuntimeError(f'Respuesta inesperada {respuesta.status_code}: {respuesta.content[:200]}')
+            if i >= calentamiento:
+                tiempos.append(transcurrido * 1000)
+        return tiempos
+
+    def reportar(self, modo, tiempos):
+        tiempos = sorted(tiempos)
+        self.stdout.write(
+            f'{modo:>9}: n={len(tiempos)} '
+            f'p50={percentil(tiempos, 50):.2f} ms '
+            f'p99={percentil(tiempos, 99):.2f} ms'
+        )
+
+
+def percentil(valores_ordenados, p):
+    indice = max(0, math.ceil(p / 100 * len(valores_ordenados)) - 1)
+    return valores_ordenados[indice]
@@ -0,0 +1,134 @@
+import random
+import statistics
+import time
+import uuid
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from a_usuarios.models import Usuario
+from a_bitacora.models import Bitacora
+from a_bitacora.pagination import BitacoraCursorPagination, filtro_keyset
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia de una página profunda de la bitácora con OFFSET y con cursor a distintos tamaños de tabla'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--filas',
+            default='10000,100000,1000000',
+            help='Tamaños de tabla a medir, separados por coma'
+        )
+        parser.add_argument(
+            '--pagina',
+            type=int,
+            default=1000,
+            help='Página a medir'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=5,
+            help='Mediciones por caso (se reporta la mediana)'
+        )
+        parser.add_argument(
+            '--explicar',
+            action='store_true',
+            help='Mostrar el plan (EXPLAIN ANALYZE) de la consulta con cursor en el tamaño mayor'
+        )
+
+    def handle(self, *args, **options):
+        tamanos = sorted(int(n) for n in options['filas'].split(','))
+        self.factory = APIRequestFactory()
+
+        # Todo se hace dentro de una transacción que se revierte al final
+        with transaction.atomic():
+            usuarios = [
+                Usuario.objects.create_user(
+                    email=f'bench-{uuid.uuid4().hex[:8]}@bench.local',
+                    nombre='Bench',
+                    apellido=str(i),
+                )
+                for i in range(5)
+            ]
+
+            actuales = 0
+            for tamano in tamanos:
+                self.poblar(usuarios, tamano - actuales)
+                actuales = tamano
+
+                offset_ms = self.medir_offset(options['pagina'], options['repeticiones'])
+                cursor_ms = self.medir_cursor(options['pagina'], options['repeticiones'])
+                self.stdout.write(
+                    f'filas={tamano:>9} pagina={options["pagina"]} '
+                    f'offset={offset_ms:8.2f} ms  cursor={cursor_ms:8.2f} ms'
+                )
+
+            if options['explicar']:
+                # En PostgreSQL el cursor debe ser un Index Cond del índice (timestamp, id), no un Filter
+                self.stdout.write(self.consulta_cursor(options['pagina']).explain(analyze=True))
+
+            transaction.set_rollback(True)
+
+    def poblar(self, usuarios, cantidad, lote=5000):
+        ahora = timezone.now()
+        modulos = ['pacientes', 'usuario', 'especialidad', 'General', 'Autenticación']
+        while cantidad > 0:
+            n = min(lote, cantidad)
+            Bitacora.objects.bulk_create([
+                Bitacora(
+                    usuario=random.choice(usuarios),
+                    accion='Bench',
+                    timestamp=ahora - timedelta(seconds=random.randint(0, 2 * 365 * 24 * 3600)),
+                    ip='127.0.0.1',
+                    modulo=random.choice(modulos),
+                )
+                for _ in range(n)
+            ])
+            cantidad -= n
+
+    def peticion(self, **params):
+        return Request(self.factory.get('/api/bitacora/', params))
+
+    def medir_offset(self, pagina, repeticiones):
+        paginador = PageNumberPagination()
+        paginador.page_size = 10
+        queryset = Bitacora.objects.all().order_by('-timestamp')
+        request = self.peticion(page=pagina)
+
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            list(paginador.paginate_queryset(queryset, request))
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
+
+    def cursor(self, pagina):
+        # Un cliente real llega a la página N con el cursor de la N-1; aquí se
+        # construye ese cursor directamente (sin medirlo)
+        paginador = BitacoraCursorPagination()
+        paginador.page_size = 10
+        ultima = Bitacora.objects.order_by('-timestamp', '-id')[(pagina - 1) * 10 - 1]
+        paginador.orden = '-timestamp'
+        return paginador, self.peticion(cursor=paginador.codificar_cursor([ultima.timestamp, ultima.id]))
+
+    def consulta_cursor(self, pagina):
+        paginador, request = self.cursor(pagina)
+        valores = paginador.decodificar_cursor(request)
+        return (Bitacora.objects.order_by('-timestamp', '-id')
+                .filter(filtro_keyset(['timestamp', 'id'], valores))[:paginador.page_size + 1])
+
+    def medir_cursor(self, pagina, repeticiones):
+        paginador, request = self.cursor(pagina)
+        tiempos = []
+        for _ in range(repeticiones):
+            inicio = time.perf_counter()
+            paginador.paginate_queryset(Bitacora.objects.all(), request)
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+        return statistics.median(tiempos)
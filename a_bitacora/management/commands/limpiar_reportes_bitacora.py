@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from a_bitacora.reportes import limpiar_reportes
+
+
+class Command(BaseCommand):
+    help = 'Marca como fallidos los reportes PDF de bitácora abandonados y borra sus archivos .part'
+
+    def handle(self, *args, **options):
+        total = limpiar_reportes()
+        self.stdout.write(self.style.SUCCESS(f'{total} reportes abandonados'))
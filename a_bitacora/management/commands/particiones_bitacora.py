@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from a_bitacora.particiones import es_particionada, crear_particion, mes_siguiente, nombre_particion
+
+
+class Command(BaseCommand):
+    help = 'Crea por adelantado las particiones mensuales de la bitácora (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--meses-adelante',
+            type=int,
+            default=3,
+            help='Cuántos meses después del actual deben tener partición'
+        )
+
+    def handle(self, *args, **options):
+        if not es_particionada():
+            self.stdout.write(self.style.WARNING('La tabla de bitácora no está particionada; no hay nada que hacer'))
+            return
+
+        # Si una fila cae en DEFAULT para un mes sin partición, ya no se puede crear esa partición,
+        # por eso este comando debe correr (ej. por cron) antes de que empiece cada mes
+        ahora = timezone.now()
+        anio, mes = ahora.year, ahora.month
+        for _ in range(options['meses_adelante'] + 1):
+            crear_particion(anio, mes)
+            self.stdout.write(f'Partición lista: {nombre_particion(anio, mes)}')
+            anio, mes = mes_siguiente(anio, mes)
@@ -0,0 +1,55 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from a_bitacora.retencion import purgar
+
+
+class Command(BaseCommand):
+    help = 'Borra o archiva por lotes la bitácora vencida de cada módulo (BITACORA_PURGA); se puede retomar'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lote',
+            type=int,
+            help='Entradas por lote (por defecto BITACORA_PURGA["LOTE"])'
+        )
+        parser.add_argument(
+            '--pausa',
+            type=float,
+            help='Segundos de pausa entre lotes (por defecto BITACORA_PURGA["PAUSA"])'
+        )
+        parser.add_argument(
+            '--modulo',
+            action='append',
+            dest='modulos',
+            help='Purgar solo este módulo (se puede repetir; "*" para los que no tienen política propia)'
+        )
+        parser.add_argument(
+            '--reiniciar',
+            action='store_true',
+            help='Ignorar el avance de una corrida interrumpida y calcular el corte de nuevo'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo contar lo que se purgaría'
+        )
+
+    def handle(self, *args, **options):
+        if options['lote'] is not None and options['lote'] < 1:
+            raise CommandError('--lote debe ser al menos 1')
+
+        try:
+            resultado = purgar(
+                lote=options['lote'],
+                pausa=options['pausa'],
+                modulos=options['modulos'],
+                reiniciar=options['reiniciar'],
+                simular=options['simular'],
+                progreso=self.stdout.write,
+            )
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        total = sum(resultado.values())
+        verbo = 'se purgarían' if options['simular'] else 'purgadas'
+        self.stdout.write(self.style.SUCCESS(f'{total} entradas {verbo}'))
@@ -0,0 +1,96 @@
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils.dateparse import parse_date
+
+from a_bitacora import archivo
+from a_bitacora.models import Bitacora
+from a_bitacora.particiones import mes_siguiente
+from a_bitacora.resumen import reconstruir, truncar_hora
+from a_usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye ResumenBitacora desde la tabla de bitácora, por tramos de días'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--desde',
+            help='Fecha inicial AAAA-MM-DD (por defecto, la entrada más antigua)'
+        )
+        parser.add_argument(
+            '--hasta',
+            help='Fecha final AAAA-MM-DD, inclusive (por defecto, la entrada más reciente)'
+        )
+        parser.add_argument(
+            '--dias',
+            type=int,
+            default=1,
+            help='Días por tramo; cada tramo se reemplaza en su propia transacción'
+        )
+        parser.add_argument(
+            '--archivo',
+            action='store_true',
+            help='Incluir también los meses que ya solo están en el archivo'
+        )
+
+    def handle(self, *args, **options):
+        if options['dias'] < 1:
+            raise CommandError('--dias debe ser al menos 1')
+
+        if options['archivo']:
+            self.resumir_archivo()
+
+        rango = Bitacora.objects.aggregate(minimo=Min('timestamp'), maximo=Max('timestamp'))
+        if rango['minimo'] is None:
+            self.stdout.write('No hay entradas en la bitácora')
+            return
+
+        inicio = self.fecha(options['desde']) or self.dia(rango['minimo'])
+        fin = self.fecha(options['hasta'], siguiente=True) or self.dia(rango['maximo']) + timedelta(days=1)
+        if options['archivo'] and archivo.limite():
+            inicio = max(inicio, archivo.limite())
+
+        paso = timedelta(days=options['dias'])
+        total = 0
+        while inicio < fin:
+            tramo_fin = min(inicio + paso, fin)
+            entradas = reconstruir(inicio, tramo_fin)
+            total += entradas
+            self.stdout.write(f'{inicio:%Y-%m-%d} .. {tramo_fin:%Y-%m-%d}: {entradas} entradas')
+            inicio = tramo_fin
+
+        self.stdout.write(self.style.SUCCESS(f'Resumen reconstruido: {total} entradas'))
+
+    def resumir_archivo(self):
+        # Los meses archivados se recalculan completos: archivo + lo que quede en la tabla.
+        # Las entradas de usuarios ya eliminados no entran al resumen (igual que en la tabla)
+        usuarios = set(Usuario.objects.values_list('id', flat=True))
+        for clave in sorted(archivo.leer_indice()):
+            anio, mes = (int(p) for p in clave.split('-'))
+            inicio = datetime(anio, mes, 1, tzinfo=dt_timezone.utc)
+            fin = datetime(*mes_siguiente(anio, mes), 1, tzinfo=dt_timezone.utc)
+
+            conteos = Counter(
+                (truncar_hora(f['timestamp']), f['modulo'] or '', f['usuario'])
+                for f in archivo.leer(desde=inicio, hasta=fin)
+                if f['timestamp'] < fin and f['usuario'] in usuarios
+            )
+            entradas = reconstruir(inicio, fin, extra=conteos)
+            self.stdout.write(f'{clave} (archivo): {entradas} entradas')
+
+    def fecha(self, valor, siguiente=False):
+        if not valor:
+            return None
+        dia = parse_date(valor)
+        if dia is None:
+            raise CommandError(f'Fecha inválida: {valor}')
+        momento = datetime(dia.year, dia.month, dia.day, tzinfo=dt_timezone.utc)
+        return momento + timedelta(days=1) if siguiente else momento
+
+    def dia(self, momento):
+        momento = momento.astimezone(dt_timezone.utc)
+        return datetime(momento.year, momento.month, momento.day, tzinfo=dt_timezone.utc)
+
@@ -1,44 +1,69 @@
-from .models import Bitacora
+from .utils import RegistroBitacora
+from .contexto import ContextoBitacora, activar_contexto, desactivar_contexto
+from .reglas import ReglasBitacora, agregador_bitacora
 from django.conf import settings
-import re
 
 class BitacoraMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
-        self.EXEMPT_URLS = [
-            re.compile(settings.STATIC_URL),
-            re.compile(r'^/admin/'),
-        ]
+        # Se compilan una vez al arrancar; ver a_bitacora/reglas.py
+        self.reglas = ReglasBitacora(getattr(settings, 'BITACORA_REGLAS', []))
         self.METHODS_TO_LOG = ['POST', 'PUT', 'PATCH', 'DELETE']
 
     def __call__(self, request):
-        response = self.get_response(request)
-        return response
+        path = request.path_info
+        x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
+        ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
 
-    def process_view(self, request, view_func, view_args, view_kwargs):
-        if not request.user.is_authenticated:
-            return None
+        # El usuario de la sesión (sin evaluar); si DRF autentica por JWT lo reemplaza por otro objeto
+        usuario_sesion = getattr(request, 'user', None)
 
-        path = request.path_info
-        if any(m.match(path) for m in self.EXEMPT_URLS):
-            return None
+        contexto = ContextoBitacora(request.method, path, ip)
+        token = activar_contexto(contexto)
+        try:
+            response = self.get_response(request)
+        finally:
+            desactivar_contexto(token)
 
-        if request.method not in self.METHODS_TO_LOG:
-            return None
+        # Cierra el minuto anterior de las reglas 'agregar', si ya pasó
+        agregador_bitacora.vaciar()
+
+        # Peticiones fallidas no dejan rastro
+        if response.status_code >= 400:
+            return response
+
+        indice, regla = self.reglas.buscar(request.method, contexto.modulo, path)
+        accion = regla['accion'] if regla else None
+        if accion == 'omitir':
+            return response
+        # Sin regla: las de lectura solo si alguna capa registró algo
+        if accion is None and request.method not in self.METHODS_TO_LOG and not contexto.acciones:
+            return response
+        # Ver BITACORA_REGISTRAR_JWT
+        if (accion is None and not contexto.acciones and not getattr(settings, 'BITACORA_REGISTRAR_JWT', True)
+                and getattr(request, 'user', None) is not usuario_sesion):
+            return response
 
         try:
-            usuario = request.user
-            accion = f"{request.method} en {path}"
+            resolver_match = getattr(request, 'resolver_match', None)
+            if resolver_match is not None:
+                contexto.vista = resolver_match.view_name
 
-            x_forwarded_for = request.META.get('HTTP_X_FORWARDED_FOR')
-            ip = x_forwarded_for.split(',')[0] if x_forwarded_for else request.META.get('REMOTE_ADDR')
+            # DRF deja en request.user al usuario autenticado por JWT
+            entrada = contexto.entrada(getattr(request, 'user', None))
+            if entrada is None:
+                return response
 
-            Bitacora.objects.create(
-                usuario=usuario,
-                accion=accion,
-                ip=ip
-            )
+            if accion == 'muestrear':
+                if not self.reglas.muestrear(regla):
+                    return response
+                entrada['detalles']['muestreo'] = regla['n']
+            elif accion == 'agregar':
+                agregador_bitacora.sumar(indice, entrada, contexto.vista)
+                return response
+
+            RegistroBitacora.escribir(**entrada)
         except Exception as e:
             print(f"Error al registrar en bitácora: {e}")
 
-        return None
+        return response
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:24
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_bitacora', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['timestamp', 'id'], name='bitacora_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['usuario', 'timestamp', 'id'], name='bitacora_usuario_ts_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['modulo', 'timestamp', 'id'], name='bitacora_modulo_ts_id_idx'),
+        ),
+    ]
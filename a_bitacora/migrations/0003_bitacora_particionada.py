@@ -0,0 +1,103 @@
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import migrations
+
+# En PostgreSQL la tabla real deja de coincidir con el estado de migraciones de Django:
+# - la clave primaria es (id, "timestamp") y no solo id (una tabla particionada no admite
+#   una PK que no incluya la columna de partición);
+# - la FK a usuario y su índice llevan los nombres de INDICES, no los que genera Django.
+# El estado no cambia (SeparateDatabaseAndState sin state_operations), así que Django sigue
+# creyendo que id es la única PK. Cualquier migración posterior que toque la PK, la FK a
+# usuario, agregue una restricción UNIQUE sin "timestamp" o una FK que apunte a Bitacora
+# debe escribirse a mano con RunSQL dentro de SeparateDatabaseAndState; AddIndex y AddField
+# simples (como 0005) sí funcionan sobre la tabla particionada.
+
+TABLA = 'a_bitacora_bitacora'
+
+# Índices que Django conoce por nombre (0002) más el de la FK a usuario
+INDICES = [
+    ('bitacora_ts_id_idx', '"timestamp", id'),
+    ('bitacora_usuario_ts_id_idx', 'usuario_id, "timestamp", id'),
+    ('bitacora_modulo_ts_id_idx', 'modulo, "timestamp", id'),
+    (f'{TABLA}_usuario_id_idx', 'usuario_id'),
+]
+
+
+def _siguiente(anio, mes):
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def _meses(desde, hasta):
+    anio, mes = desde.year, desde.month
+    while (anio, mes) <= (hasta.year, hasta.month):
+        yield anio, mes
+        anio, mes = _siguiente(anio, mes)
+
+
+def _crear_indices(cursor):
+    cursor.execute(f'ALTER TABLE {TABLA} ADD CONSTRAINT {TABLA}_usuario_id_fk '
+                   f'FOREIGN KEY (usuario_id) REFERENCES a_usuarios_usuario (id) DEFERRABLE INITIALLY DEFERRED')
+    for nombre, columnas in INDICES:
+        cursor.execute(f'CREATE INDEX {nombre} ON {TABLA} ({columnas})')
+
+
+def particionar(apps, schema_editor):
+    # Solo PostgreSQL tiene particiones declarativas. En SQLite (desarrollo y tests) la tabla
+    # queda como la creó 0001/0002: es_particionada() es False y archivar_bitacora y la purga
+    # usan el camino por lotes con DELETE, que funciona igual en los dos motores.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE {TABLA} RENAME TO {TABLA}_previa')
+        cursor.execute(f'CREATE TABLE {TABLA} (LIKE {TABLA}_previa INCLUDING DEFAULTS) PARTITION BY RANGE ("timestamp")')
+        cursor.execute(f'CREATE TABLE {TABLA}_default PARTITION OF {TABLA} DEFAULT')
+
+        # Una partición por mes desde la entrada más antigua hasta tres meses adelante
+        ahora = datetime.now(dt_timezone.utc)
+        cursor.execute(f'SELECT min("timestamp") FROM {TABLA}_previa')
+        minimo = cursor.fetchone()[0] or ahora
+        fin = (ahora.year, ahora.month)
+        for _ in range(3):
+            fin = _siguiente(*fin)
+        for anio, mes in _meses(minimo, datetime(*fin, 1)):
+            cursor.execute(
+                f'CREATE TABLE {TABLA}_{anio:04d}{mes:02d} PARTITION OF {TABLA} FOR VALUES FROM (%s) TO (%s)',
+                [datetime(anio, mes, 1, tzinfo=dt_timezone.utc),
+                 datetime(*_siguiente(anio, mes), 1, tzinfo=dt_timezone.utc)],
+            )
+
+        cursor.execute(f'INSERT INTO {TABLA} SELECT * FROM {TABLA}_previa')
+        cursor.execute(f'DROP TABLE {TABLA}_previa')
+
+        # La clave primaria de una tabla particionada debe incluir la columna de partición
+        cursor.execute(f'ALTER TABLE {TABLA} ADD PRIMARY KEY (id, "timestamp")')
+        _crear_indices(cursor)
+
+
+def desparticionar(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'CREATE TABLE {TABLA}_previa (LIKE {TABLA} INCLUDING DEFAULTS)')
+        cursor.execute(f'INSERT INTO {TABLA}_previa SELECT * FROM {TABLA}')
+        cursor.execute(f'DROP TABLE {TABLA} CASCADE')
+        cursor.execute(f'ALTER TABLE {TABLA}_previa RENAME TO {TABLA}')
+        cursor.execute(f'ALTER TABLE {TABLA} ADD PRIMARY KEY (id)')
+        _crear_indices(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_bitacora', '0002_bitacora_indices_keyset'),
+        ('a_usuarios', '0004_usuario_rol'),
+    ]
+
+    operations = [
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(particionar, desparticionar)],
+            state_operations=[],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:31
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_bitacora', '0003_bitacora_particionada'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ResumenBitacora',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('hora', models.DateTimeField()),
+                ('modulo', models.CharField(blank=True, default='', max_length=100)),
+                ('total', models.PositiveIntegerField(default=0)),
+                ('usuario', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='resumen_bitacora', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Resumen de bitacora',
+                'verbose_name_plural': 'Resumenes de bitacora',
+                'ordering': ['-hora'],
+                'constraints': [models.UniqueConstraint(fields=('hora', 'modulo', 'usuario'), name='resumen_bitacora_unico')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_bitacora', '0004_resumenbitacora'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bitacora',
+            name='objeto_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='bitacora',
+            name='objeto_tipo',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['objeto_tipo', 'objeto_id', 'timestamp'], name='bitacora_objeto_ts_idx'),
+        ),
+    ]
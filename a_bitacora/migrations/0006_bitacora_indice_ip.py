@@ -0,0 +1,19 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:55
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_bitacora', '0005_bitacora_objeto'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bitacora',
+            index=models.Index(fields=['ip', 'timestamp', 'id'], name='bitacora_ip_ts_id_idx'),
+        ),
+    ]
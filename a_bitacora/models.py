@@ -4,6 +4,9 @@ from a_usuarios.models import Usuario
 import uuid
 
 class Bitacora(models.Model):
+    # En PostgreSQL la tabla está particionada por mes (migración 0003) y su PK real es
+    # (id, timestamp), aunque aquí id figure como única PK. Ver la nota de 0003 antes de
+    # escribir migraciones que cambien la PK, la FK a usuario o agreguen UNIQUE/FK hacia aquí.
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='acciones_bitacora')
     accion = models.TextField()
@@ -13,10 +16,42 @@ class Bitacora(models.Model):
     modulo = models.CharField(max_length=100, blank=True, null=True)
     detalles = models.JSONField(null=True, blank=True)
 
+    # Objeto afectado ('app.modelo' y pk), para consultar la historia de un objeto
+    objeto_tipo = models.CharField(max_length=100, blank=True, null=True)
+    objeto_id = models.CharField(max_length=64, blank=True, null=True)
+
     class Meta:
         ordering = ['-timestamp']
         verbose_name = 'Entrada de bitacora'
         verbose_name_plural = 'Entradas de bitacora'
+        # Claves de BitacoraCursorPagination; terminan en (timestamp, id) para desempatar
+        indexes = [
+            models.Index(fields=['timestamp', 'id'], name='bitacora_ts_id_idx'),
+            models.Index(fields=['usuario', 'timestamp', 'id'], name='bitacora_usuario_ts_id_idx'),
+            models.Index(fields=['modulo', 'timestamp', 'id'], name='bitacora_modulo_ts_id_idx'),
+            models.Index(fields=['ip', 'timestamp', 'id'], name='bitacora_ip_ts_id_idx'),
+            models.Index(fields=['objeto_tipo', 'objeto_id', 'timestamp'], name='bitacora_objeto_ts_idx'),
+        ]
 
     def __str__(self):
         return f"{self.timestamp} - {self.usuario.email} - {self.accion}"
+
+
+class ResumenBitacora(models.Model):
+    """Cantidad de entradas de bitácora por hora (UTC), módulo y usuario."""
+    hora = models.DateTimeField()
+    # Sin módulo se guarda '' para que la restricción única también lo cubra
+    modulo = models.CharField(max_length=100, blank=True, default='')
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE, related_name='resumen_bitacora')
+    total = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['-hora']
+        verbose_name = 'Resumen de bitacora'
+        verbose_name_plural = 'Resumenes de bitacora'
+        constraints = [
+            models.UniqueConstraint(fields=['hora', 'modulo', 'usuario'], name='resumen_bitacora_unico'),
+        ]
+
+    def __str__(self):
+        return f"{self.hora} - {self.modulo or 'General'} - {self.usuario_id}: {self.total}"
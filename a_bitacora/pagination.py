@@ -0,0 +1,140 @@
+import base64
+import json
+
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+# tuple_lookups es un módulo interno de Django (5.2); si cambia o no existe se
+# usa la condición expandida, que da el mismo resultado aunque sin límite de rango
+try:
+    from django.db.models.fields.tuple_lookups import Tuple, TupleGreaterThan, TupleLessThan
+except ImportError:
+    Tuple = None
+
+
+def filtro_keyset(campos, valores, descendente=True):
+    """
+    Condición que deja solo las filas que van después de `valores` en el orden de `campos`.
+
+    Se compara como fila: (a, b, c) < (x, y, z). Así PostgreSQL la usa como
+    límite de rango del índice compuesto y empieza a leer justo después del
+    cursor. Con a < x OR (a = x AND b < y) ... no puede: recorre el índice
+    desde el principio y descarta fila por fila, y las páginas profundas
+    vuelven a costar como un OFFSET.
+
+    Si Django no trae tuple_lookups se arma esa forma expandida igual.
+    """
+    if Tuple is None:
+        return filtro_keyset_expandido(campos, valores, descendente)
+    lookup = TupleLessThan if descendente else TupleGreaterThan
+    return lookup(Tuple(*[F(c) for c in campos]), list(valores))
+
+
+def filtro_keyset_expandido(campos, valores, descendente=True):
+    """(a < x) OR (a = x AND b < y) OR (a = x AND b = y AND c < z) ..."""
+    comparar = 'lt' if descendente else 'gt'
+    condicion = Q()
+    iguales = {}
+    for campo, valor in zip(campos, valores):
+        condicion |= Q(**iguales, **{f'{campo}__{comparar}': valor})
+        iguales[campo] = valor
+    return condicion
+
+
+class BitacoraCursorPagination(BasePagination):
+    """
+    Paginación por clave (keyset) para la bitácora.
+
+    En vez de COUNT(*) + OFFSET, cada página pide las filas que siguen a la
+    última de la página anterior, así que la página 1000 cuesta lo mismo que
+    la primera. La clave siempre termina en (timestamp, id) y la recorre uno
+    de los índices compuestos de Bitacora. Solo se navega hacia adelante.
+    """
+    page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_query_param = 'ordering'
+
+    # valor de ?ordering= -> columnas de la clave
+    claves = {
+        '-timestamp': ['timestamp', 'id'],
+        'timestamp': ['timestamp', 'id'],
+        '-usuario': ['usuario_id', 'timestamp', 'id'],
+        'usuario': ['usuario_id', 'timestamp', 'id'],
+    }
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.orden = request.query_params.get(self.ordering_query_param) or '-timestamp'
+        if self.orden not in self.claves:
+            raise ValidationError({'ordering': f"Orden no soportado con cursor: {self.orden}"})
+
+        campos = self.claves[self.orden]
+        descendente = self.orden.startswith('-')
+        queryset = queryset.order_by(*[f"{'-' if descendente else ''}{c}" for c in campos])
+
+        valores = self.decodificar_cursor(request)
+        if valores is not None:
+            queryset = queryset.filter(filtro_keyset(campos, valores, descendente))
+
+        page_size = self.get_page_size(request)
+        filas = list(queryset[:page_size + 1])
+        self.siguiente = None
+        if len(filas) > page_size:
+            filas = filas[:page_size]
+            self.siguiente = [getattr(filas[-1], c) for c in campos]
+        return filas
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(page_size, self.max_page_size))
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if self.siguiente is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, 'page')
+        return replace_query_param(url, self.cursor_query_param, self.codificar_cursor(self.siguiente))
+
+    def codificar_cursor(self, valores):
+        crudo = json.dumps([self.orden, [str(v) for v in valores]])
+        return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+    def decodificar_cursor(self, request):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            orden, valores = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        except (ValueError, TypeError):
+            raise ValidationError({'cursor': "Cursor inválido"})
+        if orden != self.orden or len(valores) != len(self.claves[orden]):
+            raise ValidationError({'cursor': "El cursor no corresponde al orden pedido"})
+
+        # timestamp viene como texto ISO; el resto se compara tal cual
+        campos = self.claves[orden]
+        return [parse_datetime(v) if c == 'timestamp' else v for c, v in zip(campos, valores)]
@@ -0,0 +1,77 @@
+"""
+Particiones mensuales de la tabla de bitácora (solo PostgreSQL).
+
+La migración 0003 convierte a_bitacora_bitacora en una tabla particionada por
+RANGE("timestamp") con una partición por mes (a_bitacora_bitacora_AAAAMM) y
+una partición DEFAULT para lo que caiga fuera. En otros motores la tabla queda
+como siempre y estas funciones no hacen nada.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection
+
+from .models import Bitacora
+
+TABLA = Bitacora._meta.db_table
+
+
+def es_particionada():
+    if connection.vendor != 'postgresql':
+        return False
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid WHERE c.relname = %s",
+            [TABLA],
+        )
+        return cursor.fetchone() is not None
+
+
+def mes_siguiente(anio, mes):
+    return (anio + 1, 1) if mes == 12 else (anio, mes + 1)
+
+
+def rango_mes(anio, mes):
+    inicio = datetime(anio, mes, 1, tzinfo=dt_timezone.utc)
+    fin = datetime(*mes_siguiente(anio, mes), 1, tzinfo=dt_timezone.utc)
+    return inicio, fin
+
+
+def nombre_particion(anio, mes):
+    return f"{TABLA}_{anio:04d}{mes:02d}"
+
+
+def particiones_existentes():
+    """Lista ordenada de (anio, mes) con partición propia."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [TABLA],
+        )
+        nombres = [fila[0] for fila in cursor.fetchall()]
+
+    meses = []
+    for nombre in nombres:
+        sufijo = nombre[len(TABLA) + 1:]
+        if len(sufijo) == 6 and sufijo.isdigit():
+            meses.append((int(sufijo[:4]), int(sufijo[4:])))
+    return sorted(meses)
+
+
+def crear_particion(anio, mes):
+    inicio, fin = rango_mes(anio, mes)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE TABLE IF NOT EXISTS "{nombre_particion(anio, mes)}" '
+            f'PARTITION OF "{TABLA}" FOR VALUES FROM (%s) TO (%s)',
+            [inicio, fin],
+        )
+
+
+def eliminar_particion(anio, mes):
+    nombre = nombre_particion(anio, mes)
+    with connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE "{TABLA}" DETACH PARTITION "{nombre}"')
+        cursor.execute(f'DROP TABLE "{nombre}"')
@@ -0,0 +1,209 @@
+"""
+Reglas de auditoría por ruta, método y módulo (BITACORA_REGLAS).
+
+Cada regla dice qué hacer con las peticiones que cumple:
+
+- 'registrar': una entrada por petición (igual que sin reglas)
+- 'omitir': ninguna entrada
+- 'muestrear': una de cada 'n' peticiones; la entrada lleva detalles['muestreo'] = n
+- 'agregar': una entrada por minuto con el total de peticiones (por usuario y vista)
+
+Las reglas se compilan una sola vez en una expresión regular con un grupo por
+regla, aplicada a "MÉTODO\\x00módulo\\x00ruta"; gana la primera que coincide.
+Si ninguna coincide se usa el comportamiento de siempre. Como todas comparten
+una expresión, la ruta de una regla no puede tener grupos con nombre ni
+referencias a grupos (\\1, (?P=...)): chocarían con los de las otras reglas.
+Por lo mismo ^ y $ solo pueden ir al comienzo y al final de la ruta.
+
+Los grupos de 'agregar' se escriben al pasar el minuto: en la siguiente
+petición o, si no llega ninguna, desde un temporizador. Lo que quede se
+escribe al salir; si el proceso muere sin salir se pierde a lo sumo el minuto
+en curso.
+"""
+import atexit
+import itertools
+import re
+import threading
+
+from django.db import connection
+from django.utils import timezone
+
+from .utils import RegistroBitacora
+
+ACCIONES = ('registrar', 'omitir', 'muestrear', 'agregar')
+
+# \1 a \9 sin escapar, o (?P=nombre)
+REFERENCIA = re.compile(r'(?<!\\)(?:\\\\)*\\[1-9]|\(\?P=')
+
+
+def _anclas(ruta):
+    """Posiciones de ^ y $ sin escapar y fuera de clases de caracteres [...]."""
+    posiciones = []
+    i, en_clase = 0, False
+    while i < len(ruta):
+        c = ruta[i]
+        if c == '\\':
+            i += 2
+            continue
+        if en_clase:
+            en_clase = c != ']'
+        elif c == '[':
+            en_clase = True
+            # Un ] justo al abrir (o tras ^) es literal
+            if ruta[i + 1:i + 2] == '^':
+                i += 1
+            if ruta[i + 1:i + 2] == ']':
+                i += 1
+        elif c in '^$':
+            posiciones.append((i, c))
+        i += 1
+    return posiciones
+
+
+def validar_ruta(i, ruta):
+    """Ruta de la regla i lista para ir dentro de la expresión combinada, o ValueError."""
+    try:
+        compilada = re.compile(ruta)
+    except re.error as e:
+        raise ValueError(f"BITACORA_REGLAS[{i}]: ruta inválida '{ruta}': {e}")
+    if compilada.groupindex:
+        raise ValueError(f"BITACORA_REGLAS[{i}]: la ruta no puede tener grupos con nombre")
+    if REFERENCIA.search(ruta):
+        raise ValueError(f"BITACORA_REGLAS[{i}]: la ruta no puede tener referencias a grupos")
+    # Dentro de la expresión combinada un ^ que no sea el primero nunca coincide (p. ej.
+    # '^/a|^/b'), y un $ en medio tampoco; se pide agrupar: '^(?:/a|/b)$'
+    for posicion, ancla in _anclas(ruta):
+        if (ancla == '^' and posicion != 0) or (ancla == '$' and posicion != len(ruta) - 1):
+            raise ValueError(
+                f"BITACORA_REGLAS[{i}]: '{ancla}' solo puede ir al "
+                f"{'comienzo' if ancla == '^' else 'final'} de la ruta '{ruta}'; "
+                f"para alternativas use ^(?:/a|/b)$"
+            )
+    return ruta[1:] if ruta.startswith('^') else ruta
+
+
+class ReglasBitacora:
+
+    def __init__(self, reglas):
+        self.reglas = []
+        fragmentos = []
+        for i, regla in enumerate(reglas):
+            accion = regla.get('accion', 'registrar')
+            if accion not in ACCIONES:
+                raise ValueError(f"BITACORA_REGLAS[{i}]: acción desconocida '{accion}'")
+            if accion == 'muestrear' and int(regla.get('n', 0)) < 1:
+                raise ValueError(f"BITACORA_REGLAS[{i}]: 'muestrear' necesita 'n' >= 1")
+
+            metodos = regla.get('metodos')
+            modulos = regla.get('modulos')
+            ruta = validar_ruta(i, regla.get('ruta', '.*'))
+            partes = [
+                '(?:' + '|'.join(re.escape(m.upper()) for m in metodos) + ')' if metodos else '[A-Z]+',
+                '(?:' + '|'.join(re.escape(m) for m in modulos) + ')' if modulos else '[^\\x00]*',
+                '(?:' + ruta + ')',
+            ]
+            fragmento = f"(?P<r{i}>" + '\\x00'.join(partes) + ')'
+            try:
+                # Por ejemplo, banderas como (?i) solo valen al comienzo de la expresión
+                re.compile(fragmento)
+            except re.error as e:
+                raise ValueError(f"BITACORA_REGLAS[{i}]: la ruta no se puede combinar con las demás: {e}")
+            fragmentos.append(fragmento)
+            self.reglas.append({**regla, 'accion': accion, 'contador': itertools.count()})
+
+        self.patron = re.compile('|'.join(fragmentos)) if fragmentos else None
+
+    def buscar(self, metodo, modulo, ruta):
+        """Índice y regla que se aplican a la petición, o (None, None) si ninguna."""
+        if self.patron is None:
+            return None, None
+        coincidencia = self.patron.match(f"{metodo}\x00{modulo or ''}\x00{ruta}")
+        if coincidencia is None:
+            return None, None
+        indice = int(coincidencia.lastgroup[1:])
+        return indice, self.reglas[indice]
+
+    def muestrear(self, regla):
+        # itertools.count es atómico bajo el GIL
+        return next(regla['contador']) % int(regla['n']) == 0
+
+
+class AgregadorBitacora:
+    """Cuenta las peticiones de reglas 'agregar' y escribe una entrada por minuto y grupo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._minuto = None
+        self._grupos = {}
+        self._temporizador = None
+        atexit.register(self.vaciar, forzar=True)
+
+    def sumar(self, indice, entrada, vista):
+        # Primero se cierra el minuto anterior, si lo hay, para no mezclarlo con este
+        self.vaciar()
+        minuto = timezone.now().replace(second=0, microsecond=0)
+        clave = (indice, entrada['usuario'].pk, entrada['modulo'], entrada['detalles'].get('metodo'), vista)
+        with self._lock:
+            if self._minuto is None:
+                self._minuto = minuto
+            grupo = self._grupos.setdefault(clave, {'total': 0, 'entrada': entrada, 'acciones': []})
+            grupo['total'] += 1
+            grupo['entrada'] = entrada
+            if len(grupo['acciones']) < 5 and entrada['accion'] not in grupo['acciones']:
+                grupo['acciones'].append(entrada['accion'])
+            self._programar()
+
+    def _programar(self):
+        # Con self._lock tomado. Si no llegan más peticiones, el minuto se cierra igual poco después de terminar
+        if self._temporizador is not None:
+            return
+        ahora = timezone.now()
+        espera = 61 - ahora.second - ahora.microsecond / 1e6
+        self._temporizador = threading.Timer(espera, self._vencido)
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _vencido(self):
+        with self._lock:
+            self._temporizador = None
+        try:
+            self.vaciar()
+        finally:
+            # El temporizador es un hilo propio: su conexión no la cierra nadie más
+            connection.close()
+        with self._lock:
+            if self._grupos:
+                self._programar()
+
+    def vaciar(self, forzar=False):
+        """Escribe los grupos del minuto anterior (o todos, con forzar)."""
+        if not self._grupos:
+            return
+        minuto = timezone.now().replace(second=0, microsecond=0)
+        with self._lock:
+            if not self._grupos or (not forzar and self._minuto == minuto):
+                return
+            grupos, inicio = self._grupos, self._minuto
+            self._grupos, self._minuto = {}, None
+
+        for (_, _, modulo, metodo, vista), grupo in grupos.items():
+            entrada = grupo['entrada']
+            try:
+                RegistroBitacora.escribir(
+                    usuario=entrada['usuario'],
+                    accion=f"{grupo['total']} peticiones {metodo} en {vista or entrada['detalles'].get('ruta')}",
+                    ip=entrada['ip'],
+                    modulo=modulo,
+                    detalles={
+                        'metodo': metodo,
+                        'vista': vista,
+                        'agregado': grupo['total'],
+                        'desde': inicio.isoformat(),
+                        'acciones': grupo['acciones'],
+                    },
+                )
+            except Exception as e:
+                print(f"[Bitácora] Error al escribir entrada agregada: {e}")
+
+
+agregador_bitacora = AgregadorBitacora()
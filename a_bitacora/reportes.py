@@ -0,0 +1,270 @@
+import os
+import time
+import unicodedata
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from .models import Bitacora
+from .pagination import filtro_keyset
+
+# Exportaciones grandes: se generan en segundo plano y se descargan después
+trabajos_reportes = ThreadPoolExecutor(max_workers=2, thread_name_prefix='reporte-bitacora')
+
+
+def iterar_bitacora(queryset, lote=2000):
+    """Recorre el queryset por lotes keyset de (timestamp, id), con el usuario ya unido."""
+    queryset = queryset.select_related('usuario').order_by('-timestamp', '-id')
+    ultimo = None
+    while True:
+        pagina = queryset
+        if ultimo is not None:
+            pagina = pagina.filter(filtro_keyset(['timestamp', 'id'], ultimo))
+        filas = list(pagina[:lote])
+        yield from filas
+        if len(filas) < lote:
+            return
+        ultimo = [filas[-1].timestamp, filas[-1].id]
+
+
+class PDFStreaming:
+    """
+    Escritor PDF mínimo que emite cada página apenas se termina.
+
+    reportlab.pdfgen.canvas guarda todas las páginas hasta save(), así que la
+    memoria crece con el reporte. Aquí cada página se comprime y se entrega de
+    inmediato; al final solo quedan en memoria los offsets de la tabla xref.
+    Solo soporta texto en Helvetica / Helvetica-Bold con la codificación
+    WinAnsi (cp1252): alcanza para el español, pero un carácter fuera de ella
+    se cambia por su letra base sin acento si la tiene (ő -> o) o por '?'.
+    No parte líneas: eso lo hace quien arma la página (ver _partir).
+    """
+
+    def __init__(self, pagesize=A4):
+        self.ancho, self.alto = pagesize
+        self.offsets = {}
+        self.posicion = 0
+        self.paginas = []
+        self.siguiente_objeto = 5  # 1 catálogo, 2 árbol de páginas, 3-4 fuentes
+
+    def _objeto(self, numero, contenido):
+        self.offsets[numero] = self.posicion
+        datos = f"{numero} 0 obj\n".encode() + contenido + b"\nendobj\n"
+        self.posicion += len(datos)
+        return datos
+
+    def inicio(self):
+        datos = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+        self.posicion = len(datos)
+        datos += self._objeto(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        datos += self._objeto(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+        datos += self._objeto(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+        return datos
+
+    def pagina(self, textos):
+        """textos: lista de (x, y, fuente, tamaño, texto). Devuelve los bytes de la página."""
+        operaciones = []
+        for x, y, fuente, tamano, texto in textos:
+            nombre = 'F2' if fuente == 'Helvetica-Bold' else 'F1'
+            operaciones.append(f"BT /{nombre} {tamano} Tf {x:.2f} {y:.2f} Td ({_escapar(texto)}) Tj ET")
+        flujo = zlib.compress(_a_cp1252("\n".join(operaciones)).encode('cp1252'))
+
+        contenido, pagina = self.siguiente_objeto, self.siguiente_objeto + 1
+        self.siguiente_objeto += 2
+        self.paginas.append(pagina)
+
+        datos = self._objeto(
+            contenido,
+            f"<< /Length {len(flujo)} /Filter /FlateDecode >>\nstream\n".encode() + flujo + b"\nendstream",
+        )
+        datos += self._objeto(pagina, (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 {self.ancho:.2f} {self.alto:.2f}] "
+            f"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents {contenido} 0 R >>"
+        ).encode())
+        return datos
+
+    def fin(self):
+        hijos = " ".join(f"{p} 0 R" for p in self.paginas)
+        datos = self._objeto(2, f"<< /Type /Pages /Kids [{hijos}] /Count {len(self.paginas)} >>".encode())
+
+        inicio_xref = self.posicion
+        total = self.siguiente_objeto
+        lineas = [f"xref\n0 {total}\n", "0000000000 65535 f \n"]
+        lineas += [f"{self.offsets[n]:010d} 00000 n \n" for n in range(1, total)]
+        lineas.append(f"trailer\n<< /Size {total} /Root 1 0 R >>\nstartxref\n{inicio_xref}\n%%EOF\n")
+        return datos + "".join(lineas).encode()
+
+
+def _escapar(texto):
+    return texto.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _a_cp1252(texto):
+    try:
+        texto.encode('cp1252')
+        return texto
+    except UnicodeEncodeError:
+        pass
+    caracteres = []
+    for c in texto:
+        try:
+            c.encode('cp1252')
+        except UnicodeEncodeError:
+            base = unicodedata.normalize('NFKD', c)[:1]
+            c = base if base and base.isascii() else '?'
+        caracteres.append(c)
+    return ''.join(caracteres)
+
+
+def _partir(texto, fuente, tamano, ancho):
+    """Parte el texto en líneas que entran en `ancho` puntos, por palabras si se puede."""
+    lineas, actual = [], ''
+    for palabra in texto.split(' '):
+        candidata = f"{actual} {palabra}" if actual else palabra
+        if stringWidth(candidata, fuente, tamano) <= ancho:
+            actual = candidata
+            continue
+        if actual:
+            lineas.append(actual)
+        # Una palabra más larga que la línea se corta donde toque
+        while stringWidth(palabra, fuente, tamano) > ancho:
+            corte = 1
+            while stringWidth(palabra[:corte + 1], fuente, tamano) <= ancho:
+                corte += 1
+            lineas.append(palabra[:corte])
+            palabra = palabra[corte:]
+        actual = palabra
+    lineas.append(actual)
+    return lineas
+
+
+def generar_pdf_bitacora(queryset, titulo="REPORTE DE BITÁCORA"):
+    """Genera el reporte página por página (bytes), apto para StreamingHttpResponse."""
+    pdf = PDFStreaming(A4)
+    yield pdf.inicio()
+
+    alto = pdf.alto
+    y = alto - 50
+    textos = [(200, y, 'Helvetica-Bold', 16, titulo)]
+    y -= 30
+
+    for b in iterar_bitacora(queryset):
+        linea = f"{timezone.localtime(b.timestamp).strftime('%Y-%m-%d %H:%M:%S')} - {b.usuario.nombre} {b.usuario.apellido} - {b.accion} - IP: {b.ip}"
+        # Las líneas largas siguen debajo, con sangría, en vez de cortarse
+        for i, parte in enumerate(_partir(_a_cp1252(linea), 'Helvetica', 10, pdf.ancho - 75)):
+            if y < 50:
+                yield pdf.pagina(textos)
+                textos = []
+                y = alto - 50
+            textos.append((30 if i == 0 else 45, y, 'Helvetica', 10, parte))
+            y -= 15
+
+    if textos or not pdf.paginas:
+        yield pdf.pagina(textos)
+    yield pdf.fin()
+
+
+def directorio_reportes():
+    directorio = getattr(settings, 'BITACORA_REPORTES_DIR', os.path.join(settings.BASE_DIR, 'var', 'reportes'))
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def rutas_reporte(reporte_id):
+    base = os.path.join(directorio_reportes(), f"bitacora-{reporte_id}")
+    return {'pdf': base + '.pdf', 'parcial': base + '.pdf.part', 'error': base + '.error'}
+
+
+def _abandono():
+    return getattr(settings, 'BITACORA_REPORTE_ABANDONO', 300)
+
+
+def generar_reporte_archivo(reporte_id, queryset):
+    """
+    Escribe el reporte en disco; mientras se genera existe solo el .part.
+
+    Cada página se escribe al disco en cuanto se termina, así que la fecha de
+    modificación del .part es el latido del trabajo (ver estado_reporte).
+    """
+    rutas = rutas_reporte(reporte_id)
+    try:
+        with open(rutas['parcial'], 'wb') as archivo:
+            for bloque in generar_pdf_bitacora(queryset):
+                archivo.write(bloque)
+                archivo.flush()
+        os.replace(rutas['parcial'], rutas['pdf'])
+    except Exception as e:
+        print(f"[Bitácora] Error al generar reporte {reporte_id}: {e}")
+        with open(rutas['error'], 'w', encoding='utf-8') as archivo:
+            archivo.write(str(e))
+        if os.path.exists(rutas['parcial']):
+            os.remove(rutas['parcial'])
+    finally:
+        close_old_connections()
+
+
+def _abandonar(parcial, error):
+    """Marca como fallido un reporte cuyo .part dejó de avanzar (el proceso que lo generaba murió)."""
+    with open(error, 'w', encoding='utf-8') as archivo:
+        archivo.write("El reporte dejó de generarse (se detuvo el proceso); vuelva a pedirlo")
+    try:
+        os.remove(parcial)
+    except FileNotFoundError:
+        pass
+
+
+def estado_reporte(reporte_id):
+    """
+    ('listo' | 'en_proceso' | 'error' | None, detalle).
+
+    El trabajo corre en un hilo del proceso web: si ese proceso muere, el .part
+    queda sin avanzar. Pasados BITACORA_REPORTE_ABANDONO segundos sin cambios
+    se da por fallido en vez de responder "en_proceso" para siempre.
+    """
+    rutas = rutas_reporte(reporte_id)
+    if os.path.exists(rutas['pdf']):
+        return 'listo', rutas['pdf']
+    try:
+        modificado = os.path.getmtime(rutas['parcial'])
+    except FileNotFoundError:
+        modificado = None
+    if modificado is not None:
+        if time.time() - modificado <= _abandono():
+            return 'en_proceso', None
+        _abandonar(rutas['parcial'], rutas['error'])
+    if os.path.exists(rutas['error']):
+        with open(rutas['error'], encoding='utf-8') as archivo:
+            return 'error', archivo.read()
+    return None, None
+
+
+def limpiar_reportes():
+    """Marca como fallidos los .part abandonados (sin avanzar hace BITACORA_REPORTE_ABANDONO segundos)."""
+    directorio = directorio_reportes()
+    limite = time.time() - _abandono()
+    total = 0
+    for nombre in os.listdir(directorio):
+        if not nombre.endswith('.pdf.part'):
+            continue
+        parcial = os.path.join(directorio, nombre)
+        try:
+            if os.path.getmtime(parcial) >= limite:
+                continue
+        except FileNotFoundError:
+            continue
+        _abandonar(parcial, parcial[:-len('.pdf.part')] + '.error')
+        total += 1
+    return total
+
+
+def encolar_reporte(reporte_id, queryset):
+    # De paso, los restos de trabajos que murieron con un proceso anterior
+    limpiar_reportes()
+    # Crear el .part aquí para que la consulta de estado ya lo vea en proceso
+    open(rutas_reporte(reporte_id)['parcial'], 'wb').close()
+    trabajos_reportes.submit(generar_reporte_archivo, reporte_id, queryset)
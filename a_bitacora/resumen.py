@@ -0,0 +1,160 @@
+"""
+Resumen de actividad de la bitácora: entradas por hora, módulo y usuario.
+
+ResumenBitacora se actualiza cada vez que se escriben entradas (acumular), así
+que las estadísticas se leen de una tabla que crece con las horas y no con la
+cantidad de entradas. reconstruir() recalcula un rango desde la tabla en vivo.
+
+En PostgreSQL cada hora tiene un advisory lock: quien escribe entradas toma el
+de sus horas compartido (escritura()) desde el INSERT hasta sumar al resumen, y
+reconstruir() lo toma exclusivo. Así una reconstrucción no cuenta una entrada
+cuyo incremento llega después, ni borra uno que ya contó.
+"""
+from collections import Counter
+from contextlib import contextmanager
+from datetime import timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncHour
+
+from .models import Bitacora, ResumenBitacora
+
+# Filas por INSERT; mantiene los parámetros por debajo del límite de SQLite
+FILAS_POR_INSERT = 200
+
+# Primera clave de los advisory locks por hora del resumen (la segunda es la hora desde 1970)
+BLOQUEO_RESUMEN = 0x52455355
+
+
+def truncar_hora(momento):
+    return momento.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def contar(entradas):
+    """Counter de (hora, modulo, usuario_id) a partir de instancias de Bitacora."""
+    return Counter((truncar_hora(b.timestamp), b.modulo or '', b.usuario_id) for b in entradas)
+
+
+def acumular(conteos):
+    """Suma los conteos al resumen con INSERT ... ON CONFLICT DO UPDATE (PostgreSQL y SQLite)."""
+    tabla = connection.ops.quote_name(ResumenBitacora._meta.db_table)
+    items = list(conteos.items())
+    for i in range(0, len(items), FILAS_POR_INSERT):
+        filas, params = [], []
+        for (hora, modulo, usuario_id), total in items[i:i + FILAS_POR_INSERT]:
+            filas.append('(%s, %s, %s, %s)')
+            params += [connection.ops.adapt_datetimefield_value(hora), modulo, usuario_id, total]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {tabla} (hora, modulo, usuario_id, total) VALUES {", ".join(filas)} '
+                f'ON CONFLICT (hora, modulo, usuario_id) DO UPDATE SET total = {tabla}.total + EXCLUDED.total',
+                params,
+            )
+
+
+def bloquear_horas(horas, exclusivo=False):
+    """Advisory lock de cada hora hasta el final de la transacción (solo PostgreSQL)."""
+    if connection.vendor != 'postgresql':
+        return
+    # Ordenadas, para que dos transacciones no se esperen en cruz
+    claves = sorted({int(truncar_hora(hora).timestamp()) // 3600 for hora in horas})
+    funcion = 'pg_advisory_xact_lock' if exclusivo else 'pg_advisory_xact_lock_shared'
+    with connection.cursor() as cursor:
+        cursor.execute(f'SELECT {funcion}(%s, h) FROM unnest(%s::int[]) AS h', [BLOQUEO_RESUMEN, claves])
+
+
+@contextmanager
+def escritura(entradas):
+    """Transacción para insertar entradas y sumarlas al resumen sin cruzarse con reconstruir()."""
+    with transaction.atomic():
+        bloquear_horas(b.timestamp for b in entradas)
+        yield
+
+
+def registrar_en_resumen(entradas):
+    # Un error en el resumen no debe impedir que se registre la bitácora (ni abortar su transacción)
+    try:
+        with transaction.atomic():
+            acumular(contar(entradas))
+    except Exception as e:
+        print(f"[Bitácora] Error al actualizar el resumen: {e}")
+
+
+def reconstruir(inicio, fin, extra=None):
+    """
+    Recalcula el resumen de [inicio, fin) desde la tabla en vivo.
+
+    inicio y fin deben caer en hora exacta. extra son conteos adicionales
+    (por ejemplo, de entradas ya archivadas) que se suman a los de la tabla.
+    Se trabaja un día por transacción, con las horas del día bloqueadas.
+    Devuelve la cantidad de entradas resumidas.
+    """
+    extra = Counter(extra or {})
+    total = 0
+    tramo_inicio = inicio
+    while tramo_inicio < fin:
+        tramo_fin = min(tramo_inicio + timedelta(days=1), fin)
+        total += _reconstruir_tramo(tramo_inicio, tramo_fin, extra)
+        tramo_inicio = tramo_fin
+    return total
+
+
+def _reconstruir_tramo(inicio, fin, extra):
+    horas = [inicio + timedelta(hours=i) for i in range(int((fin - inicio) / timedelta(hours=1)))]
+    with transaction.atomic():
+        # Espera a las escrituras en curso en esas horas y frena las nuevas hasta terminar;
+        # por eso el conteo va después del bloqueo
+        bloquear_horas(horas, exclusivo=True)
+        filas = (
+            Bitacora.objects.filter(timestamp__gte=inicio, timestamp__lt=fin)
+            .annotate(hora=TruncHour('timestamp', tzinfo=dt_timezone.utc))
+            .values('hora', 'modulo', 'usuario_id')
+            .annotate(total=Count('id'))
+            .order_by()
+        )
+        conteos = Counter({clave: total for clave, total in extra.items() if inicio <= clave[0] < fin})
+        for fila in filas:
+            conteos[(fila['hora'], fila['modulo'] or '', fila['usuario_id'])] += fila['total']
+
+        ResumenBitacora.objects.filter(hora__gte=inicio, hora__lt=fin).delete()
+        ResumenBitacora.objects.bulk_create(
+            [
+                ResumenBitacora(hora=hora, modulo=modulo, usuario_id=usuario_id, total=total)
+                for (hora, modulo, usuario_id), total in conteos.items()
+            ],
+            batch_size=1000,
+        )
+    return sum(conteos.values())
+
+
+def estadisticas(queryset, intervalo='hora', top=10):
+    """Totales por módulo, por usuario (los top más activos) y serie por hora o día."""
+    queryset = queryset.order_by()
+    truncar = TruncDay('hora') if intervalo == 'dia' else TruncHour('hora')
+
+    por_modulo = queryset.values('modulo').annotate(total=Sum('total')).order_by('-total', 'modulo')
+    por_usuario = (
+        queryset.values('usuario', 'usuario__email', 'usuario__nombre', 'usuario__apellido')
+        .annotate(total=Sum('total'))
+        .order_by('-total', 'usuario')[:top]
+    )
+    serie = queryset.annotate(periodo=truncar).values('periodo').annotate(total=Sum('total')).order_by('periodo')
+
+    return {
+        'total': queryset.aggregate(total=Sum('total'))['total'] or 0,
+        'por_modulo': [
+            {'modulo': fila['modulo'] or None, 'total': fila['total']}
+            for fila in por_modulo
+        ],
+        'por_usuario': [
+            {
+                'usuario': fila['usuario'],
+                'email': fila['usuario__email'],
+                'nombre': f"{fila['usuario__nombre']} {fila['usuario__apellido']}",
+                'total': fila['total'],
+            }
+            for fila in por_usuario
+        ],
+        'serie': [{'periodo': fila['periodo'], 'total': fila['total']} for fila in serie],
+    }
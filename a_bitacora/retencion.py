@@ -0,0 +1,200 @@
+"""
+Purga de la bitácora por módulo según BITACORA_PURGA.
+
+Cada módulo tiene sus días de retención y una acción para lo vencido:
+'borrar' o 'archivar' (al archivo comprimido de archivo.py, y luego borrar).
+Se trabaja por lotes de claves primarias recorridos en orden (timestamp, id),
+cada uno en su propia transacción corta y con una pausa entre lotes, así las
+escrituras en vivo (que van a la partición del mes actual) no se bloquean.
+
+El avance se guarda en un archivo de estado después de cada lote; si la purga
+se interrumpe, la siguiente corrida retoma el mismo corte desde el último lote.
+"""
+import fcntl
+import json
+import os
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import archivo
+from .models import Bitacora
+from .pagination import filtro_keyset
+
+TODOS = '*'
+
+
+def configuracion():
+    config = {
+        'LOTE': 1000,
+        'PAUSA': 0.5,
+        'MODULOS': {TODOS: {'dias': 365, 'accion': 'archivar'}},
+        'ESTADO': os.path.join(settings.BASE_DIR, 'var', 'purga_bitacora.json'),
+    }
+    config.update(getattr(settings, 'BITACORA_PURGA', {}))
+    return config
+
+
+def filtro_modulo(modulo, politicas):
+    """'*' cubre los módulos sin política propia, incluidas las entradas sin módulo."""
+    if modulo != TODOS:
+        return Q(modulo=modulo)
+    otros = [m for m in politicas if m != TODOS]
+    return Q(modulo__isnull=True) | ~Q(modulo__in=otros)
+
+
+def _a_json(valor):
+    # isoformat completo: DjangoJSONEncoder recorta a milisegundos y el cursor necesita microsegundos
+    return valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+
+
+class EstadoPurga:
+    """Avance de la purga en disco, protegido por flock para que no corran dos a la vez."""
+
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self.datos = {}
+        self._archivo = None
+
+    def __enter__(self):
+        os.makedirs(os.path.dirname(self.ruta), exist_ok=True)
+        self._archivo = open(self.ruta + '.lock', 'w')
+        try:
+            fcntl.flock(self._archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self._archivo.close()
+            raise RuntimeError('Ya hay una purga de bitácora en curso')
+        try:
+            with open(self.ruta, encoding='utf-8') as archivo_estado:
+                self.datos = json.load(archivo_estado)
+        except FileNotFoundError:
+            self.datos = {}
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self._archivo, fcntl.LOCK_UN)
+        self._archivo.close()
+
+    def guardar(self):
+        temporal = self.ruta + '.tmp'
+        with open(temporal, 'w', encoding='utf-8') as archivo_estado:
+            json.dump(self.datos, archivo_estado, default=_a_json, indent=2)
+        os.replace(temporal, self.ruta)
+
+    def terminar(self):
+        if os.path.exists(self.ruta):
+            os.remove(self.ruta)
+
+
+def purgar(lote=None, pausa=None, modulos=None, reiniciar=False, simular=False, progreso=print):
+    """
+    Purga lo vencido de cada módulo. Pensada para cron (ver purgar_bitacora).
+
+    modulos limita la corrida a esos módulos; simular solo cuenta. progreso
+    recibe una línea de texto por lote. Devuelve {modulo: entradas procesadas}.
+    """
+    config = configuracion()
+    lote = lote or config['LOTE']
+    pausa = config['PAUSA'] if pausa is None else pausa
+    politicas = config['MODULOS']
+
+    resultado = {}
+    with EstadoPurga(config['ESTADO']) as estado:
+        if reiniciar:
+            # Con modulos solo se descarta el avance de esos; el de los demás se conserva
+            estado.datos = {m: a for m, a in estado.datos.items() if modulos and m not in modulos}
+
+        for modulo, politica in politicas.items():
+            if modulos and modulo not in modulos:
+                continue
+            if politica.get('dias') is None:
+                continue
+
+            # Una corrida interrumpida se retoma con su corte original
+            avance = estado.datos.get(modulo)
+            if avance is None:
+                avance = {
+                    'corte': timezone.now() - timedelta(days=politica['dias']),
+                    'ultimo': None,
+                    'procesadas': 0,
+                }
+            else:
+                avance['corte'] = parse_datetime(avance['corte'])
+                if avance['ultimo']:
+                    avance['ultimo'] = [parse_datetime(avance['ultimo'][0]), avance['ultimo'][1]]
+                progreso(f"{modulo}: retomando desde {avance['procesadas']} entradas")
+
+            queryset = Bitacora.objects.filter(filtro_modulo(modulo, politicas), timestamp__lt=avance['corte'])
+            if simular:
+                resultado[modulo] = queryset.count()
+                progreso(f"{modulo}: {resultado[modulo]} entradas anteriores a {avance['corte']:%Y-%m-%d} ({politica.get('accion', 'borrar')})")
+                continue
+
+            resultado[modulo] = _purgar_modulo(
+                modulo, queryset, politica.get('accion', 'borrar'), avance, estado, lote, pausa, progreso
+            )
+            estado.datos.pop(modulo, None)
+            estado.guardar()
+
+        if not simular:
+            # Una corrida limitada a algunos módulos no toca el avance guardado de los otros
+            if estado.datos:
+                estado.guardar()
+            else:
+                estado.terminar()
+            # Un lote retomado pudo archivarse dos veces: se corrigen los totales del índice
+            if any(politicas[m].get('accion') == 'archivar' for m in resultado):
+                archivo.recontar()
+    return resultado
+
+
+def _purgar_modulo(modulo, queryset, accion, avance, estado, lote, pausa, progreso):
+    queryset = queryset.order_by('timestamp', 'id')
+    if accion == 'archivar':
+        queryset = queryset.select_related('usuario')
+
+    inicio = time.monotonic()
+    procesadas_antes = avance['procesadas']
+    while True:
+        pagina = queryset
+        if avance['ultimo'] is not None:
+            # Seguir desde el último lote evita recorrer filas ya borradas que el índice aún conserva
+            pagina = pagina.filter(filtro_keyset(['timestamp', 'id'], avance['ultimo'], descendente=False))
+
+        if accion == 'archivar':
+            filas = list(pagina[:lote])
+            claves = [(b.timestamp, b.id) for b in filas]
+        else:
+            filas = None
+            claves = list(pagina.values_list('timestamp', 'id')[:lote])
+        if not claves:
+            break
+
+        if filas is not None:
+            # Si se corta entre el archivo y el borrado, archivo.leer descarta el duplicado por id
+            archivo.agregar(filas)
+        # Un DELETE corto por lote; el rango de timestamp deja que PostgreSQL toque solo las particiones del lote
+        Bitacora.objects.filter(
+            id__in=[id_ for _, id_ in claves],
+            timestamp__gte=claves[0][0],
+            timestamp__lte=claves[-1][0],
+        ).delete()
+
+        avance['ultimo'] = list(claves[-1])
+        avance['procesadas'] += len(claves)
+        estado.datos[modulo] = avance
+        estado.guardar()
+
+        transcurrido = time.monotonic() - inicio
+        ritmo = (avance['procesadas'] - procesadas_antes) / transcurrido if transcurrido else 0
+        progreso(f"{modulo}: {avance['procesadas']} entradas ({accion}), {ritmo:.0f} entradas/s")
+
+        if len(claves) < lote:
+            break
+        time.sleep(pausa)
+
+    return avance['procesadas']
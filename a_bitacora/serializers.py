@@ -7,5 +7,22 @@ class BitacoraSerializer(serializers.ModelSerializer):
 
     class Meta:
         model = Bitacora
-        fields = ['id', 'usuario', 'accion', 'timestamp', 'ip']
-        read_only_fields = ['id', 'timestamp']
\ No newline at end of file
+        fields = ['id', 'usuario', 'accion', 'timestamp', 'ip', 'modulo', 'objeto_tipo', 'objeto_id', 'detalles']
+        read_only_fields = ['id', 'timestamp']
+
+class BitacoraListSerializer(serializers.ModelSerializer):
+    # Usuario plano: sale del select_related('usuario'), sin consultas por fila
+    usuario_nombre = serializers.SerializerMethodField()
+    usuario_email = serializers.EmailField(source='usuario.email', read_only=True)
+
+    class Meta:
+        model = Bitacora
+        fields = [
+            'id', 'usuario', 'usuario_nombre', 'usuario_email', 'accion', 'timestamp', 'ip', 'modulo',
+            'objeto_tipo', 'objeto_id', 'detalles',
+        ]
+        read_only_fields = fields
+
+    def get_usuario_nombre(self, obj):
+        # Las entradas archivadas traen el nombre completo en nombre y apellido vacío
+        return " ".join(parte for parte in (obj.usuario.nombre, obj.usuario.apellido) if parte)
@@ -1,3 +1,842 @@
-from django.test import TestCase
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+import zlib
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.db import connection
+from django.contrib.auth.models import AnonymousUser
+from django.db.models.signals import post_delete
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase.pdfmetrics import stringWidth
+
+from a_especialidades.models import Especialidad
+from a_historiales.models import HistorialClinico
+from a_pacientes.models import Pacientes
+from a_roles.models import Rol
+from a_usuarios.models import Usuario
+from .models import Bitacora, ResumenBitacora
+from .utils import RegistroBitacora
+from . import archivo, pagination, reportes, resumen, retencion
+from .buffer import BufferBitacora
+from .cambios import diferencias, instantanea
+from .middleware import BitacoraMiddleware
+from .pagination import filtro_keyset
+from .reglas import AgregadorBitacora, ReglasBitacora
+from .particiones import es_particionada, nombre_particion
+
+
+class BitacoraListadoConsultasTests(TestCase):
+    """El listado de la bitácora debe costar las mismas consultas sin importar las filas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(email='admin@test.com', nombre='Admin', apellido='Test')
+        rol = Rol.objects.create(nombre='Auditor')
+        cls.usuarios = [
+            Usuario.objects.create_user(email=f'u{i}@test.com', nombre='Usuario', apellido=str(i), rol=rol)
+            for i in range(5)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+    def crear_entradas(self, cantidad):
+        Bitacora.objects.bulk_create([
+            Bitacora(usuario=self.usuarios[i % len(self.usuarios)], accion=f'Acción {i}', ip='127.0.0.1', modulo='pacientes')
+            for i in range(cantidad)
+        ])
+
+    def test_listado_consultas_constantes(self):
+        # Conteo + página, tanto con 2 filas como con una página completa
+        self.crear_entradas(2)
+        with self.assertNumQueries(2):
+            respuesta = self.client.get('/api/bitacora/')
+        self.assertEqual(len(respuesta.data['results']), 2)
+
+        self.crear_entradas(20)
+        with self.assertNumQueries(2):
+            respuesta = self.client.get('/api/bitacora/')
+        self.assertEqual(len(respuesta.data['results']), 10)
+
+    def test_listado_cursor_una_consulta(self):
+        self.crear_entradas(15)
+        with self.assertNumQueries(1):
+            respuesta = self.client.get('/api/bitacora/', {'paginacion': 'cursor'})
+        self.assertEqual(len(respuesta.data['results']), 10)
+
+    def test_listado_usuario_plano(self):
+        self.crear_entradas(1)
+        fila = self.client.get('/api/bitacora/').data['results'][0]
+        self.assertEqual(fila['usuario'], self.usuarios[0].id)
+        self.assertEqual(fila['usuario_nombre'], 'Usuario 0')
+        self.assertEqual(fila['usuario_email'], 'u0@test.com')
+
+    def test_detalle_usuario_completo(self):
+        self.crear_entradas(1)
+        entrada = Bitacora.objects.get()
+        detalle = self.client.get(f'/api/bitacora/{entrada.id}/').data
+        self.assertEqual(detalle['usuario']['email'], 'u0@test.com')
+        self.assertEqual(detalle['usuario']['rol']['nombre'], 'Auditor')
+
+    def test_cursor_recorre_todo_sin_repetir(self):
+        # Varias entradas con el mismo timestamp: el id desempata entre páginas
+        ahora = timezone.now()
+        Bitacora.objects.bulk_create([
+            Bitacora(usuario=self.usuarios[0], accion=f'Acción {i}', ip='127.0.0.1',
+                     timestamp=ahora - timedelta(seconds=i // 4))
+            for i in range(23)
+        ])
+        vistos, url = [], '/api/bitacora/?paginacion=cursor&page_size=5'
+        while url:
+            datos = self.client.get(url).data
+            vistos += [fila['id'] for fila in datos['results']]
+            url = datos['next']
+        esperados = [str(pk) for pk in Bitacora.objects.order_by('-timestamp', '-id').values_list('id', flat=True)]
+        self.assertEqual([str(pk) for pk in vistos], esperados)
+
+    def test_filtro_keyset_sin_tuple_lookups(self):
+        # Sin el módulo interno de Django la condición expandida devuelve las mismas filas
+        ahora = timezone.now()
+        Bitacora.objects.bulk_create([
+            Bitacora(usuario=self.usuarios[i % 2], accion=f'Acción {i}', ip='127.0.0.1',
+                     timestamp=ahora - timedelta(seconds=i // 3))
+            for i in range(12)
+        ])
+        todas = Bitacora.objects.order_by('usuario_id', 'timestamp', 'id')
+        medio = todas[5]
+        campos, valores = ['usuario_id', 'timestamp', 'id'], [medio.usuario_id, medio.timestamp, medio.id]
+        for descendente in (True, False):
+            with self.subTest(descendente=descendente):
+                esperadas = list(todas.filter(filtro_keyset(campos, valores, descendente)).values_list('pk', flat=True))
+                with mock.patch.object(pagination, 'Tuple', None):
+                    obtenidas = list(todas.filter(filtro_keyset(campos, valores, descendente)).values_list('pk', flat=True))
+                self.assertEqual(obtenidas, esperadas)
+                self.assertEqual(len(obtenidas), 5 if descendente else 6)
+
+    def test_cursor_es_rango_del_indice(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('El plan solo se revisa en PostgreSQL')
+        self.crear_entradas(3)
+        ultima = Bitacora.objects.order_by('-timestamp', '-id').first()
+        plan = (Bitacora.objects.order_by('-timestamp', '-id')
+                .filter(filtro_keyset(['timestamp', 'id'], [ultima.timestamp, ultima.id]))[:11]
+                .explain())
+        # Comparación de filas, que PostgreSQL usa como límite del índice; no un OR que se filtra fila por fila
+        self.assertIn('ROW("timestamp", id) <', plan)
+        self.assertNotIn(' OR ', plan)
+
+
+class ReporteBitacoraTests(TestCase):
+    """El reporte PDF se genera por páginas y el estado de los reportes en segundo plano no se queda colgado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(email='reportes@test.com', nombre='Admin', apellido='Reportes')
+        Bitacora.objects.bulk_create([
+            Bitacora(usuario=cls.admin, accion=f'Acción (n.º {i}) \\ años', ip='127.0.0.1', modulo='pacientes')
+            for i in range(120)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(BITACORA_REPORTES_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+    def revisar_pdf(self, datos):
+        self.assertTrue(datos.startswith(b'%PDF-1.4'))
+        self.assertTrue(datos.endswith(b'%%EOF\n'))
+        # Cada offset de la tabla xref apunta al comienzo de su objeto
+        inicio_xref = int(re.search(rb'startxref\n(\d+)', datos).group(1))
+        tabla = datos[inicio_xref:].split(b'trailer')[0].splitlines()[3:]
+        for numero, linea in enumerate(tabla, start=1):
+            offset = int(linea[:10])
+            self.assertTrue(datos[offset:].startswith(f'{numero} 0 obj'.encode()), numero)
+        return datos.count(b'/Type /Page ')
+
+    def test_pdf_sincrono(self):
+        respuesta = self.client.get('/api/bitacora/reportes/pdf/')
+        self.assertEqual(respuesta.status_code, 200)
+        datos = b''.join(respuesta.streaming_content)
+        # 120 líneas a ~48 por página
+        self.assertEqual(self.revisar_pdf(datos), 3)
+
+    def test_iterar_por_lotes(self):
+        # Lotes que no dividen el total: cada fila aparece una vez, en orden
+        filas = [b.pk for b in reportes.iterar_bitacora(Bitacora.objects.all(), lote=7)]
+        self.assertEqual(filas, list(Bitacora.objects.order_by('-timestamp', '-id').values_list('pk', flat=True)))
+
+    def test_lineas_largas_se_parten(self):
+        accion = ' '.join(f'palabra{i}' for i in range(40)) + ' ' + 'x' * 200 + ' Őrség ✓'
+        queryset = Bitacora.objects.filter(pk=Bitacora.objects.create(
+            usuario=self.admin, accion=accion, ip='127.0.0.1', modulo='pacientes').pk)
+        datos = b''.join(reportes.generar_pdf_bitacora(queryset))
+        self.revisar_pdf(datos)
+        flujo = re.search(rb'stream\n(.*?)\nendstream', datos, re.S).group(1)
+        lineas = re.findall(r'\((.*)\) Tj', zlib.decompress(flujo).decode('cp1252'))[1:]
+        # Nada se pierde: las partes juntas son la línea completa; fuera de cp1252 queda la letra base o '?'
+        self.assertGreater(len(lineas), 2)
+        juntas = ''.join(lineas).replace(' ', '')
+        self.assertIn(accion.replace('Ő', 'O').replace('✓', '?').replace(' ', ''), juntas)
+        self.assertTrue(juntas.endswith('IP:127.0.0.1'))
+        for linea in lineas:
+            self.assertLessEqual(stringWidth(linea, 'Helvetica', 10), A4[0] - 75)
+
+    def test_reporte_en_segundo_plano(self):
+        with mock.patch.object(reportes.trabajos_reportes, 'submit') as submit:
+            respuesta = self.client.get('/api/bitacora/reportes/pdf/', {'asincrono': 'true'})
+        self.assertEqual(respuesta.status_code, 202)
+        url = respuesta.data['url']
+        self.assertEqual(self.client.get(url).data['estado'], 'en_proceso')
+
+        # El trabajo corre aquí mismo en vez de en el hilo del pool
+        funcion, *argumentos = submit.call_args.args
+        funcion(*argumentos)
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(self.revisar_pdf(b''.join(respuesta.streaming_content)), 3)
+        self.assertEqual(self.client.get(f'/api/bitacora/reportes/pdf/{uuid.uuid4()}/').status_code, 404)
+
+    def test_reporte_abandonado(self):
+        reporte_id = uuid.uuid4()
+        rutas = reportes.rutas_reporte(reporte_id)
+        open(rutas['parcial'], 'wb').close()
+        url = f'/api/bitacora/reportes/pdf/{reporte_id}/'
+        self.assertEqual(self.client.get(url).status_code, 202)
+
+        # El proceso que lo generaba murió: el .part deja de avanzar
+        viejo = time.time() - 301
+        os.utime(rutas['parcial'], (viejo, viejo))
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 500)
+        self.assertEqual(respuesta.data['estado'], 'error')
+        self.assertFalse(os.path.exists(rutas['parcial']))
+
+    def test_limpiar_reportes(self):
+        viejo, nuevo = reportes.rutas_reporte(uuid.uuid4()), reportes.rutas_reporte(uuid.uuid4())
+        for rutas in (viejo, nuevo):
+            open(rutas['parcial'], 'wb').close()
+        os.utime(viejo['parcial'], (time.time() - 3600, time.time() - 3600))
+
+        self.assertEqual(reportes.limpiar_reportes(), 1)
+        self.assertFalse(os.path.exists(viejo['parcial']))
+        self.assertTrue(os.path.exists(viejo['error']))
+        self.assertTrue(os.path.exists(nuevo['parcial']))
+
+
+class PurgaBitacoraTests(TestCase):
+    """Una purga interrumpida se retoma desde el último lote guardado."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='purga@test.com', nombre='Purga', apellido='Test')
+        ahora = timezone.now()
+        # Vencidas con timestamps repetidos de a tres: el id desempata el cursor
+        Bitacora.objects.bulk_create(
+            [Bitacora(usuario=cls.usuario, accion=f'Vieja {i}', ip='127.0.0.1', modulo='pacientes',
+                      timestamp=ahora - timedelta(days=60, minutes=i // 3)) for i in range(25)]
+            + [Bitacora(usuario=cls.usuario, accion=f'Reciente {i}', ip='127.0.0.1', modulo='pacientes',
+                        timestamp=ahora - timedelta(days=1)) for i in range(3)]
+        )
+
+    def setUp(self):
+        directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directorio, ignore_errors=True)
+        self.estado = os.path.join(directorio, 'purga.json')
+        ajustes = override_settings(BITACORA_PURGA={
+            'MODULOS': {'*': {'dias': 30, 'accion': 'borrar'}}, 'ESTADO': self.estado,
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        # Con un receptor, el DELETE pasa por el collector y se sabe qué filas borró
+        self.borradas = []
+        receptor = lambda instance, **kwargs: self.borradas.append(instance.pk)  # noqa: E731
+        post_delete.connect(receptor, sender=Bitacora, weak=False)
+        self.addCleanup(post_delete.disconnect, receptor, sender=Bitacora)
+
+    def test_retoma_sin_saltar_ni_repetir(self):
+        vencidas = list(Bitacora.objects.filter(accion__startswith='Vieja')
+                        .order_by('timestamp', 'id').values_list('id', flat=True))
+        lotes = []
+
+        def cortar(linea):
+            lotes.append(linea)
+            if len(lotes) == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            retencion.purgar(lote=5, pausa=0, progreso=cortar)
+
+        # Se guardó el avance de los dos lotes terminados
+        # Dentro de un lote el orden del DELETE no importa; ordenadas, cada id una sola vez
+        self.assertEqual(sorted(self.borradas), sorted(vencidas[:10]))
+        with open(self.estado, encoding='utf-8') as archivo_estado:
+            avance = json.load(archivo_estado)['*']
+        self.assertEqual(avance['procesadas'], 10)
+        self.assertEqual(avance['ultimo'][1], str(vencidas[9]))
+
+        lineas = []
+        resultado = retencion.purgar(lote=5, pausa=0, progreso=lineas.append)
+        self.assertIn('*: retomando desde 10 entradas', lineas)
+        self.assertEqual(resultado, {'*': 25})
+        self.assertEqual(sorted(self.borradas), sorted(vencidas))
+        self.assertEqual(Bitacora.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.estado))
+
+    def test_corrida_de_otro_modulo_conserva_el_avance(self):
+        ajustes = override_settings(BITACORA_PURGA={
+            'MODULOS': {'pacientes': {'dias': 30, 'accion': 'borrar'}, '*': {'dias': 30, 'accion': 'borrar'}},
+            'ESTADO': self.estado,
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        Bitacora.objects.bulk_create([
+            Bitacora(usuario=self.usuario, accion=f'Otra {i}', ip='127.0.0.1', modulo='usuarios',
+                     timestamp=timezone.now() - timedelta(days=60)) for i in range(4)
+        ])
+
+        lotes = []
+
+        def cortar(linea):
+            lotes.append(linea)
+            if len(lotes) == 2:
+                raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            retencion.purgar(lote=5, pausa=0, progreso=cortar)
+
+        # Solo '*': termina y el avance de pacientes sigue guardado
+        self.assertEqual(retencion.purgar(lote=5, pausa=0, modulos=['*'], progreso=lambda linea: None), {'*': 4})
+        with open(self.estado, encoding='utf-8') as archivo_estado:
+            self.assertEqual(list(json.load(archivo_estado)), ['pacientes'])
+
+        lineas = []
+        self.assertEqual(retencion.purgar(lote=5, pausa=0, progreso=lineas.append), {'pacientes': 25, '*': 0})
+        self.assertIn('pacientes: retomando desde 10 entradas', lineas)
+        self.assertEqual(Bitacora.objects.count(), 3)
+        self.assertFalse(os.path.exists(self.estado))
+
+
+class BufferBitacoraTests(TestCase):
+    """El buffer vacía por lotes y recupera lo que dejó una instancia anterior, aunque tenga el mismo pid."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='buffer@test.com', nombre='Buffer', apellido='Test')
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(BITACORA_BUFFER={'TAMANO_LOTE': 100, 'INTERVALO': 60, 'DIRECTORIO_SPOOL': self.directorio})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+
+        # Sin el hilo de fondo: su conexión no vería los datos de la transacción del test. Por lo mismo,
+        # no se cierra la conexión al terminar de recuperar (eso lo hace el hilo con la suya)
+        cerrar = mock.patch('a_bitacora.buffer.close_old_connections')
+        cerrar.start()
+        self.addCleanup(cerrar.stop)
+        self.buffer = BufferBitacora()
+        with mock.patch('a_bitacora.buffer.threading.Thread'), mock.patch('a_bitacora.buffer.atexit.register'):
+            self.buffer._iniciar()
+        self.addCleanup(self.buffer._spool.close)
+
+    def escribir(self, nombre, acciones):
+        with open(os.path.join(self.directorio, nombre), 'w', encoding='utf-8') as archivo:
+            for accion in acciones:
+                archivo.write(json.dumps({
+                    'id': str(uuid.uuid4()), 'usuario_id': str(self.usuario.pk), 'accion': accion,
+                    'timestamp': timezone.now().isoformat(), 'ip': '127.0.0.1', 'modulo': 'pacientes', 'detalles': None,
+                }) + '\n')
+
+    def acciones(self):
+        return sorted(Bitacora.objects.values_list('accion', flat=True))
+
+    def test_vaciar_rota_el_spool(self):
+        self.buffer.encolar(self.usuario, 'Uno', '127.0.0.1')
+        self.buffer.encolar(self.usuario, 'Dos', '127.0.0.1')
+        with open(self.buffer._ruta_spool, encoding='utf-8') as spool:
+            self.assertEqual(len(spool.readlines()), 2)
+
+        self.assertEqual(self.buffer.vaciar(), 2)
+        self.assertEqual(self.acciones(), ['Dos', 'Uno'])
+        # El lote insertado se borró y el spool sigue abierto, vacío
+        self.assertEqual(os.listdir(self.directorio), [os.path.basename(self.buffer._ruta_spool)])
+        self.assertEqual(os.path.getsize(self.buffer._ruta_spool), 0)
+
+    def test_lotes_numerados_sin_saltos(self):
+        with mock.patch.object(self.buffer, '_insertar', side_effect=RuntimeError('base caída')):
+            for accion in ('Uno', 'Dos'):
+                self.buffer.encolar(self.usuario, accion, '127.0.0.1')
+                self.buffer._fallidos.clear()
+                with self.assertRaises(RuntimeError):
+                    self.buffer.vaciar()
+                self.assertTrue(self.buffer._fallidos[0][0].endswith(f'-{self.buffer._contador_lotes}.lote'))
+        self.assertEqual(self.buffer._contador_lotes, 2)
+
+    def test_recupera_antecesor_con_el_mismo_pid(self):
+        pid = os.getpid()
+        # Lo que dejó un worker anterior que tuvo este mismo pid (PID 1 en un contenedor)
+        self.escribir(f'bitacora-{pid}-deadbeef.jsonl', ['Spool anterior'])
+        self.escribir(f'bitacora-{pid}-deadbeef-1.lote', ['Lote anterior'])
+        self.escribir(f'bitacora-{pid}-1.lote', ['Formato viejo'])
+        # Un worker vivo (el proceso padre) conserva lo suyo
+        self.escribir(f'bitacora-{os.getppid()}-cafecafe.jsonl', ['De otro worker'])
+
+        # Lo encolado por esta instancia antes de recuperar no se toma como ajeno
+        self.buffer.encolar(self.usuario, 'Propia', '127.0.0.1')
+        self.buffer._recuperar()
+        self.assertEqual(self.acciones(), ['Formato viejo', 'Lote anterior', 'Spool anterior'])
+
+        # El primer lote propio no pisa el bitacora-<pid>-deadbeef-1.lote del antecesor
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(self.acciones(), ['Formato viejo', 'Lote anterior', 'Propia', 'Spool anterior'])
+        self.assertEqual(sorted(os.listdir(self.directorio)), sorted([
+            os.path.basename(self.buffer._ruta_spool), f'bitacora-{os.getppid()}-cafecafe.jsonl',
+        ]))
+
+    def test_recuperacion_fallida_se_reintenta(self):
+        self.escribir('bitacora-999999999-deadbeef.jsonl', ['Caída'])
+        with mock.patch.object(self.buffer, '_insertar', side_effect=RuntimeError('base caída')):
+            self.buffer._recuperar()
+        # Quedó como lote de esta instancia, pendiente de reintento
+        self.assertEqual(len(self.buffer._fallidos), 1)
+        self.assertTrue(os.path.exists(self.buffer._fallidos[0][0]))
+        self.assertEqual(self.acciones(), [])
+
+        self.assertEqual(self.buffer.vaciar(), 1)
+        self.assertEqual(self.acciones(), ['Caída'])
+        self.assertEqual(self.buffer._fallidos, [])
+
+
+class ArchivoBitacoraTests(TestCase):
+    """El listado con meses archivados filtra, cuenta y muestra las entradas archivadas igual que las vivas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(email='admin@test.com', nombre='Admin', apellido='Test')
+        cls.usuario = Usuario.objects.create_user(email='archivo@test.com', nombre='Ana', apellido='Archivo')
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio, ignore_errors=True)
+        ajustes = override_settings(BITACORA_ARCHIVO_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+
+        # Enero de 2024 en el archivo (una entrada cambió el campo nombre) y dos entradas vivas
+        self.archivadas = [
+            Bitacora(
+                id=uuid.uuid4(), usuario=self.usuario, accion=f'Archivada {i}', ip='10.0.0.1',
+                modulo='pacientes' if i else 'usuarios', timestamp=datetime(2024, 1, 10 + i, tzinfo=dt_timezone.utc),
+                detalles={'cambios': {'nombre': ['a', 'b']}} if i == 2 else {},
+            )
+            for i in range(3)
+        ]
+        archivo.agregar(self.archivadas)
+        for i in range(2):
+            Bitacora.objects.create(usuario=self.usuario, accion=f'Viva {i}', ip='10.0.0.2', modulo='pacientes')
+
+    def listar(self, **params):
+        return self.client.get('/api/bitacora/', {'desde': '2023-12-01T00:00:00Z', **params})
+
+    def test_listado_mismo_formato_en_los_dos_niveles(self):
+        respuesta = self.listar()
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.data['count'], 5)
+        filas = respuesta.data['results']
+        self.assertEqual([f['archivado'] for f in filas], [False, False, True, True, True])
+        self.assertEqual({tuple(f) for f in filas}, {tuple(filas[0])})
+        self.assertEqual(filas[2]['accion'], 'Archivada 2')
+        self.assertEqual(filas[2]['usuario'], self.usuario.pk)
+        self.assertEqual(filas[2]['usuario_nombre'], filas[0]['usuario_nombre'])
+
+    def test_filtros_y_busqueda_en_el_archivo(self):
+        casos = [
+            ({'search': 'archivada'}, ['Archivada 2', 'Archivada 1', 'Archivada 0']),
+            ({'search': 'archivo@test Viva'}, ['Viva 1', 'Viva 0']),
+            ({'modulo': 'usuarios'}, ['Archivada 0']),
+            ({'campo': 'nombre'}, ['Archivada 2']),
+            ({'ip': '10.0.0.1', 'hasta': '2024-01-11T12:00:00Z'}, ['Archivada 1', 'Archivada 0']),
+        ]
+        for params, acciones in casos:
+            with self.subTest(params=params):
+                respuesta = self.listar(**params)
+                self.assertEqual([f['accion'] for f in respuesta.data['results']], acciones)
+                self.assertEqual(respuesta.data['count'], len(acciones))
+
+    def test_orden_distinto_se_rechaza(self):
+        self.assertEqual(self.listar(ordering='usuario').status_code, 400)
+        self.assertEqual(self.listar(ordering='-timestamp').status_code, 200)
+
+    def test_conteo_con_el_indice(self):
+        desde = datetime(2023, 12, 1, tzinfo=dt_timezone.utc)
+        with mock.patch.object(archivo, '_filas_mes', wraps=archivo._filas_mes) as filas_mes:
+            self.assertEqual(archivo.contar(desde=desde), 3)
+            filas_mes.assert_not_called()
+            # Un mes cortado por el rango o con filtros sí se recorre
+            self.assertEqual(archivo.contar(desde=desde, hasta=datetime(2024, 1, 11, tzinfo=dt_timezone.utc)), 2)
+            self.assertEqual(archivo.contar(desde=desde, modulo='usuarios'), 1)
+            self.assertEqual(filas_mes.call_count, 2)
+
+    def test_recontar_tras_archivado_repetido(self):
+        # Una corrida que se cortó antes de borrar vuelve a escribir las mismas entradas
+        archivo.agregar(self.archivadas)
+        self.assertEqual(archivo.leer_indice()['2024-01']['total'], 6)
+        self.assertEqual(len(list(archivo.leer())), 3)
+
+        self.assertEqual(archivo.recontar(), ['2024-01'])
+        self.assertEqual(archivo.leer_indice()['2024-01'], {
+            'archivo': 'bitacora-2024-01.jsonl.gz', 'total': 3, 'verificado': True,
+        })
+        self.assertEqual(archivo.contar(), 3)
+        self.assertEqual(archivo.recontar(), [])
+
+    def test_leer_sin_archivo_no_crea_directorio(self):
+        ajustes = override_settings(BITACORA_ARCHIVO_DIR=os.path.join(self.directorio, 'vacio'))
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.assertIsNone(archivo.limite())
+        self.assertFalse(os.path.exists(os.path.join(self.directorio, 'vacio')))
+
+
+class ParticionesBitacoraTests(TestCase):
+    """0003 particiona la tabla por mes solo en PostgreSQL; en SQLite queda una tabla común."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='particion@test.com', nombre='Parti', apellido='Cion')
+
+    def test_tabla_segun_el_motor(self):
+        self.assertEqual(es_particionada(), connection.vendor == 'postgresql')
+
+    def test_filas_van_a_su_particion(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Las particiones son solo de PostgreSQL')
+        ahora = timezone.now()
+        actual = Bitacora.objects.create(usuario=self.usuario, accion='Actual', ip='127.0.0.1', modulo='pacientes')
+        vieja = Bitacora.objects.create(
+            usuario=self.usuario, accion='Vieja', ip='127.0.0.1', modulo='pacientes',
+            timestamp=datetime(2000, 1, 1, tzinfo=dt_timezone.utc),
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT id, tableoid::regclass::text FROM a_bitacora_bitacora WHERE id IN (%s, %s)',
+                [actual.id, vieja.id],
+            )
+            tablas = dict(cursor.fetchall())
+        self.assertEqual(tablas[actual.id], nombre_particion(ahora.year, ahora.month))
+        self.assertEqual(tablas[vieja.id], 'a_bitacora_bitacora_default')
+
+
+class ResumenBitacoraTests(TestCase):
+    """El resumen cuenta por hora, módulo y usuario; reconstruir lo corrige y estadisticas lo lee."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(email='admin@test.com', nombre='Admin', apellido='Test')
+        cls.ana = Usuario.objects.create_user(email='ana@test.com', nombre='Ana', apellido='Pérez')
+        cls.beto = Usuario.objects.create_user(email='beto@test.com', nombre='Beto', apellido='Ruiz')
+        cls.base = datetime(2026, 3, 2, 10, tzinfo=dt_timezone.utc)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.admin)
+        for usuario, modulo, minutos in [
+            (self.ana, 'pacientes', 5), (self.ana, 'pacientes', 55), (self.ana, 'pacientes', 60),
+            (self.beto, 'usuarios', 30), (self.beto, None, 24 * 60 + 15),
+        ]:
+            self.registrar(usuario, modulo, self.base + timedelta(minutes=minutos))
+
+    def registrar(self, usuario, modulo, momento):
+        entrada = Bitacora(usuario=usuario, accion='Acción', ip='127.0.0.1', modulo=modulo, timestamp=momento)
+        with resumen.escritura([entrada]):
+            entrada.save(force_insert=True)
+            resumen.registrar_en_resumen([entrada])
+
+    def filas(self):
+        return sorted(
+            (fila.hora, fila.modulo, fila.usuario_id, fila.total) for fila in ResumenBitacora.objects.all()
+        )
+
+    def esperadas(self):
+        hora = lambda horas: self.base + timedelta(hours=horas)
+        return sorted([
+            (hora(0), 'pacientes', self.ana.pk, 2),
+            (hora(1), 'pacientes', self.ana.pk, 1),
+            (hora(0), 'usuarios', self.beto.pk, 1),
+            (hora(24), '', self.beto.pk, 1),
+        ])
+
+    def test_resumen_por_hora(self):
+        self.assertEqual(self.filas(), self.esperadas())
+
+    def test_reconstruir_corrige_el_resumen(self):
+        ResumenBitacora.objects.filter(modulo='usuarios').update(total=99)
+        ResumenBitacora.objects.filter(modulo='').delete()
+        archivadas = {(self.base, 'pacientes', self.ana.pk): 3}
+
+        dia = self.base.replace(hour=0)
+        self.assertEqual(resumen.reconstruir(dia, dia + timedelta(days=2), extra=archivadas), 8)
+        esperadas = [
+            (hora, modulo, usuario, total + 3 if (hora, modulo, usuario) in archivadas else total)
+            for hora, modulo, usuario, total in self.esperadas()
+        ]
+        self.assertEqual(self.filas(), sorted(esperadas))
+
+    def test_escritura_toma_el_bloqueo_de_sus_horas(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Los advisory locks son de PostgreSQL')
+        # Los bloqueos de setUp siguen tomados (la prueba entera es una transacción): otra hora
+        hora = self.base + timedelta(days=5)
+        entrada = Bitacora(usuario=self.ana, accion='Acción', ip='127.0.0.1', timestamp=hora + timedelta(minutes=7))
+        consulta = ("SELECT mode FROM pg_locks WHERE locktype = 'advisory' AND classid = %s AND objid = %s "
+                    "AND pid = pg_backend_pid()")
+        with resumen.escritura([entrada]), connection.cursor() as cursor:
+            cursor.execute(consulta, [resumen.BLOQUEO_RESUMEN, int(hora.timestamp()) // 3600])
+            self.assertEqual(cursor.fetchall(), [('ShareLock',)])
+            resumen.bloquear_horas([hora], exclusivo=True)
+            cursor.execute(consulta, [resumen.BLOQUEO_RESUMEN, int(hora.timestamp()) // 3600])
+            self.assertEqual(sorted(cursor.fetchall()), [('ExclusiveLock',), ('ShareLock',)])
+
+    def test_estadisticas(self):
+        parametros = {'desde': self.base.isoformat(), 'hasta': (self.base + timedelta(days=2)).isoformat()}
+        respuesta = self.client.get('/api/bitacora/estadisticas/', parametros)
+        self.assertEqual(respuesta.status_code, 200)
+        datos = respuesta.data
+        self.assertEqual(datos['total'], 5)
+        self.assertEqual(datos['por_modulo'], [
+            {'modulo': 'pacientes', 'total': 3}, {'modulo': None, 'total': 1}, {'modulo': 'usuarios', 'total': 1},
+        ])
+        self.assertEqual([(u['email'], u['nombre'], u['total']) for u in datos['por_usuario']], [
+            ('ana@test.com', 'Ana Pérez', 3), ('beto@test.com', 'Beto Ruiz', 2),
+        ])
+        self.assertEqual([f['total'] for f in datos['serie']], [3, 1, 1])
+
+        respuesta = self.client.get('/api/bitacora/estadisticas/', {**parametros, 'intervalo': 'dia', 'usuario': self.beto.pk})
+        self.assertEqual(respuesta.data['total'], 2)
+        self.assertEqual([f['total'] for f in respuesta.data['serie']], [1, 1])
+
+        self.assertEqual(self.client.get('/api/bitacora/estadisticas/', {'intervalo': 'semana'}).status_code, 400)
+
+
+class BitacoraMiddlewareTests(TestCase):
+    """Cada petición deja a lo sumo una entrada con todo lo que registraron las capas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='mw@test.com', nombre='Mid', apellido='Dle')
+
+    def peticion(self, vista, metodo='post', ruta='/api/prueba/'):
+        request = getattr(RequestFactory(), metodo)(ruta, REMOTE_ADDR='10.1.1.1')
+        request.user = AnonymousUser()
+        return BitacoraMiddleware(lambda r: vista(r))(request)
+
+    def test_hechos_en_una_sola_entrada(self):
+        def vista(request):
+            RegistroBitacora.registrar(self.usuario, 'Crear paciente', modulo='pacientes', detalles={'id': 1})
+            RegistroBitacora.registrar(self.usuario, 'Crear historial', modulo='historiales', detalles={'id': 2})
+            RegistroBitacora.registrar(self.usuario, 'Crear paciente')
+            return HttpResponse(status=201)
+
+        self.peticion(vista)
+        entrada = Bitacora.objects.get()
+        self.assertEqual(entrada.accion, 'Crear paciente; Crear historial')
+        self.assertEqual(entrada.usuario, self.usuario)
+        self.assertEqual(entrada.modulo, 'pacientes')
+        self.assertEqual(entrada.ip, '10.1.1.1')
+        self.assertEqual(entrada.detalles['eventos'], [{'id': 1}, {'id': 2}])
+        self.assertEqual((entrada.detalles['metodo'], entrada.detalles['ruta']), ('POST', '/api/prueba/'))
+
+    def test_respuestas_con_error_no_se_registran(self):
+        for estado in (400, 403, 404, 500):
+            def vista(request):
+                RegistroBitacora.registrar(self.usuario, 'Crear paciente', modulo='pacientes')
+                return HttpResponse(status=estado)
+
+            with self.subTest(estado=estado):
+                self.peticion(vista)
+                self.assertFalse(Bitacora.objects.exists())
+
+    def test_usuario_autenticado_por_jwt(self):
+        def vista(request):
+            # Como DRF al autenticar con JWT: request.user pasa a ser otro objeto
+            request.user = self.usuario
+            return HttpResponse(status=200)
+
+        with override_settings(BITACORA_REGISTRAR_JWT=False):
+            self.peticion(vista)
+        self.assertFalse(Bitacora.objects.exists())
+
+        self.peticion(vista)
+        self.assertEqual(Bitacora.objects.get().accion, 'POST en /api/prueba/')
+
+
+class ReglasBitacoraTests(TestCase):
+    """Gana la primera regla que coincide; las rutas que romperían la expresión combinada se rechazan."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='reglas@test.com', nombre='Reg', apellido='Las')
+
+    def test_primera_regla_que_coincide(self):
+        reglas = ReglasBitacora([
+            {'ruta': r'^/static/', 'accion': 'omitir'},
+            {'ruta': r'^/api/(pacientes|usuarios)/(\d+)/$', 'metodos': ['get'], 'accion': 'muestrear', 'n': 2},
+            {'modulos': ['historiales'], 'accion': 'agregar'},
+            {'ruta': r'^/api/', 'metodos': ['DELETE']},
+        ])
+        casos = [
+            (('GET', None, '/static/app.js'), 0),
+            (('GET', 'pacientes', '/api/usuarios/7/'), 1),
+            (('POST', None, '/api/usuarios/7/'), None),
+            (('POST', 'historiales', '/api/historiales/'), 2),
+            (('DELETE', 'historiales', '/api/historiales/1/'), 2),
+            (('DELETE', 'pacientes', '/api/pacientes/1/'), 3),
+            (('GET', None, '/api/usuarios/7/extra'), None),
+        ]
+        for peticion, indice in casos:
+            with self.subTest(peticion=peticion):
+                self.assertEqual(reglas.buscar(*peticion)[0], indice)
+        self.assertEqual(reglas.buscar('DELETE', None, '/api/x/')[1]['accion'], 'registrar')
+
+        muestreo = reglas.reglas[1]
+        self.assertEqual([reglas.muestrear(muestreo) for _ in range(4)], [True, False, True, False])
+
+    def test_rutas_rechazadas(self):
+        for ruta in [r'^/api/(?P<id>\d+)/$', r'^/api/(\w+)/\1/$', r'^(?P<a>x)(?P=a)$', r'^/api/(', r'/api/(?i)x']:
+            with self.subTest(ruta=ruta), self.assertRaises(ValueError):
+                ReglasBitacora([{'ruta': '^/ok/'}, {'ruta': ruta}])
+        # Una barra invertida escapada no es una referencia
+        self.assertEqual(ReglasBitacora([{'ruta': r'^/a\\1$'}]).buscar('GET', None, '/a\\1')[0], 0)
+
+    def test_anclas_solo_en_los_extremos(self):
+        # '^/a|^/b' no coincidiría nunca con /b dentro de la expresión combinada
+        for ruta in [r'^/api/a|^/api/b', r'/api/a$|/api/b', r'(^/api/a)', r'/a$/b']:
+            with self.subTest(ruta=ruta), self.assertRaisesMessage(ValueError, 'solo puede ir al'):
+                ReglasBitacora([{'ruta': ruta}])
+        # Escapadas, dentro de [...] o agrupadas sí valen
+        reglas = ReglasBitacora([
+            {'ruta': r'^/precio/\$[0-9^]+/$'},
+            {'ruta': r'^/lista/[$^]/$'},
+            {'ruta': r'^(?:/api/a|/api/b)/$', 'accion': 'omitir'},
+        ])
+        self.assertEqual(reglas.buscar('GET', None, '/precio/$5^/')[0], 0)
+        self.assertEqual(reglas.buscar('GET', None, '/lista/^/')[0], 1)
+        self.assertEqual(reglas.buscar('GET', None, '/api/b/')[0], 2)
+        self.assertEqual(reglas.buscar('GET', None, '/api/b/x')[0], None)
+
+    def test_agregador_cierra_el_minuto_sin_otra_peticion(self):
+        with mock.patch('a_bitacora.reglas.atexit.register'):
+            agregador = AgregadorBitacora()
+        entrada = {
+            'usuario': self.usuario, 'accion': 'Guardar respuesta', 'ip': '127.0.0.1', 'modulo': 'historiales',
+            'detalles': {'metodo': 'PUT', 'ruta': '/api/historiales/respuestas/1/'},
+        }
+        ahora = timezone.now().replace(second=10)
+        with mock.patch('a_bitacora.reglas.threading.Timer') as temporizador, \
+                mock.patch('a_bitacora.reglas.timezone.now', return_value=ahora):
+            for _ in range(3):
+                agregador.sumar(0, dict(entrada), 'respuesta-detail')
+            # Un solo temporizador, hasta pasado el minuto
+            temporizador.assert_called_once()
+            self.assertAlmostEqual(temporizador.call_args.args[0], 51, delta=1)
+            agregador.vaciar()
+        self.assertFalse(Bitacora.objects.exists())
+
+        # Vence el temporizador ya en el minuto siguiente (sin cerrar la conexión de la prueba)
+        with mock.patch('a_bitacora.reglas.timezone.now', return_value=ahora + timedelta(minutes=1)), \
+                mock.patch('a_bitacora.reglas.connection'):
+            temporizador.call_args.args[1]()
+        entrada = Bitacora.objects.get()
+        self.assertEqual(entrada.accion, '3 peticiones PUT en respuesta-detail')
+        self.assertEqual(entrada.detalles['agregado'], 3)
+        self.assertEqual(entrada.detalles['acciones'], ['Guardar respuesta'])
+        self.assertIsNone(agregador._temporizador)
+
+
+class CambiosBitacoraTests(TestCase):
+    """Una actualización guarda {campo: [anterior, nuevo]} y se puede buscar por campo (?campo=)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = Usuario.objects.create_superuser(email='admin@test.com', nombre='Admin', apellido='Test')
+        cls.usuario = Usuario.objects.create_user(email='medico@test.com', nombre='Med', apellido='Ico')
+        cls.cardiologia = Especialidad.objects.create(nombre='Cardiología', descripcion='-')
+        cls.neurologia = Especialidad.objects.create(nombre='Neurología', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Eva', apellido='Lara', ci='741', fecha_nacimiento=date(1990, 1, 1), sexo='F', asegurado=True,
+        )
+        cls.historial = HistorialClinico.objects.create(
+            paciente=cls.paciente, usuario=cls.usuario, especialidad=cls.cardiologia,
+            motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={'peso': 70, 'talla': 170},
+        )
+
+    def test_fecha_fk_y_json(self):
+        titular = Pacientes.objects.create(
+            nombre='Iván', apellido='Lara', ci='742', fecha_nacimiento=date(1960, 5, 5), sexo='M', asegurado=True,
+        )
+        antes = instantanea(self.paciente)
+        self.paciente.fecha_nacimiento = date(1991, 2, 3)
+        self.paciente.beneficiario_de = titular
+        cambios = diferencias(antes, instantanea(self.paciente))
+        self.assertEqual(cambios, {
+            'fecha_nacimiento': ['1990-01-01', '1991-02-03'],
+            'beneficiario_de': [None, str(titular.pk)],
+        })
+        self.assertEqual(json.loads(json.dumps(cambios)), cambios)
+
+        # Un JSONField modificado en sitio se detecta: la instantánea es una copia
+        antes = instantanea(self.historial)
+        self.historial.signos_vitales['peso'] = 80
+        self.assertEqual(diferencias(antes, instantanea(self.historial)), {
+            'signos_vitales': [{'peso': 70, 'talla': 170}, {'peso': 80, 'talla': 170}],
+        })
+
+    def test_actualizacion_y_filtro_por_campo(self):
+        client = APIClient()
+        client.force_authenticate(self.usuario)
+        respuesta = client.patch(f'/api/historiales/historiales/{self.historial.pk}/', {
+            'especialidad': self.neurologia.pk,
+            'signos_vitales': {'peso': 72, 'talla': 170},
+            'diagnostico': 'x' * 300,
+            'motivo_consulta': 'Control',
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200)
+
+        entrada = Bitacora.objects.get()
+        self.assertEqual((entrada.objeto_tipo, entrada.objeto_id), ('a_historiales.historialclinico', str(self.historial.pk)))
+        cambios = entrada.detalles['cambios']
+        self.assertEqual(sorted(cambios), ['diagnostico', 'especialidad', 'signos_vitales'])
+        self.assertEqual(cambios['especialidad'], [self.cardiologia.pk, self.neurologia.pk])
+        self.assertEqual(cambios['signos_vitales'], [{'peso': 70, 'talla': 170}, {'peso': 72, 'talla': 170}])
+        self.assertEqual(cambios['diagnostico'][0], '-')
+        self.assertEqual(cambios['diagnostico'][1]['longitud'], 300)
+        self.assertEqual(len(cambios['diagnostico'][1]['extracto']), 201)
+
+        Bitacora.objects.create(
+            usuario=self.usuario, accion='Otra', ip='127.0.0.1', modulo='historiales',
+            detalles={'cambios': {'motivo_consulta': ['a', 'b']}},
+        )
+        client.force_authenticate(self.admin)
+        for campo, esperadas in [('especialidad', [entrada.pk]), ('fuente', [])]:
+            with self.subTest(campo=campo):
+                respuesta = client.get('/api/bitacora/', {'campo': campo})
+                self.assertEqual([uuid.UUID(str(f['id'])) for f in respuesta.data['results']], esperadas)
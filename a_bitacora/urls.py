@@ -1,11 +1,12 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BitacoraViewSet, exportar_bitacora_pdf
+from .views import BitacoraViewSet, ReporteBitacoraPDFAPIView, ReporteBitacoraDescargaAPIView
 
 router = DefaultRouter()
 router.register(r'', BitacoraViewSet)
 
 urlpatterns = [
+    path('reportes/pdf/', ReporteBitacoraPDFAPIView.as_view(), name='reporte_bitacora_pdf'),
+    path('reportes/pdf/<uuid:reporte_id>/', ReporteBitacoraDescargaAPIView.as_view(), name='reporte_bitacora_descarga'),
     path('', include(router.urls)),
-    #path('bitacora/exportar-pdf/', exportar_bitacora_pdf, name='exportar_bitacora_pdf'),
-]
\ No newline at end of file
+]
@@ -1,18 +1,53 @@
+from django.conf import settings
 from .models import Bitacora
-from django.utils import timezone
+from .buffer import buffer_bitacora
+from .contexto import obtener_contexto
+from .resumen import escritura, registrar_en_resumen
+from .cambios import objeto_de
 
 class RegistroBitacora:
     @staticmethod
     def registrar(usuario, accion, ip=None, modulo=None, detalles=None):
+        # Dentro de una petición la acción se suma al contexto y BitacoraMiddleware
+        # escribe una sola entrada al terminar la respuesta
+        contexto = obtener_contexto()
+        if contexto is not None:
+            contexto.agregar(accion, usuario=usuario, modulo=modulo, detalles=detalles)
+            return True
+
+        return RegistroBitacora.escribir(usuario, accion, ip=ip, modulo=modulo, detalles=detalles)
+
+    @staticmethod
+    def escribir(usuario, accion, ip=None, modulo=None, detalles=None):
+        # En modo 'buffer' la entrada se encola y la inserta el hilo de buffer_bitacora
+        if getattr(settings, 'BITACORA_MODO', 'sincrono') == 'buffer':
+            try:
+                return buffer_bitacora.encolar(
+                    usuario=usuario,
+                    accion=accion,
+                    ip=ip,
+                    modulo=modulo,
+                    detalles=detalles,
+                )
+            except Exception as e:
+                print(f"Error al encolar en bitacora: {e}")
+                return False
+
         try:
-            Bitacora.objects.create(
+            objeto_tipo, objeto_id = objeto_de(detalles)
+            entrada = Bitacora(
                 usuario=usuario,
                 accion=accion,
                 ip=ip,
                 modulo=modulo,
                 detalles=detalles,
+                objeto_tipo=objeto_tipo,
+                objeto_id=objeto_id,
             )
+            with escritura([entrada]):
+                entrada.save(force_insert=True)
+                registrar_en_resumen([entrada])
             return True
         except Exception as e:
             print(f"Error al registrar en bitacora: {e}")
-            return False
\ No newline at end of file
+            return False
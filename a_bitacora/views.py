@@ -1,50 +1,216 @@
+import os
+import uuid
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
 from django.shortcuts import render
-from rest_framework import viewsets, filters
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import viewsets, filters, status
+from rest_framework.decorators import action
 from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.utils.urls import replace_query_param, remove_query_param
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import Bitacora
-from .serializers import BitacoraSerializer
+from .models import Bitacora, ResumenBitacora
+from .serializers import BitacoraSerializer, BitacoraListSerializer
+from .pagination import BitacoraCursorPagination
+from .filters import BitacoraFilter, ResumenBitacoraFilter
+from .reportes import generar_pdf_bitacora, encolar_reporte, estado_reporte, iterar_bitacora
+from . import archivo
+from . import resumen
 
-from django.http import HttpResponse
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import A4
+from django.http import FileResponse, StreamingHttpResponse
 
 class BitacoraViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Bitacora.objects.all().order_by('-timestamp')
     serializer_class = BitacoraSerializer
     permission_classes = [IsAdminUser]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['usuario', 'ip', 'timestamp']
+    filterset_class = BitacoraFilter
     search_fields = ['accion', 'usuario__email', 'usuario__nombre']
     ordering_fields = ['timestamp', 'usuario']
 
-def exportar_bitacora_pdf(request):
-        response = HttpResponse(content_type='application/pdf')
-        response['Content-Disposition'] = 'attachment; filename="bitacora.pdf"'
+    def get_queryset(self):
+        # El listado usa la representación compacta; el usuario completo solo en el detalle
+        if self.action == 'list':
+            return super().get_queryset().select_related('usuario')
+        return super().get_queryset().select_related('usuario__rol', 'usuario__especialidad', 'usuario__establecimiento')
+
+    def get_serializer_class(self):
+        if self.action == 'list':
+            return BitacoraListSerializer
+        return BitacoraSerializer
+
+    @property
+    def paginator(self):
+        # ?cursor=... o ?paginacion=cursor usan paginación keyset en vez de page/OFFSET
+        if not hasattr(self, '_paginator'):
+            params = self.request.query_params
+            if 'cursor' in params or params.get('paginacion') == 'cursor':
+                self._paginator = BitacoraCursorPagination()
+            elif self.pagination_class is None:
+                self._paginator = None
+            else:
+                self._paginator = self.pagination_class()
+        return self._paginator
+
+    def list(self, request, *args, **kwargs):
+        # Si ?desde= llega a meses que ya se archivaron, se combina la tabla con el archivo.
+        # Sin ?desde= (o con uno posterior a archivo.limite()) el listado es solo la tabla
+        # viva: lo archivado no aparece salvo que se pida explícitamente con ?desde=, así
+        # un listado común no paga la lectura de los JSONL comprimidos ni pierde ?ordering=.
+        filtro = BitacoraFilter(request.query_params, queryset=Bitacora.objects.none())
+        desde = filtro.form.cleaned_data.get('desde') if filtro.is_valid() else None
+        limite = archivo.limite()
+        if desde is None or limite is None or desde >= limite:
+            return super().list(request, *args, **kwargs)
+        return self.listar_con_archivo(request, filtro.form.cleaned_data)
+
+    def listar_con_archivo(self, request, filtros):
+        """
+        Página que mezcla entradas vivas y archivadas, de la más reciente a la más antigua.
+
+        Al archivo se le aplican los mismos filtros y ?search= que a la tabla;
+        solo se puede ordenar por -timestamp (el orden del archivo). Se pagina
+        siempre por número de página.
+        """
+        orden = request.query_params.get('ordering', '').strip()
+        if orden not in ('', '-timestamp'):
+            return Response(
+                {'ordering': 'Con entradas archivadas solo se puede ordenar por -timestamp'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        queryset = self.filter_queryset(self.get_queryset())
+        usuario = filtros.get('usuario')
+        filtros_archivo = {
+            'desde': filtros.get('desde'),
+            'hasta': filtros.get('hasta'),
+            'usuario': usuario.pk if usuario else None,
+            'modulo': filtros.get('modulo') or None,
+            'ip': filtros.get('ip') or None,
+            'timestamp': filtros.get('timestamp'),
+            'objeto_tipo': filtros.get('objeto_tipo') or None,
+            'objeto_id': filtros.get('objeto_id') or None,
+            'campo': filtros.get('campo') or None,
+            'buscar': filters.SearchFilter().get_search_terms(request),
+        }
+
+        page_size = settings.REST_FRAMEWORK.get('PAGE_SIZE', 10)
+        try:
+            pagina = max(1, int(request.query_params.get('page', 1)))
+        except ValueError:
+            pagina = 1
+        inicio = (pagina - 1) * page_size
+
+        vivas = ((b.timestamp, b) for b in iterar_bitacora(queryset))
+        archivadas = ((f['timestamp'], f) for f in archivo.leer(**filtros_archivo))
+        filas = [fila for _, fila in islice(archivo.combinar(vivas, archivadas), inicio, inicio + page_size)]
+        # El archivo cuenta con los totales por mes del índice; solo recorre los meses que no entran enteros
+        total = queryset.count() + archivo.contar(**filtros_archivo)
+
+        resultados = []
+        for fila in filas:
+            archivada = not isinstance(fila, Bitacora)
+            datos = self.get_serializer(archivo.instancia(fila) if archivada else fila).data
+            resultados.append({**datos, 'archivado': archivada})
+
+        url = request.build_absolute_uri()
+        siguiente = replace_query_param(url, 'page', pagina + 1) if inicio + page_size < total else None
+        anterior = None
+        if pagina > 1:
+            anterior = replace_query_param(url, 'page', pagina - 1) if pagina > 2 else remove_query_param(url, 'page')
 
-        p = canvas.Canvas(response, pagesize=A4)
-        width, height = A4
-        y = height - 50  # Margen superior
+        return Response({
+            'count': total,
+            'next': siguiente,
+            'previous': anterior,
+            'results': resultados,
+        })
 
-        p.setFont("Helvetica-Bold", 16)
-        p.drawString(200, y, "REPORTE DE BITÁCORA")
-        y -= 30
+    @action(detail=False, methods=['get'])
+    def estadisticas(self, request):
+        """
+        Actividad por módulo, por usuario y por hora (o ?intervalo=dia), leída de ResumenBitacora.
 
-        p.setFont("Helvetica", 10)
+        Filtros: desde, hasta, usuario, modulo. Sin ?desde= se muestran los últimos 7 días.
+        """
+        params = request.query_params.copy()
+        if not params.get('desde'):
+            params['desde'] = (timezone.now() - timedelta(days=7)).isoformat()
+        filtro = ResumenBitacoraFilter(params, queryset=ResumenBitacora.objects.all())
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
 
-        bitacoras = Bitacora.objects.all().order_by('-timestamp')[:50]  # últimos 50 registros
+        intervalo = params.get('intervalo', 'hora')
+        if intervalo not in ('hora', 'dia'):
+            return Response({'intervalo': 'Debe ser "hora" o "dia"'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            top = min(max(1, int(params.get('top', 10))), 100)
+        except ValueError:
+            top = 10
 
-        for b in bitacoras:
-            linea = f"{b.timestamp.strftime('%Y-%m-%d %H:%M:%S')} - {b.usuario.nombre} {b.usuario.apellido} - {b.accion} - IP: {b.ip}"
-            p.drawString(30, y, linea)
-            y -= 15
-            if y < 50:
-                p.showPage()
-                p.setFont("Helvetica", 10)
-                y = height - 50
+        datos = resumen.estadisticas(filtro.qs, intervalo=intervalo, top=top)
+        return Response({
+            'desde': filtro.form.cleaned_data.get('desde'),
+            'hasta': filtro.form.cleaned_data.get('hasta'),
+            'intervalo': intervalo,
+            **datos,
+        })
 
-        p.showPage()
-        p.save()
+class ReporteBitacoraPDFAPIView(APIView):
+    """
+    Reporte PDF de la bitácora con filtros desde, hasta, usuario y modulo.
+
+    Hasta BITACORA_REPORTE_LIMITE_SINCRONO entradas el PDF se envía en la misma
+    respuesta, página por página. Más que eso (o con ?asincrono=true) se genera
+    en segundo plano y se responde 202 con la URL de descarga.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        filtro = BitacoraFilter(request.query_params, queryset=Bitacora.objects.all())
+        if not filtro.is_valid():
+            return Response(filtro.errors, status=status.HTTP_400_BAD_REQUEST)
+        queryset = filtro.qs
+
+        limite = getattr(settings, 'BITACORA_REPORTE_LIMITE_SINCRONO', 20000)
+        asincrono = request.query_params.get('asincrono') == 'true'
+        if not asincrono:
+            # Contar solo hasta pasar el límite, no toda la tabla
+            asincrono = queryset.order_by()[:limite + 1].count() > limite
+
+        if asincrono:
+            reporte_id = uuid.uuid4()
+            encolar_reporte(reporte_id, queryset)
+            return Response({
+                'id': reporte_id,
+                'estado': 'en_proceso',
+                'url': request.build_absolute_uri(reverse('reporte_bitacora_descarga', args=[reporte_id])),
+            }, status=status.HTTP_202_ACCEPTED)
+
+        response = StreamingHttpResponse(generar_pdf_bitacora(queryset), content_type='application/pdf')
+        response['Content-Disposition'] = 'attachment; filename="bitacora.pdf"'
         return response
 
+class ReporteBitacoraDescargaAPIView(APIView):
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, reporte_id):
+        estado, detalle = estado_reporte(reporte_id)
+
+        if estado == 'listo':
+            return FileResponse(open(detalle, 'rb'), as_attachment=True,
+                                filename='bitacora.pdf', content_type='application/pdf')
+
+        if estado == 'en_proceso':
+            return Response({'id': reporte_id, 'estado': 'en_proceso'}, status=status.HTTP_202_ACCEPTED)
+
+        if estado == 'error':
+            return Response({'id': reporte_id, 'estado': 'error', 'detail': detalle},
+                            status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+        return Response({'detail': 'Reporte no encontrado'}, status=status.HTTP_404_NOT_FOUND)
@@ -0,0 +1,111 @@
+"""
+Almacenamiento por contenido de los documentos adjuntos.
+
+Cada archivo se guarda una sola vez con su SHA-256 como nombre, repartido en
+subdirectorios por los primeros caracteres del hash:
+
+    MEDIA_ROOT/blobs/ab/cd/abcd...
+
+Si dos documentos tienen el mismo contenido apuntan al mismo archivo (y a la
+misma fila de Blob). Un blob sin documentos se borra con recolectar_blobs;
+deduplicar_media pasa a este esquema los archivos que ya estaban en MEDIA_ROOT.
+"""
+import hashlib
+import os
+import re
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+PREFIJO = 'blobs'
+BLOQUE = 64 * 1024
+PATRON_BLOB = re.compile(rf'^{PREFIJO}/[0-9a-f]{{2}}/[0-9a-f]{{2}}/([0-9a-f]{{64}})$')
+
+
+def nombre_blob(sha256):
+    return f'{PREFIJO}/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+
+
+def sha256_de_nombre(nombre):
+    """Hash del blob si nombre es una ruta de blob, o None (archivos anteriores al esquema)."""
+    coincidencia = PATRON_BLOB.match(nombre or '')
+    return coincidencia.group(1) if coincidencia else None
+
+
+def sha256_de_archivo(ruta):
+    sha = hashlib.sha256()
+    with open(ruta, 'rb') as archivo:
+        for bloque in iter(lambda: archivo.read(BLOQUE), b''):
+            sha.update(bloque)
+    return sha.hexdigest()
+
+
+@deconstructible
+class AlmacenamientoContenido(FileSystemStorage):
+    """
+    FileSystemStorage que ignora el nombre pedido y guarda por SHA-256.
+
+    Si el blob ya existe no se escribe de nuevo; solo se actualiza su fecha de
+    modificación, que recolectar_blobs usa para no borrar uno recién reutilizado.
+    """
+
+    def _save(self, name, content):
+        # Archivos ya en disco (subidas por partes, subidas temporales de Django): se mueven
+        if hasattr(content, 'temporary_file_path'):
+            temporal = content.temporary_file_path()
+            sha256 = getattr(content, 'sha256', None) or sha256_de_archivo(temporal)
+            destino = nombre_blob(sha256)
+            if not self.enlazar(temporal, destino, mover=True):
+                self._tocar(destino)
+            return destino
+
+        # El resto se copia a un temporal junto a los blobs calculando el hash en la misma pasada
+        os.makedirs(self.path(PREFIJO), exist_ok=True)
+        sha = hashlib.sha256()
+        descriptor, temporal = tempfile.mkstemp(dir=self.path(PREFIJO), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as salida:
+                for bloque in content.chunks():
+                    salida.write(bloque)
+                    sha.update(bloque)
+            destino = nombre_blob(sha.hexdigest())
+            if not self.enlazar(temporal, destino, mover=False):
+                self._tocar(destino)
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return destino
+
+    def enlazar(self, origen, destino, mover):
+        """Pone origen en destino si todavía no existe. Devuelve False si ya existía (duplicado)."""
+        ruta = self.path(destino)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        try:
+            if mover:
+                file_move_safe(origen, ruta, allow_overwrite=False)
+            else:
+                # link falla si otro proceso ya guardó el mismo contenido: no hay carrera
+                os.link(origen, ruta)
+        except FileExistsError:
+            return False
+        if self.file_permissions_mode is not None:
+            os.chmod(ruta, self.file_permissions_mode)
+        # Mover o enlazar conserva la fecha del origen; recolectar_blobs necesita la de ahora
+        self._tocar(destino)
+        return True
+
+    def _tocar(self, nombre):
+        try:
+            os.utime(self.path(nombre))
+        except FileNotFoundError:
+            pass
+
+    def get_available_name(self, name, max_length=None):
+        # El nombre final lo decide el contenido; un blob existente se reutiliza
+        return name
+
+
+def almacenamiento_documentos():
+    return AlmacenamientoContenido()
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class AHistorialesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'a_historiales'
+
+    def ready(self):
+        from . import signals  # noqa: F401
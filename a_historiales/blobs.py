@@ -0,0 +1,153 @@
+"""
+Mantenimiento de los blobs de documentos adjuntos (ver almacenamiento.py).
+
+- deduplicar(): pasa los documentos guardados con su nombre original en
+  MEDIA_ROOT al esquema por contenido; los archivos repetidos quedan en uno.
+- recolectar(): borra los blobs que ya no usa ningún documento, y los archivos
+  de blobs/ que quedaron sin fila (por ejemplo, un documento que falló al
+  crearse después de mover su archivo).
+"""
+import os
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models.deletion import ProtectedError
+from django.utils import timezone
+
+from .almacenamiento import PREFIJO, AlmacenamientoContenido, nombre_blob, sha256_de_archivo, sha256_de_nombre
+from .models import Blob, DocumentoAdjunto
+
+
+def almacenamiento():
+    return DocumentoAdjunto._meta.get_field('archivo').storage
+
+
+def deduplicar(simular=False, progreso=None):
+    """
+    Mueve cada archivo anterior a su blob y apunta el documento a él. Se puede
+    interrumpir y volver a correr: solo toma documentos sin blob.
+    """
+    destino_almacenamiento = almacenamiento()
+    if not isinstance(destino_almacenamiento, AlmacenamientoContenido):
+        raise RuntimeError('DocumentoAdjunto.archivo no usa AlmacenamientoContenido')
+
+    resultado = {'documentos': 0, 'duplicados': 0, 'bytes_liberados': 0, 'faltantes': 0}
+    vistos = set()
+    pendientes = DocumentoAdjunto.objects.filter(blob__isnull=True).exclude(archivo='').order_by('pk')
+    for documento in pendientes.only('id', 'archivo', 'nombre').iterator(chunk_size=500):
+        anterior = documento.archivo.name
+        ruta = destino_almacenamiento.path(anterior)
+        if not os.path.exists(ruta):
+            resultado['faltantes'] += 1
+            if progreso:
+                progreso(f'Falta el archivo de {documento.pk}: {anterior}')
+            continue
+
+        sha256 = sha256_de_archivo(ruta)
+        tamano = os.path.getsize(ruta)
+        destino = nombre_blob(sha256)
+        resultado['documentos'] += 1
+        repetido = sha256 in vistos or os.path.exists(destino_almacenamiento.path(destino))
+        vistos.add(sha256)
+
+        if not simular:
+            # Enlace duro: si se corta aquí, el archivo original sigue en su lugar
+            destino_almacenamiento.enlazar(ruta, destino, mover=False)
+            with transaction.atomic():
+                blob, _ = Blob.objects.get_or_create(sha256=sha256, defaults={'tamano': tamano})
+                DocumentoAdjunto.objects.filter(pk=documento.pk).update(
+                    archivo=destino, blob=blob, nombre=documento.nombre or os.path.basename(anterior)[:255],
+                )
+            # Otro documento podría seguir apuntando al mismo nombre anterior
+            if not DocumentoAdjunto.objects.filter(archivo=anterior).exists():
+                os.remove(ruta)
+
+        if repetido:
+            resultado['duplicados'] += 1
+            resultado['bytes_liberados'] += tamano
+    return resultado
+
+
+def recolectar(gracia_horas=24, lote=500, simular=False):
+    """
+    Borra los blobs sin documentos creados hace más de gracia_horas, y sus archivos.
+
+    Un archivo reutilizado hace poco (el almacenamiento actualiza su fecha al
+    encontrar un duplicado) no se borra aunque su fila ya no esté: la vuelve a
+    crear el documento que lo está guardando. Si no la crea, queda como archivo
+    sin fila y se borra en una corrida posterior (ver _barrer_archivos).
+    Devuelve la cantidad de blobs borrados (filas y archivos sin fila).
+    """
+    limite = timezone.now() - timedelta(hours=gracia_horas)
+    huerfanos = list(
+        Blob.objects.filter(documentos__isnull=True, creado__lt=limite).values_list('sha256', flat=True)
+    )
+
+    destino_almacenamiento = almacenamiento()
+    borrados = len(huerfanos) if simular else 0
+    for i in range(0, 0 if simular else len(huerfanos), lote):
+        for sha256 in _borrar_filas(huerfanos[i:i + lote]):
+            ruta = destino_almacenamiento.path(nombre_blob(sha256))
+            try:
+                if os.path.getmtime(ruta) < limite.timestamp():
+                    os.remove(ruta)
+            except FileNotFoundError:
+                pass
+            borrados += 1
+    return borrados + _barrer_archivos(destino_almacenamiento, limite, lote, simular)
+
+
+def _barrer_archivos(destino_almacenamiento, limite, lote, simular):
+    """Borra los archivos de blobs/ sin fila de Blob (y los .tmp abandonados) sin tocar desde limite."""
+    raiz = destino_almacenamiento.path(PREFIJO)
+    viejos = {}
+    for directorio, _, nombres in os.walk(raiz):
+        for nombre in nombres:
+            ruta = os.path.join(directorio, nombre)
+            try:
+                if os.path.getmtime(ruta) >= limite.timestamp():
+                    continue
+            except FileNotFoundError:
+                continue
+            sha256 = sha256_de_nombre(os.path.relpath(ruta, destino_almacenamiento.location).replace(os.sep, '/'))
+            if sha256 is not None:
+                viejos[sha256] = ruta
+            elif nombre.endswith('.tmp') and directorio == raiz:
+                # Copia a medio hacer de AlmacenamientoContenido._save
+                if not simular:
+                    os.remove(ruta)
+
+    borrados = 0
+    shas = list(viejos)
+    for i in range(0, len(shas), lote):
+        grupo = shas[i:i + lote]
+        con_fila = set(Blob.objects.filter(sha256__in=grupo).values_list('sha256', flat=True))
+        for sha256 in grupo:
+            if sha256 in con_fila:
+                continue
+            borrados += 1
+            if not simular:
+                try:
+                    os.remove(viejos[sha256])
+                except FileNotFoundError:
+                    pass
+    return borrados
+
+
+def _borrar_filas(shas):
+    """Borra las filas que siguen sin documentos y devuelve sus hashes."""
+    try:
+        with transaction.atomic():
+            Blob.objects.filter(sha256__in=shas, documentos__isnull=True).delete()
+        return shas
+    except ProtectedError:
+        # Alguno ganó un documento mientras tanto: se prueban de a uno
+        borrados = []
+        for sha256 in shas:
+            try:
+                with transaction.atomic():
+                    if Blob.objects.filter(sha256=sha256, documentos__isnull=True).delete()[0]:
+                        borrados.append(sha256)
+            except ProtectedError:
+                pass
+        return borrados
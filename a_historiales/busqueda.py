@@ -0,0 +1,150 @@
+"""
+Búsqueda de texto completo en historiales clínicos (?q= en /historiales/).
+
+- PostgreSQL: columna generada `busqueda` (tsvector con la configuración
+  'spanish': sin acentos, con raíces, "diabético" encuentra "diabetes") y un
+  índice GIN; la base la mantiene al escribir. Pesos: diagnóstico A, motivo
+  de consulta B, fuente C, confiabilidad D. La consulta usa
+  websearch_to_tsquery ("frases", OR, -excluir).
+- SQLite (desarrollo y tests): tabla FTS5 historial_busqueda sin acentos,
+  mantenida con triggers. No hay raíces en español: cada término busca por
+  prefijo. Cuando una migración reconstruye la tabla de historiales SQLite
+  pierde los triggers; post_migrate los vuelve a crear (instalar_sqlite).
+
+La migración 0012 crea una u otra según el motor.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, CharField, FloatField
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+
+from .models import HistorialClinico
+
+TABLA = HistorialClinico._meta.db_table
+TABLA_FTS = 'historial_busqueda'
+COLUMNAS = 'motivo_consulta, diagnostico, fuente, confiabilidad'
+
+# La base marca las coincidencias con caracteres de uso privado, no con <mark>: el texto del
+# historial todavía no está escapado y se escapa en resaltar() antes de poner las etiquetas
+INICIO_MARCA, FIN_MARCA = '\ue000', '\ue001'
+RESALTADO_PG = f"StartSel={INICIO_MARCA}, StopSel={FIN_MARCA}, MaxFragments=2, MaxWords=20, MinWords=5"
+
+# Pesos de bm25() por columna de historial_busqueda (historial_id no se indexa)
+PESOS_FTS = '0, 2.0, 4.0, 1.0, 0.5'
+
+TERMINO = re.compile(r'\w+', re.UNICODE)
+
+_NUEVOS = 'NEW.id, NEW.motivo_consulta, NEW.diagnostico, NEW.fuente, NEW.confiabilidad'
+TRIGGERS_SQLITE = {
+    f'{TABLA_FTS}_insert': (
+        f'AFTER INSERT ON {TABLA} BEGIN '
+        f'INSERT INTO {TABLA_FTS} (historial_id, {COLUMNAS}) VALUES ({_NUEVOS}); END'
+    ),
+    f'{TABLA_FTS}_update': (
+        f'AFTER UPDATE OF id, {COLUMNAS} ON {TABLA} BEGIN '
+        f'DELETE FROM {TABLA_FTS} WHERE historial_id = OLD.id; '
+        f'INSERT INTO {TABLA_FTS} (historial_id, {COLUMNAS}) VALUES ({_NUEVOS}); END'
+    ),
+    f'{TABLA_FTS}_delete': (
+        f'AFTER DELETE ON {TABLA} BEGIN DELETE FROM {TABLA_FTS} WHERE historial_id = OLD.id; END'
+    ),
+}
+
+
+def instalar_sqlite(cursor):
+    """Crea la tabla FTS5 y los triggers que falten; si faltaba alguno, vuelve a indexar todo."""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [TABLA])
+    existentes = {fila[0] for fila in cursor.fetchall()}
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {TABLA_FTS} USING fts5("
+        f"historial_id UNINDEXED, {COLUMNAS}, tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    for nombre, definicion in TRIGGERS_SQLITE.items():
+        cursor.execute(f'CREATE TRIGGER IF NOT EXISTS {nombre} {definicion}')
+    if set(TRIGGERS_SQLITE) - existentes:
+        cursor.execute(f'DELETE FROM {TABLA_FTS}')
+        cursor.execute(f'INSERT INTO {TABLA_FTS} (historial_id, {COLUMNAS}) SELECT id, {COLUMNAS} FROM {TABLA}')
+        return True
+    return False
+
+
+def borrar_sqlite(cursor):
+    for nombre in TRIGGERS_SQLITE:
+        cursor.execute(f'DROP TRIGGER IF EXISTS {nombre}')
+    cursor.execute(f'DROP TABLE IF EXISTS {TABLA_FTS}')
+
+
+def consulta_fts5(q):
+    """Términos de q como consulta FTS5: todos deben aparecer, cada uno como prefijo."""
+    return ' '.join(f'"{t}"*' for t in TERMINO.findall(q))
+
+
+def buscar(queryset, q):
+    """
+    Historiales de queryset que coinciden con q, del más al menos relevante.
+
+    Cada uno trae `rango` y `resaltado_diagnostico` / `resaltado_motivo`
+    (fragmentos en texto plano; resaltar() los pasa a HTML con <mark>).
+    """
+    if connection.vendor == 'postgresql':
+        return _buscar_postgresql(queryset, q)
+    if connection.vendor == 'sqlite':
+        return _buscar_sqlite(queryset, q)
+    raise NotImplementedError(f"Búsqueda de texto completo no disponible en {connection.vendor}")
+
+
+def _buscar_postgresql(queryset, q):
+    # ts_rank y no ts_rank_cd: con términos frecuentes (cientos de miles de coincidencias) cuesta un tercio.
+    # ts_headline se evalúa solo para las filas de la página.
+    consulta = "websearch_to_tsquery('spanish', %s)"
+    return (
+        queryset
+        .filter(RawSQL(f'"{TABLA}"."busqueda" @@ {consulta}', [q], output_field=BooleanField()))
+        .annotate(
+            rango=RawSQL(f'ts_rank("{TABLA}"."busqueda", {consulta})', [q], output_field=FloatField()),
+            resaltado_diagnostico=RawSQL(
+                f"ts_headline('spanish', \"{TABLA}\".\"diagnostico\", {consulta}, %s)", [q, RESALTADO_PG],
+                output_field=CharField(),
+            ),
+            resaltado_motivo=RawSQL(
+                f"ts_headline('spanish', \"{TABLA}\".\"motivo_consulta\", {consulta}, %s)", [q, RESALTADO_PG],
+                output_field=CharField(),
+            ),
+        )
+        .order_by('-rango', '-fecha', '-id')
+    )
+
+
+def _buscar_sqlite(queryset, q):
+    consulta = consulta_fts5(q)
+    if not consulta:
+        return queryset.none()
+    # Subconsultas correlacionadas: suficiente para desarrollo y tests
+    coincide = f'{TABLA_FTS} MATCH %s AND {TABLA_FTS}.historial_id = "{TABLA}"."id"'
+    return (
+        queryset
+        .filter(id__in=RawSQL(f'SELECT historial_id FROM {TABLA_FTS} WHERE {TABLA_FTS} MATCH %s', [consulta]))
+        .annotate(
+            # bm25() es menor cuanto más relevante
+            rango=RawSQL(f'SELECT -bm25({TABLA_FTS}, {PESOS_FTS}) FROM {TABLA_FTS} WHERE {coincide}',
+                         [consulta], output_field=FloatField()),
+            resaltado_diagnostico=RawSQL(
+                f"SELECT snippet({TABLA_FTS}, 2, %s, %s, '…', 20) FROM {TABLA_FTS} WHERE {coincide}",
+                [INICIO_MARCA, FIN_MARCA, consulta], output_field=CharField(),
+            ),
+            resaltado_motivo=RawSQL(
+                f"SELECT snippet({TABLA_FTS}, 1, %s, %s, '…', 20) FROM {TABLA_FTS} WHERE {coincide}",
+                [INICIO_MARCA, FIN_MARCA, consulta], output_field=CharField(),
+            ),
+        )
+        .order_by('-rango', '-fecha', '-id')
+    )
+
+
+def resaltar(fragmento):
+    """Fragmento de buscar() como HTML: el texto escapado y las coincidencias entre <mark></mark>."""
+    if fragmento is None:
+        return None
+    return str(escape(fragmento)).replace(INICIO_MARCA, '<mark>').replace(FIN_MARCA, '</mark>')
@@ -0,0 +1,135 @@
+"""
+Respuestas de descarga de documentos adjuntos.
+
+- ETag (el SHA-256 del blob, o tamaño + fecha para archivos anteriores) y
+  Last-Modified; If-None-Match / If-Modified-Since responden 304.
+- Range de un solo tramo (206), con If-Range; un rango imposible responde 416.
+- Content-Type según el nombre original.
+- Con DESCARGAS['SERVIDOR'] = 'x-accel-redirect' (nginx) o 'x-sendfile'
+  (Apache, lighttpd) solo se mandan las cabeceras y el servidor web envía el
+  archivo; el worker de Python no lee ni un byte.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import content_disposition_header, http_date, parse_http_date_safe
+
+BLOQUE = 64 * 1024
+RANGO = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def configuracion():
+    return {
+        'SERVIDOR': None,
+        'PREFIJO_INTERNO': '/media-interno/',
+        **getattr(settings, 'DESCARGAS', {}),
+    }
+
+
+def etiqueta(documento, estado):
+    if documento.blob_id:
+        return f'"{documento.blob_id}"'
+    return f'"{estado.st_size:x}-{int(estado.st_mtime):x}"'
+
+
+def rango_pedido(request, tamano, etag, modificado):
+    """
+    (inicio, fin) inclusive del Range pedido, None para el archivo completo,
+    o False si el rango no se puede satisfacer.
+    """
+    cabecera = request.headers.get('Range')
+    if not cabecera or request.method not in ('GET', 'HEAD'):
+        return None
+    # If-Range: solo se respeta el rango si el cliente tiene esta misma versión
+    condicion = request.headers.get('If-Range')
+    if condicion and condicion != etag and parse_http_date_safe(condicion) != int(modificado):
+        return None
+
+    coincidencia = RANGO.match(cabecera.strip())
+    if coincidencia is None:
+        # Varios tramos u otras unidades: se responde el archivo completo
+        return None
+    inicio, fin = coincidencia.groups()
+    if not inicio and not fin:
+        return None
+    if not inicio:
+        # bytes=-N: los últimos N bytes
+        inicio, fin = max(0, tamano - int(fin)), tamano - 1
+    else:
+        inicio, fin = int(inicio), min(int(fin), tamano - 1) if fin else tamano - 1
+    if inicio >= tamano or inicio > fin:
+        return False
+    return inicio, fin
+
+
+def _tramo(ruta, inicio, longitud):
+    with open(ruta, 'rb') as archivo:
+        archivo.seek(inicio)
+        while longitud > 0:
+            bloque = archivo.read(min(BLOQUE, longitud))
+            if not bloque:
+                break
+            longitud -= len(bloque)
+            yield bloque
+
+
+def respuesta_documento(request, documento, adjunto=True):
+    ruta = documento.archivo.path
+    estado = os.stat(ruta)
+    return respuesta_archivo(
+        request, ruta, documento.nombre or os.path.basename(documento.archivo.name), etiqueta(documento, estado),
+        adjunto=adjunto, nombre_interno=documento.archivo.name, estado=estado,
+    )
+
+
+def respuesta_archivo(request, ruta, nombre, etag, adjunto=True, nombre_interno=None, estado=None):
+    """
+    Respuesta para el archivo en ruta, descargado como nombre.
+
+    nombre_interno es la ruta relativa a MEDIA_ROOT que recibe nginx en
+    X-Accel-Redirect; sin ella, ese modo no aplica y responde Django.
+    """
+    estado = estado or os.stat(ruta)
+    tamano = estado.st_size
+
+    no_modificado = get_conditional_response(request, etag=etag, last_modified=int(estado.st_mtime))
+    if no_modificado is not None:
+        no_modificado['ETag'] = etag
+        return no_modificado
+
+    rango = rango_pedido(request, tamano, etag, estado.st_mtime)
+    if rango is False:
+        respuesta = HttpResponse(status=416)
+        respuesta['Content-Range'] = f'bytes */{tamano}'
+        return respuesta
+
+    servidor = configuracion()['SERVIDOR']
+    if servidor == 'x-sendfile' or (servidor == 'x-accel-redirect' and nombre_interno):
+        # El servidor web resuelve el rango y los condicionales con el archivo real
+        respuesta = HttpResponse()
+        if servidor == 'x-accel-redirect':
+            respuesta['X-Accel-Redirect'] = configuracion()['PREFIJO_INTERNO'] + quote(nombre_interno)
+        else:
+            respuesta['X-Sendfile'] = ruta
+    elif rango is None:
+        # Archivo completo: FileResponse usa wsgi.file_wrapper (sendfile) si el servidor lo tiene
+        respuesta = FileResponse(open(ruta, 'rb'))
+    else:
+        inicio, fin = rango
+        respuesta = StreamingHttpResponse(_tramo(ruta, inicio, fin - inicio + 1), status=206)
+        respuesta['Content-Range'] = f'bytes {inicio}-{fin}/{tamano}'
+        respuesta['Content-Length'] = fin - inicio + 1
+
+    respuesta['Content-Type'] = mimetypes.guess_type(nombre)[0] or 'application/octet-stream'
+    respuesta['Content-Disposition'] = content_disposition_header(adjunto, nombre)
+    respuesta['Accept-Ranges'] = 'bytes'
+    respuesta['ETag'] = etag
+    respuesta['Last-Modified'] = http_date(estado.st_mtime)
+    # El contenido de un documento no cambia, pero se revalida porque requiere permisos
+    respuesta['Cache-Control'] = 'private, no-cache'
+    return respuesta
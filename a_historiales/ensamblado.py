@@ -0,0 +1,65 @@
+"""
+Armado de formularios con sus respuestas para varios historiales a la vez.
+
+En vez de consultar la respuesta de cada pregunta por separado, se cargan las
+preguntas de todos los formularios involucrados en una consulta y las
+respuestas de todos los historiales en otra, y se unen en memoria. Los
+serializers leen el resultado desde su contexto. Los historiales con versión
+publicada del formulario (ver publicaciones.py) ya traen sus preguntas en esa
+fila y no se cargan las vigentes.
+"""
+import uuid
+
+from django.db.models import Prefetch, prefetch_related_objects
+
+from .models import Pregunta, Respuesta
+
+
+def cargar_preguntas(formularios):
+    """Deja en cada formulario sus preguntas activas ordenadas (formulario.preguntas.all()), en una consulta."""
+    formularios = [f for f in formularios if f is not None]
+    prefetch_related_objects(formularios, Prefetch('preguntas', queryset=Pregunta.objects.filter(activo=True).order_by('orden')))
+
+
+def cargar_respuestas(historiales):
+    """{(historial_id, pregunta_id): valor} de todos los historiales, en una consulta."""
+    respuestas = {}
+    filas = (
+        Respuesta.objects.filter(historial_clinico__in=[h.pk for h in historiales])
+        .order_by('pk')
+        .values_list('historial_clinico_id', 'pregunta_id', 'valor')
+    )
+    for historial_id, pregunta_id, valor in filas:
+        # Como el .first() de antes: si hay repetidas, gana la de menor pk
+        respuestas.setdefault((historial_id, pregunta_id), valor)
+    return respuestas
+
+
+def ensamblar(historiales, contexto, formularios=()):
+    """
+    Carga preguntas y respuestas de los historiales (y formularios extra) en el contexto.
+
+    Después, contexto['respuestas'] responde a (historial_id, pregunta_id)
+    sin más consultas. Conviene que los historiales traigan
+    select_related('formulario', 'formulario_publicado').
+    """
+    historiales = list(historiales)
+    cargar_preguntas([h.formulario for h in historiales if not h.formulario_publicado_id] + list(formularios))
+    contexto.setdefault('respuestas', {}).update(cargar_respuestas(historiales))
+    contexto.setdefault('historiales_ensamblados', set()).update(h.pk for h in historiales)
+    return contexto
+
+
+def preguntas_historial(historial):
+    """
+    [(id, texto, tipo_dato)] de las preguntas del historial, por orden.
+
+    Las de su versión publicada; si no tiene (historiales anteriores a las
+    publicaciones), las vigentes del formulario, ya cargadas con cargar_preguntas.
+    """
+    if historial.formulario_publicado_id:
+        return [(uuid.UUID(p['id']), p['texto'], p['tipo_dato'])
+                for p in historial.formulario_publicado.esquema['preguntas']]
+    if historial.formulario:
+        return [(p.pk, p.texto, p.tipo_dato) for p in historial.formulario.preguntas.all()]
+    return []
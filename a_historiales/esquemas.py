@@ -0,0 +1,110 @@
+"""
+Caché en proceso de los esquemas de formulario (formulario + preguntas ordenadas).
+
+Los formularios cambian pocas veces al año, así que su representación
+serializada se guarda en memoria por id de formulario y por especialidad. Cada
+cambio en Formulario o Pregunta sube VersionFormularios (ver signals.py); antes
+de usar el caché se lee la versión actual, una consulta por pk, y si cambió se
+descarta todo lo guardado. La misma versión sirve de ETag.
+"""
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.core.exceptions import ValidationError
+from django.db.models import F
+
+from .ensamblado import cargar_preguntas
+from .models import Formulario, VersionFormularios
+from .serializers import FormularioSerializer
+
+_lock = threading.Lock()
+_estado = {'version': None, 'cache': None}
+_diferida = ContextVar('version_diferida', default=None)
+
+
+def version_actual():
+    version = VersionFormularios.objects.filter(pk=1).values_list('version', flat=True).first()
+    return version or 0
+
+
+def subir_version():
+    pendiente = _diferida.get()
+    if pendiente is not None:
+        pendiente[0] = True
+        return
+    if not VersionFormularios.objects.filter(pk=1).update(version=F('version') + 1):
+        VersionFormularios.objects.get_or_create(pk=1, defaults={'version': 1})
+
+
+@contextmanager
+def version_diferida():
+    """Dentro del bloque, las llamadas a subir_version() (p. ej. una por fila borrada) suben la versión una sola vez al salir."""
+    if _diferida.get() is not None:
+        yield
+        return
+    pendiente = [False]
+    token = _diferida.set(pendiente)
+    try:
+        yield
+    finally:
+        _diferida.reset(token)
+    if pendiente[0]:
+        subir_version()
+
+
+def etag(*partes, version=None):
+    version = version_actual() if version is None else version
+    return '"' + '-'.join(str(p) for p in (*partes, f'v{version}')) + '"'
+
+
+def _vigente(version):
+    """Caché de esta versión; si la versión cambió se empieza de cero."""
+    with _lock:
+        if _estado['version'] != version:
+            # Un dict nuevo: quien todavía tenga el de la versión anterior escribe en el viejo
+            _estado.update(version=version, cache={'formularios': {}, 'activos': {}, 'especialidades': {}})
+        return _estado['cache']
+
+
+def _compilar(formularios):
+    formularios = list(formularios)
+    cargar_preguntas(formularios)
+    return {str(f.pk): FormularioSerializer(f).data for f in formularios}
+
+
+def esquema_formulario(formulario_id, version=None):
+    """Formulario serializado con sus preguntas por orden, o None si no existe. No modificar el resultado."""
+    formulario_id = str(formulario_id)
+    cache = _vigente(version_actual() if version is None else version)
+    if formulario_id not in cache['formularios']:
+        try:
+            cache['formularios'].update(_compilar(Formulario.objects.filter(pk=formulario_id)))
+        except ValidationError:
+            return None
+        cache['formularios'].setdefault(formulario_id, None)
+    return cache['formularios'][formulario_id]
+
+
+def formulario_activo(especialidad_id, version=None):
+    """Esquema del formulario activo de la especialidad (el mismo que daba .filter(activo=True).first())."""
+    especialidad_id = str(especialidad_id)
+    cache = _vigente(version_actual() if version is None else version)
+    if especialidad_id not in cache['activos']:
+        formulario = Formulario.objects.filter(especialidad=especialidad_id, activo=True).first()
+        if formulario is not None:
+            cache['formularios'].update(_compilar([formulario]))
+        cache['activos'][especialidad_id] = str(formulario.pk) if formulario else None
+    formulario_id = cache['activos'][especialidad_id]
+    return cache['formularios'].get(formulario_id) if formulario_id else None
+
+
+def formularios_especialidad(especialidad_id, version=None):
+    """Esquemas de todos los formularios activos de la especialidad."""
+    especialidad_id = str(especialidad_id)
+    cache = _vigente(version_actual() if version is None else version)
+    if especialidad_id not in cache['especialidades']:
+        compilados = _compilar(Formulario.objects.filter(especialidad=especialidad_id, activo=True))
+        cache['formularios'].update(compilados)
+        cache['especialidades'][especialidad_id] = list(compilados)
+    return [cache['formularios'][pk] for pk in cache['especialidades'][especialidad_id]]
@@ -0,0 +1,93 @@
+import uuid
+
+import django_filters
+from rest_framework.exceptions import ValidationError
+
+from .models import HistorialClinico, Pregunta, Respuesta
+from .valores import COLUMNAS, convertir
+
+# Operadores de ?respuesta=<pregunta>:<op>:<valor> y los tipos en que se pueden usar
+OPERADORES = {
+    'eq': 'exact',
+    'gt': 'gt',
+    'gte': 'gte',
+    'lt': 'lt',
+    'lte': 'lte',
+    'contiene': 'icontains',
+}
+OPERADORES_ORDEN = {'gt', 'gte', 'lt', 'lte'}
+
+
+def _predicado(texto):
+    partes = texto.split(':', 2)
+    if len(partes) != 3:
+        raise ValidationError({'respuesta': f"'{texto}' no tiene la forma <pregunta>:<operador>:<valor>"})
+    pregunta_id, operador, valor = partes
+    try:
+        pregunta_id = uuid.UUID(pregunta_id)
+    except ValueError:
+        raise ValidationError({'respuesta': f"'{partes[0]}' no es un id de pregunta válido"})
+    if operador not in OPERADORES:
+        raise ValidationError({'respuesta': f"Operador desconocido '{operador}' (use {', '.join(OPERADORES)})"})
+    return pregunta_id, operador, valor
+
+
+def historiales_con_respuestas(queryset, predicados):
+    """
+    Historiales cuyas respuestas cumplen todos los predicados (pregunta, operador, valor).
+
+    Las preguntas de tipo numero/booleano/fecha se comparan sobre su columna
+    tipada, con el índice (pregunta, columna); las de texto sobre valor.
+    """
+    tipos = dict(
+        Pregunta.objects.filter(id__in={p[0] for p in predicados}).values_list('id', 'tipo_dato')
+    )
+    for pregunta_id, operador, texto in predicados:
+        if pregunta_id not in tipos:
+            raise ValidationError({'respuesta': f"La pregunta {pregunta_id} no existe"})
+        tipo_dato = tipos[pregunta_id]
+        columna = COLUMNAS.get(tipo_dato)
+
+        if columna is None:
+            if operador in OPERADORES_ORDEN:
+                raise ValidationError({'respuesta': f"'{operador}' no se puede usar con preguntas de tipo {tipo_dato}"})
+            campo, valor = 'valor', texto
+        else:
+            if operador == 'contiene' or (tipo_dato == 'booleano' and operador != 'eq'):
+                raise ValidationError({'respuesta': f"'{operador}' no se puede usar con preguntas de tipo {tipo_dato}"})
+            campo, valor = columna, convertir(tipo_dato, texto)
+            if valor is None:
+                raise ValidationError({'respuesta': f"'{texto}' no es un valor de tipo {tipo_dato}"})
+
+        # Subconsulta sobre Respuesta: recorre solo el rango del índice de la pregunta
+        coincidentes = Respuesta.objects.filter(
+            pregunta_id=pregunta_id, **{f'{campo}__{OPERADORES[operador]}': valor}
+        ).values('historial_clinico_id')
+        queryset = queryset.filter(pk__in=coincidentes)
+    return queryset
+
+
+class HistorialClinicoFilter(django_filters.FilterSet):
+    # Se puede repetir: ?respuesta=<pregunta>:gt:120&respuesta=<pregunta>:eq:si
+    respuesta = django_filters.CharFilter(method='filtrar_respuestas')
+
+    class Meta:
+        model = HistorialClinico
+        fields = ['paciente', 'usuario', 'especialidad', 'fecha', 'respuesta']
+
+    def filtrar_respuestas(self, queryset, name, value):
+        valores = self.request.query_params.getlist(name) if self.request is not None else [value]
+        return historiales_con_respuestas(queryset, [_predicado(v) for v in valores if v])
+
+
+class RespuestaFilter(django_filters.FilterSet):
+    # Rangos sobre las columnas tipadas; conviene combinarlos con ?pregunta= para usar su índice
+    numero_min = django_filters.NumberFilter(field_name='valor_numero', lookup_expr='gte')
+    numero_max = django_filters.NumberFilter(field_name='valor_numero', lookup_expr='lte')
+    booleano = django_filters.BooleanFilter(field_name='valor_booleano')
+    fecha_desde = django_filters.DateFilter(field_name='valor_fecha', lookup_expr='gte')
+    fecha_hasta = django_filters.DateFilter(field_name='valor_fecha', lookup_expr='lte')
+
+    class Meta:
+        model = Respuesta
+        fields = ['pregunta', 'historial_clinico', 'numero_min', 'numero_max', 'booleano', 'fecha_desde', 'fecha_hasta']
@@ -0,0 +1,234 @@
+"""
+Informes PDF de un historial clínico o de todos los historiales de un paciente.
+
+Primero se leen de la base los datos que van en el informe (paciente, signos
+vitales, preguntas y respuestas, documentos) y su SHA-256 es la huella del
+informe. El PDF se guarda en INFORMES_PDF['DIRECTORIO'] con esa huella como
+nombre: si ya existe se sirve sin volver a generarlo, y cualquier cambio en
+esos datos da otra huella y otro archivo. ReportLab corre en un pool de
+procesos (procesos.renderizar_informe); la petición espera hasta
+INFORMES_PDF['ESPERA'] segundos y, si el informe no terminó, responde 202.
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import TimeoutError as TiempoAgotado
+from multiprocessing import get_context
+
+from django.conf import settings
+from django.utils import timezone
+
+from .ensamblado import cargar_preguntas, cargar_respuestas, preguntas_historial
+from .models import DocumentoAdjunto, HistorialClinico
+from .procesos import renderizar_informe
+
+# Subirla cuando cambie el diseño del PDF: invalida todos los informes guardados
+VERSION = 1
+
+# Reentrante: add_done_callback llama a _terminado en este hilo si el trabajo ya terminó
+_lock = threading.RLock()
+_pool = None
+_pendientes = None
+_en_curso = {}
+
+
+class InformeOcupado(Exception):
+    """Hay demasiados informes en cola; conviene reintentar después."""
+
+
+def configuracion():
+    return {
+        'DIRECTORIO': os.path.join(settings.BASE_DIR, 'var', 'informes'),
+        'PROCESOS': 2,
+        'ESPERA': 10,
+        'MAX_PENDIENTES': 100,
+        **getattr(settings, 'INFORMES_PDF', {}),
+    }
+
+
+def _fecha(valor, formato='%Y-%m-%d %H:%M'):
+    if valor is None:
+        return None
+    if hasattr(valor, 'tzinfo') and timezone.is_aware(valor):
+        valor = timezone.localtime(valor)
+    return valor.strftime(formato)
+
+
+def _tamano(bytes_):
+    if bytes_ is None:
+        return None
+    for unidad in ('B', 'KB', 'MB'):
+        if bytes_ < 1024:
+            return f'{bytes_:.0f} {unidad}'
+        bytes_ /= 1024
+    return f'{bytes_:.1f} GB'
+
+
+def datos_paciente(paciente):
+    return {
+        'Paciente': f'{paciente.nombre} {paciente.apellido}',
+        'CI': paciente.ci,
+        'Fecha de nacimiento': _fecha(paciente.fecha_nacimiento, '%Y-%m-%d'),
+        'Sexo': paciente.get_sexo_display(),
+        'Teléfono': paciente.telefono,
+        'Email': paciente.email,
+        'Residencia': paciente.residencia,
+        'Dirección': paciente.direccion,
+        'Ocupación': paciente.ocupacion,
+        'Asegurado': 'Sí' if paciente.asegurado else 'No',
+    }
+
+
+def _nombre_formulario(historial):
+    # El nombre que tenía al publicarse la versión con la que se completó
+    if historial.formulario_publicado_id:
+        return historial.formulario_publicado.esquema['nombre']
+    return historial.formulario.nombre if historial.formulario else None
+
+
+def datos_historiales(historiales):
+    """Datos de cada historial para el informe, con pocas consultas para cualquier cantidad."""
+    historiales = list(historiales)
+    cargar_preguntas([h.formulario for h in historiales if not h.formulario_publicado_id])
+    respuestas = cargar_respuestas(historiales)
+    documentos = {}
+    for d in (DocumentoAdjunto.objects.filter(historial__in=[h.pk for h in historiales])
+              .select_related('blob').order_by('fecha_subida', 'id')):
+        documentos.setdefault(d.historial_id, []).append(
+            (d.nombre or os.path.basename(d.archivo.name), d.tipo_documento, _fecha(d.fecha_subida),
+             _tamano(d.blob.tamano if d.blob else None))
+        )
+
+    return [{
+        'id': str(h.pk),
+        'fecha': _fecha(h.fecha),
+        'especialidad': h.especialidad.nombre,
+        'profesional': f'{h.usuario.nombre} {h.usuario.apellido}',
+        'motivo_consulta': h.motivo_consulta,
+        'fuente': h.fuente,
+        'confiabilidad': h.confiabilidad,
+        'diagnostico': h.diagnostico,
+        'signos_vitales': [(k, v) for k, v in sorted((h.signos_vitales or {}).items())],
+        'formulario': _nombre_formulario(h),
+        'preguntas': [(texto, respuestas.get((h.pk, pregunta_id))) for pregunta_id, texto, _ in preguntas_historial(h)],
+        'documentos': [('Documento', 'Tipo', 'Fecha', 'Tamaño')] + documentos[h.pk] if h.pk in documentos else [],
+    } for h in historiales]
+
+
+def _con_huella(tipo, id_, datos):
+    crudo = json.dumps([VERSION, tipo, datos], sort_keys=True, default=str, ensure_ascii=False)
+    datos['huella'] = hashlib.sha256(crudo.encode()).hexdigest()
+    datos['tipo'], datos['id'] = tipo, str(id_)
+    return datos
+
+
+def historiales_para_informe(queryset):
+    return queryset.select_related('paciente', 'especialidad', 'usuario', 'formulario', 'formulario_publicado')
+
+
+def informes_historiales(historiales):
+    """Datos del informe de cada historial; historiales ya con historiales_para_informe()."""
+    historiales = list(historiales)
+    return [
+        _con_huella('historial', h.pk, {
+            'titulo': f'Historial clínico {_fecha(h.fecha, "%Y-%m-%d")} - {h.paciente}',
+            'paciente': datos_paciente(h.paciente),
+            'historiales': [datos],
+        })
+        for h, datos in zip(historiales, datos_historiales(historiales))
+    ]
+
+
+def informe_historial(historial):
+    return informes_historiales(historiales_para_informe(HistorialClinico.objects.filter(pk=historial.pk)))[0]
+
+
+def informe_paciente(paciente):
+    historiales = historiales_para_informe(HistorialClinico.objects.filter(paciente=paciente)).order_by('fecha', 'id')
+    return _con_huella('paciente', paciente.pk, {
+        'titulo': f'Historia clínica completa - {paciente}',
+        'paciente': datos_paciente(paciente),
+        'historiales': datos_historiales(historiales),
+    })
+
+
+def ruta_informe(datos):
+    return os.path.join(configuracion()['DIRECTORIO'], datos['tipo'], datos['id'], f"{datos['huella']}.pdf")
+
+
+def renderizar(datos):
+    """Genera el PDF en este proceso y borra las versiones anteriores del mismo informe."""
+    ruta = renderizar_informe(datos, ruta_informe(datos))
+    borrar_anteriores(ruta)
+    return ruta
+
+
+def borrar_anteriores(ruta):
+    directorio = os.path.dirname(ruta)
+    for nombre in os.listdir(directorio):
+        anterior = os.path.join(directorio, nombre)
+        if anterior != ruta and nombre.endswith('.pdf'):
+            try:
+                os.remove(anterior)
+            except OSError:
+                pass
+
+
+def pool():
+    """Pool de procesos compartido; se crea al primer uso."""
+    global _pool, _pendientes
+    with _lock:
+        if _pool is None:
+            config = configuracion()
+            _pool = ProcessPoolExecutor(max_workers=config['PROCESOS'], mp_context=get_context('spawn'))
+            _pendientes = threading.BoundedSemaphore(config['MAX_PENDIENTES'])
+        return _pool
+
+
+def obtener(datos):
+    """
+    Ruta del PDF de datos, generándolo si hace falta.
+
+    Devuelve None si sigue generándose después de la espera, y lanza
+    InformeOcupado si la cola está llena. Dos peticiones por el mismo informe
+    esperan al mismo trabajo.
+    """
+    ruta = ruta_informe(datos)
+    if os.path.exists(ruta):
+        return ruta
+    config = configuracion()
+    if config['PROCESOS'] == 0:
+        return renderizar(datos)
+
+    ejecutor = pool()
+    with _lock:
+        futuro = _en_curso.get(ruta)
+        if futuro is None:
+            if not _pendientes.acquire(blocking=False):
+                raise InformeOcupado()
+            try:
+                futuro = ejecutor.submit(renderizar_informe, datos, ruta)
+            except Exception:
+                _pendientes.release()
+                raise
+            _en_curso[ruta] = futuro
+            futuro.add_done_callback(_terminado(ruta))
+    try:
+        futuro.result(timeout=config['ESPERA'])
+    except TiempoAgotado:
+        return None
+    return ruta
+
+
+def _terminado(ruta):
+    def callback(futuro):
+        with _lock:
+            _en_curso.pop(ruta, None)
+        _pendientes.release()
+        if futuro.exception() is not None:
+            print(f"[Informes] Error al generar {ruta}: {futuro.exception()}")
+        elif os.path.exists(ruta):
+            borrar_anteriores(ruta)
+    return callback
@@ -0,0 +1,106 @@
+"""
+Línea de tiempo de un paciente: historiales y documentos adjuntos en un solo orden.
+
+Las entradas van de la más reciente a la más antigua por (fecha, tipo, id).
+Cada página pide a cada tipo solo las filas que siguen al cursor (keyset,
+con el índice (paciente, fecha) de HistorialClinico), una consulta por tipo,
+y las mezcla en memoria. Los historiales traen el resumen de sus respuestas
+(formulario y cantidad) en la misma consulta.
+"""
+import base64
+import json
+
+from django.db.models import Count, Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+from .models import DocumentoAdjunto, HistorialClinico
+
+# Con la misma fecha, los documentos van antes que su historial
+RANGO = {'historial': 0, 'documento': 1}
+
+
+def codificar_cursor(clave):
+    fecha, tipo, id_ = clave
+    crudo = json.dumps([fecha.isoformat(), tipo, str(id_)])
+    return base64.urlsafe_b64encode(crudo.encode()).decode()
+
+
+def decodificar_cursor(cursor):
+    try:
+        fecha, tipo, id_ = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        fecha = parse_datetime(fecha)
+    except (ValueError, TypeError):
+        raise ValidationError({'cursor': "Cursor inválido"})
+    if fecha is None or tipo not in RANGO:
+        raise ValidationError({'cursor': "Cursor inválido"})
+    return fecha, tipo, id_
+
+
+def _despues_de(tipo, campo_fecha, cursor):
+    """Filas del tipo que van después del cursor en orden descendente de (fecha, tipo, id)."""
+    if cursor is None:
+        return Q()
+    fecha, tipo_cursor, id_ = cursor
+    if RANGO[tipo] < RANGO[tipo_cursor]:
+        return Q(**{f'{campo_fecha}__lte': fecha})
+    if RANGO[tipo] > RANGO[tipo_cursor]:
+        return Q(**{f'{campo_fecha}__lt': fecha})
+    return Q(**{f'{campo_fecha}__lt': fecha}) | Q(**{campo_fecha: fecha, 'id__lt': id_})
+
+
+def _historial(h):
+    return {
+        'tipo': 'historial',
+        'id': h.pk,
+        'fecha': h.fecha,
+        'historial': h.pk,
+        'especialidad': h.especialidad.nombre,
+        'usuario': f"{h.usuario.nombre} {h.usuario.apellido}",
+        'motivo_consulta': h.motivo_consulta,
+        'diagnostico': h.diagnostico,
+        'respuestas': {
+            'formulario': h.formulario.nombre if h.formulario else None,
+            'total': h.total_respuestas,
+        },
+    }
+
+
+def _documento(d):
+    return {
+        'tipo': 'documento',
+        'id': d.pk,
+        'fecha': d.fecha_subida,
+        'historial': d.historial_id,
+        'tipo_documento': d.tipo_documento,
+        'nombre': d.nombre,
+        'archivo': d.archivo.name,
+    }
+
+
+def pagina(paciente_id, cursor=None, tamano=20):
+    """(entradas, siguiente_cursor) de la línea de tiempo; siguiente_cursor es None en la última página."""
+    cursor = decodificar_cursor(cursor) if cursor else None
+
+    historiales = (
+        HistorialClinico.objects
+        .filter(_despues_de('historial', 'fecha', cursor), paciente_id=paciente_id)
+        .select_related('especialidad', 'usuario', 'formulario')
+        .annotate(total_respuestas=Count('respuesta'))
+        .order_by('-fecha', '-id')[:tamano + 1]
+    )
+    documentos = (
+        DocumentoAdjunto.objects
+        .filter(_despues_de('documento', 'fecha_subida', cursor), historial__paciente_id=paciente_id)
+        .order_by('-fecha_subida', '-id')[:tamano + 1]
+    )
+
+    entradas = [_historial(h) for h in historiales] + [_documento(d) for d in documentos]
+    entradas.sort(key=lambda e: (e['fecha'], RANGO[e['tipo']], str(e['id'])), reverse=True)
+
+    siguiente = None
+    if len(entradas) > tamano:
+        entradas = entradas[:tamano]
+        ultima = entradas[-1]
+        siguiente = codificar_cursor((ultima['fecha'], ultima['tipo'], ultima['id']))
+    return entradas, siguiente
@@ -0,0 +1,79 @@
+import statistics
+import time
+import uuid
+from datetime import date
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from a_especialidades.models import Especialidad
+from a_historiales.models import Formulario, HistorialClinico, Pregunta
+from a_pacientes.models import Pacientes
+from a_usuarios.models import Usuario
+
+
+class Command(BaseCommand):
+    help = 'Mide la latencia y las consultas de asignar-formulario según el número de respuestas'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--respuestas',
+            default='10,30,60,120',
+            help='Números de respuestas a medir, separados por coma'
+        )
+        parser.add_argument(
+            '--repeticiones',
+            type=int,
+            default=10,
+            help='Mediciones por caso (se reporta la mediana)'
+        )
+
+    def handle(self, *args, **options):
+        casos = sorted(int(n) for n in options['respuestas'].split(','))
+
+        # Todo se hace dentro de una transacción que se revierte al final
+        with transaction.atomic():
+            sufijo = uuid.uuid4().hex[:8]
+            usuario = Usuario.objects.create_user(email=f'bench-{sufijo}@bench.local', nombre='Bench', apellido='Respuestas')
+            especialidad = Especialidad.objects.create(nombre=f'Bench {sufijo}', descripcion='')
+            paciente = Pacientes.objects.create(
+                nombre='Bench', apellido='Respuestas', ci=f'bench-{sufijo}',
+                fecha_nacimiento=date(1990, 1, 1), sexo='O', asegurado=True,
+            )
+            historial = HistorialClinico.objects.create(
+                paciente=paciente, usuario=usuario, especialidad=especialidad,
+                motivo_consulta='Bench', fuente='Bench', diagnostico='Bench', signos_vitales={},
+            )
+
+            cliente = APIClient()
+            cliente.force_authenticate(usuario)
+
+            for cantidad in casos:
+                formulario = Formulario.objects.create(nombre=f'Bench {cantidad}', especialidad=especialidad)
+                preguntas = Pregunta.objects.bulk_create([
+                    Pregunta(formulario=formulario, texto=f'Pregunta {i}', tipo_dato='texto', orden=i)
+                    for i in range(cantidad)
+                ])
+                url = f'/api/historiales/historiales/{historial.pk}/asignar-formulario/'
+
+                tiempos, consultas = [], 0
+                for repeticion in range(options['repeticiones']):
+                    datos = {
+                        'formulario': str(formulario.pk),
+                        'respuestas': [{'pregunta': str(p.pk), 'valor': f'v{repeticion}'} for p in preguntas],
+                    }
+                    with CaptureQueriesContext(connection) as capturadas:
+                        inicio = time.perf_counter()
+                        respuesta = cliente.patch(url, datos, format='json')
+                        tiempos.append((time.perf_counter() - inicio) * 1000)
+                    if respuesta.status_code != 200:
+                        raise RuntimeError(f'Respuesta inesperada {respuesta.status_code}: {respuesta.content[:200]}')
+                    consultas = len(capturadas)
+
+                self.stdout.write(
+                    f'respuestas={cantidad:>4}  mediana={statistics.median(tiempos):8.2f} ms  consultas={consultas}'
+                )
+
+            transaction.set_rollback(True)
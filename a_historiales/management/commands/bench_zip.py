@@ -0,0 +1,112 @@
+import os
+import resource
+import shutil
+import tempfile
+import time
+import uuid
+from datetime import date
+from unittest import mock
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+from rest_framework.test import APIClient
+
+from a_especialidades.models import Especialidad
+from a_historiales import paquetes
+from a_historiales.models import DocumentoAdjunto, HistorialClinico
+from a_pacientes.models import Pacientes
+from a_usuarios.models import Usuario
+
+MB = 1024 * 1024
+
+
+class Command(BaseCommand):
+    help = 'Mide el ZIP de documentos de un historial (tiempo, MB/s y memoria) con archivos de varios GB'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--gb', type=float, default=4, help='Tamaño total de los documentos en GB')
+        parser.add_argument('--archivos', type=int, default=4, help='Cantidad de documentos')
+        parser.add_argument(
+            '--extension',
+            default='jpg',
+            help='Extensión de los documentos: jpg (ya comprimido, se guarda) o txt (se comprime)'
+        )
+        parser.add_argument(
+            '--comparar',
+            action='store_true',
+            help='Medir también comprimiendo todo con deflate'
+        )
+        parser.add_argument('--directorio', default=None, help='Dónde crear los archivos (por defecto un temporal)')
+
+    def handle(self, *args, **options):
+        media = tempfile.mkdtemp(prefix='bench-zip-', dir=options['directorio'])
+        try:
+            with override_settings(MEDIA_ROOT=media):
+                tamano = int(options['gb'] * 1024 * MB / options['archivos'])
+                nombres = [self.crear_archivo(media, i, tamano, options['extension']) for i in range(options['archivos'])]
+                self.stdout.write(f"{len(nombres)} archivos .{options['extension']} de {tamano / MB:.0f} MB en {media}")
+
+                # Las filas se revierten al final; los archivos se borran con el directorio
+                with transaction.atomic():
+                    url = self.preparar(nombres)
+                    self.medir('normal', url)
+                    if options['comparar']:
+                        with mock.patch.object(paquetes, 'YA_COMPRIMIDOS', set()):
+                            self.medir('todo deflate', url)
+                    transaction.set_rollback(True)
+        finally:
+            shutil.rmtree(media, ignore_errors=True)
+
+    def crear_archivo(self, media, indice, tamano, extension):
+        nombre = f'bench/documento-{indice}.{extension}'
+        ruta = os.path.join(media, nombre)
+        os.makedirs(os.path.dirname(ruta), exist_ok=True)
+        # Datos aleatorios para un formato comprimido; texto repetitivo para uno que no lo está
+        bloque = os.urandom(8 * MB) if extension in {e.lstrip('.') for e in paquetes.YA_COMPRIMIDOS} \
+            else (b'hemoglobina 13.5 g/dL; leucocitos 7200 /uL\n' * (8 * MB // 44 + 1))[:8 * MB]
+        with open(ruta, 'wb') as archivo:
+            for inicio in range(0, tamano, len(bloque)):
+                archivo.write(bloque[:tamano - inicio])
+        return nombre
+
+    def preparar(self, nombres):
+        sufijo = uuid.uuid4().hex[:8]
+        usuario = Usuario.objects.create_user(email=f'bench-{sufijo}@bench.local', nombre='Bench', apellido='Zip')
+        especialidad = Especialidad.objects.create(nombre=f'Bench {sufijo}', descripcion='')
+        paciente = Pacientes.objects.create(
+            nombre='Bench', apellido='Zip', ci=f'bench-{sufijo}',
+            fecha_nacimiento=date(1990, 1, 1), sexo='O', asegurado=True,
+        )
+        historial = HistorialClinico.objects.create(
+            paciente=paciente, usuario=usuario, especialidad=especialidad,
+            motivo_consulta='Bench', fuente='Bench', diagnostico='Bench', signos_vitales={},
+        )
+        for nombre in nombres:
+            DocumentoAdjunto.objects.create(historial=historial, tipo_documento='Bench', archivo=nombre)
+
+        self.cliente = APIClient()
+        self.cliente.force_authenticate(usuario)
+        return f'/api/historiales/historiales/{historial.pk}/documentos.zip/'
+
+    def medir(self, etiqueta, url):
+        inicio = time.perf_counter()
+        respuesta = self.cliente.get(url)
+        if respuesta.status_code != 200:
+            raise RuntimeError(f'Respuesta inesperada {respuesta.status_code}')
+
+        total = mayor = 0
+        primero = None
+        for parte in respuesta.streaming_content:
+            if primero is None:
+                primero = time.perf_counter() - inicio
+            total += len(parte)
+            mayor = max(mayor, len(parte))
+        segundos = time.perf_counter() - inicio
+
+        # ru_maxrss es el pico del proceso en KB (Linux)
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self.stdout.write(
+            f'{etiqueta:<13} zip={total / MB:9.0f} MB  tiempo={segundos:7.2f} s  {total / MB / segundos:7.1f} MB/s  '
+            f'primer byte={primero * 1000:6.1f} ms  mayor parte={mayor / MB:.2f} MB  pico RSS={pico:.0f} MB'
+        )
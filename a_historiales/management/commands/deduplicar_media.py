@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from a_historiales.blobs import deduplicar
+
+
+class Command(BaseCommand):
+    help = 'Pasa los documentos adjuntos guardados por nombre en MEDIA_ROOT al almacenamiento por SHA-256, sin repetidos'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo calcular cuántos archivos están repetidos y cuánto espacio se liberaría'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            resultado = deduplicar(simular=options['simular'], progreso=self.stdout.write)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        verbo = 'se liberarían' if options['simular'] else 'liberados'
+        self.stdout.write(self.style.SUCCESS(
+            f"{resultado['documentos']} documentos, {resultado['duplicados']} repetidos, "
+            f"{resultado['bytes_liberados'] / 1024 ** 2:.1f} MB {verbo}, {resultado['faltantes']} archivos faltantes"
+        ))
@@ -0,0 +1,95 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+
+from a_historiales import informes
+from a_historiales.models import HistorialClinico
+from a_historiales.procesos import renderizar_informe
+from a_pacientes.models import Pacientes
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo los informes PDF de historiales (o de pacientes) que no están guardados'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pacientes',
+            action='store_true',
+            help='Generar el informe completo de cada paciente en vez del de cada historial'
+        )
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            help='Procesos en paralelo (por defecto, uno por núcleo)'
+        )
+        parser.add_argument(
+            '--lote',
+            type=int,
+            default=200,
+            help='Historiales cuyos datos se leen por consulta'
+        )
+        parser.add_argument(
+            '--todos',
+            action='store_true',
+            help='Generar también los que ya están guardados (por ejemplo, tras cambiar el diseño)'
+        )
+
+    def handle(self, *args, **options):
+        procesos = options['procesos'] or os.cpu_count() or 1
+        if procesos < 1:
+            raise CommandError('--procesos debe ser al menos 1')
+
+        totales = {'generados': 0, 'omitidos': 0, 'errores': 0}
+        en_curso = {}
+
+        def recoger(terminados):
+            for futuro in terminados:
+                datos = en_curso.pop(futuro)
+                try:
+                    informes.borrar_anteriores(futuro.result())
+                    totales['generados'] += 1
+                except Exception as e:
+                    totales['errores'] += 1
+                    self.stderr.write(f"{datos['tipo']} {datos['id']}: {e}")
+
+        inicio = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=get_context('spawn')) as pool:
+            for datos in self.datos(options['pacientes'], options['lote']):
+                ruta = informes.ruta_informe(datos)
+                if not options['todos'] and os.path.exists(ruta):
+                    totales['omitidos'] += 1
+                    continue
+
+                # Pocas tareas en vuelo a la vez para no cargar toda la tabla en memoria
+                if len(en_curso) >= procesos * 4:
+                    terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                    recoger(terminados)
+                en_curso[pool.submit(renderizar_informe, datos, ruta)] = datos
+            recoger(list(en_curso))
+        segundos = time.perf_counter() - inicio
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totales['generados']} informes generados, {totales['omitidos']} ya guardados, "
+            f"{totales['errores']} errores en {segundos:.1f} s con {procesos} procesos "
+            f"({totales['generados'] / segundos if segundos else 0:.1f} informes/s)"
+        ))
+
+    def datos(self, pacientes, lote):
+        if pacientes:
+            for paciente in Pacientes.objects.order_by('pk').iterator(chunk_size=lote):
+                yield informes.informe_paciente(paciente)
+            return
+
+        historiales = informes.historiales_para_informe(HistorialClinico.objects.order_by('pk'))
+        ultimo = None
+        while True:
+            # Keyset por pk: cada lote son unas pocas consultas (ver informes.datos_historiales)
+            pagina = historiales if ultimo is None else historiales.filter(pk__gt=ultimo)
+            filas = list(pagina[:lote])
+            yield from informes.informes_historiales(filas)
+            if len(filas) < lote:
+                return
+            ultimo = filas[-1].pk
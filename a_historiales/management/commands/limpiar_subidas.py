@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from a_historiales.subidas import limpiar_vencidas
+
+
+class Command(BaseCommand):
+    help = 'Borra las subidas por partes abandonadas (SUBIDAS_DOCUMENTOS["CADUCIDAD_HORAS"]) y sus archivos temporales'
+
+    def handle(self, *args, **options):
+        total = limpiar_vencidas()
+        self.stdout.write(self.style.SUCCESS(f'{total} subidas vencidas borradas'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from a_historiales.blobs import recolectar
+
+
+class Command(BaseCommand):
+    help = 'Borra los blobs de documentos que ya no usa ningún DocumentoAdjunto y los archivos de blobs/ sin fila'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--gracia',
+            type=int,
+            default=24,
+            help='No borrar blobs creados o reutilizados hace menos de estas horas (por defecto 24)'
+        )
+        parser.add_argument(
+            '--simular',
+            action='store_true',
+            help='Solo contar los blobs que se borrarían'
+        )
+
+    def handle(self, *args, **options):
+        if options['gracia'] < 0:
+            raise CommandError('--gracia no puede ser negativa')
+
+        total = recolectar(gracia_horas=options['gracia'], simular=options['simular'])
+        verbo = 'se borrarían' if options['simular'] else 'borrados'
+        self.stdout.write(self.style.SUCCESS(f'{total} blobs sin documentos {verbo}'))
@@ -0,0 +1,66 @@
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from multiprocessing import get_context
+
+from django.core.management.base import BaseCommand, CommandError
+
+from a_historiales import previas
+from a_historiales.models import DocumentoAdjunto
+from a_historiales.procesos import generar_previas
+
+
+class Command(BaseCommand):
+    help = 'Genera en paralelo las miniaturas y vistas previas de los documentos adjuntos que son imágenes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--procesos',
+            type=int,
+            help='Procesos en paralelo (por defecto VISTAS_PREVIAS["PROCESOS"])'
+        )
+        parser.add_argument(
+            '--todas',
+            action='store_true',
+            help='Regenerar también las que ya existen (por ejemplo, tras cambiar tamaños o calidad)'
+        )
+
+    def handle(self, *args, **options):
+        procesos = options['procesos'] or previas.configuracion()['PROCESOS'] or 1
+        if procesos < 1:
+            raise CommandError('--procesos debe ser al menos 1')
+
+        totales = {'imagenes': 0, 'otros': 0, 'errores': 0, 'omitidos': 0}
+        claves = set()
+        en_curso = {}
+
+        def recoger(terminados):
+            for futuro in terminados:
+                documento_id = en_curso.pop(futuro)
+                try:
+                    totales['imagenes' if futuro.result() else 'otros'] += 1
+                except Exception as e:
+                    totales['errores'] += 1
+                    self.stderr.write(f'{documento_id}: {e}')
+
+        documentos = DocumentoAdjunto.objects.exclude(archivo='').order_by('pk')
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=get_context('spawn')) as pool:
+            for documento in documentos.only('id', 'archivo', 'blob').iterator(chunk_size=500):
+                # Documentos con el mismo blob comparten vistas previas
+                if previas.clave(documento) in claves or (
+                    not options['todas'] and all(previas.existentes(documento).values())
+                ):
+                    totales['omitidos'] += 1
+                    continue
+                claves.add(previas.clave(documento))
+
+                # Pocas tareas en vuelo a la vez para no cargar toda la tabla en memoria
+                if len(en_curso) >= procesos * 4:
+                    terminados, _ = wait(en_curso, return_when=FIRST_COMPLETED)
+                    recoger(terminados)
+                futuro = pool.submit(generar_previas, documento.archivo.path, previas.destinos(documento))
+                en_curso[futuro] = documento.pk
+            recoger(list(en_curso))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"{totales['imagenes']} imágenes procesadas, {totales['otros']} documentos que no son imágenes, "
+            f"{totales['omitidos']} omitidos, {totales['errores']} errores"
+        ))
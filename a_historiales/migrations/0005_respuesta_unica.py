@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:38
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def quitar_duplicadas(apps, schema_editor):
+    # Se conserva la de menor pk: es la que leían y actualizaban las vistas con .first()
+    Respuesta = apps.get_model('a_historiales', 'Respuesta')
+    repetidas = (
+        Respuesta.objects.filter(historial_clinico__isnull=False)
+        .values('pregunta_id', 'historial_clinico_id')
+        .annotate(total=Count('id'))
+        .filter(total__gt=1)
+        .order_by()
+    )
+    for grupo in repetidas:
+        ids = list(
+            Respuesta.objects.filter(pregunta_id=grupo['pregunta_id'], historial_clinico_id=grupo['historial_clinico_id'])
+            .order_by('pk')
+            .values_list('pk', flat=True)
+        )
+        Respuesta.objects.filter(pk__in=ids[1:]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0004_alter_pregunta_tipo_dato'),
+    ]
+
+    operations = [
+        migrations.RunPython(quitar_duplicadas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='respuesta',
+            constraint=models.UniqueConstraint(fields=('pregunta', 'historial_clinico'), name='respuesta_pregunta_historial_unica'),
+        ),
+    ]
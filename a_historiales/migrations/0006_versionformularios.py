@@ -0,0 +1,26 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:40
+
+from django.db import migrations, models
+
+
+def crear_contador(apps, schema_editor):
+    VersionFormularios = apps.get_model('a_historiales', 'VersionFormularios')
+    VersionFormularios.objects.get_or_create(pk=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0005_respuesta_unica'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersionFormularios',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(crear_contador, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,122 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:42
+
+import math
+from datetime import datetime
+
+from django.db import migrations, models
+from django.utils.dateparse import parse_date, parse_datetime
+
+# Copia de a_historiales/valores.py tal como estaba al escribir esta migración: si
+# valores.py cambia después, esta migración tiene que seguir haciendo lo mismo
+COLUMNAS = {
+    'numero': 'valor_numero',
+    'booleano': 'valor_booleano',
+    'fecha': 'valor_fecha',
+}
+CAMPOS_TIPADOS = list(COLUMNAS.values())
+
+VERDADEROS = {'true', 't', '1', 'si', 'sí', 's', 'verdadero', 'v', 'yes', 'on'}
+FALSOS = {'false', 'f', '0', 'no', 'n', 'falso', 'off'}
+
+
+def a_numero(texto):
+    texto = str(texto).strip().replace(' ', '')
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = float(texto)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def a_booleano(texto):
+    texto = str(texto).strip().lower()
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    return None
+
+
+def a_fecha(texto):
+    texto = str(texto).strip()
+    try:
+        fecha = parse_date(texto)
+        if fecha is None:
+            fecha_hora = parse_datetime(texto)
+            fecha = fecha_hora.date() if fecha_hora else None
+        if fecha is None:
+            fecha = datetime.strptime(texto, '%d/%m/%Y').date()
+    except ValueError:
+        return None
+    return fecha
+
+
+CONVERSORES = {
+    'valor_numero': a_numero,
+    'valor_booleano': a_booleano,
+    'valor_fecha': a_fecha,
+}
+
+
+def valores_tipados(tipo_dato, texto):
+    valores = dict.fromkeys(CAMPOS_TIPADOS)
+    columna = COLUMNAS.get(tipo_dato)
+    if columna is not None and texto is not None:
+        valores[columna] = CONVERSORES[columna](texto)
+    return valores
+
+
+def llenar_valores_tipados(apps, schema_editor):
+    Respuesta = apps.get_model('a_historiales', 'Respuesta')
+    lote = []
+    filas = Respuesta.objects.exclude(pregunta__tipo_dato__in=['texto', 'textarea']).select_related('pregunta')
+    for respuesta in filas.only('id', 'valor', 'pregunta__tipo_dato').iterator(chunk_size=2000):
+        for campo, valor in valores_tipados(respuesta.pregunta.tipo_dato, respuesta.valor).items():
+            setattr(respuesta, campo, valor)
+        lote.append(respuesta)
+        if len(lote) >= 2000:
+            Respuesta.objects.bulk_update(lote, CAMPOS_TIPADOS)
+            lote = []
+    if lote:
+        Respuesta.objects.bulk_update(lote, CAMPOS_TIPADOS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0006_versionformularios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='respuesta',
+            name='valor_booleano',
+            field=models.BooleanField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='respuesta',
+            name='valor_fecha',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='respuesta',
+            name='valor_numero',
+            field=models.FloatField(blank=True, editable=False, null=True),
+        ),
+        # Se llenan antes de crear los índices
+        migrations.RunPython(llenar_valores_tipados, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='respuesta',
+            index=models.Index(fields=['pregunta', 'valor_numero'], name='respuesta_pregunta_numero_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='respuesta',
+            index=models.Index(fields=['pregunta', 'valor_booleano'], name='respuesta_pregunta_bool_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='respuesta',
+            index=models.Index(fields=['pregunta', 'valor_fecha'], name='respuesta_pregunta_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:44
+
+import math
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# Copia de a_historiales/valores.py tal como estaba al escribir esta migración: si
+# valores.py cambia después, esta migración tiene que seguir haciendo lo mismo
+METRICAS = (
+    'presion_arterial_sistolica',
+    'presion_arterial_diastolica',
+    'frecuencia_cardiaca',
+    'frecuencia_respiratoria',
+    'temperatura',
+    'saturacion_oxigeno',
+    'peso',
+    'talla',
+)
+
+
+def a_numero(texto):
+    texto = str(texto).strip().replace(' ', '')
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = float(texto)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def extraer_signos(signos_vitales):
+    if not isinstance(signos_vitales, dict):
+        return {}
+    valores = {}
+    presion = signos_vitales.get('presion_arterial')
+    if isinstance(presion, str) and '/' in presion:
+        sistolica, _, diastolica = presion.partition('/')
+        valores['presion_arterial_sistolica'] = a_numero(sistolica)
+        valores['presion_arterial_diastolica'] = a_numero(diastolica)
+    for metrica in METRICAS:
+        valor = signos_vitales.get(metrica)
+        if valor is not None and not isinstance(valor, (bool, dict, list)):
+            valores[metrica] = a_numero(valor)
+    return {metrica: valor for metrica, valor in valores.items() if valor is not None}
+
+
+def copiar_signos(apps, schema_editor):
+    HistorialClinico = apps.get_model('a_historiales', 'HistorialClinico')
+    SignoVital = apps.get_model('a_historiales', 'SignoVital')
+    lote = []
+    historiales = HistorialClinico.objects.only('id', 'paciente_id', 'fecha', 'signos_vitales')
+    for historial in historiales.iterator(chunk_size=2000):
+        for metrica, valor in extraer_signos(historial.signos_vitales).items():
+            lote.append(SignoVital(
+                historial_id=historial.pk, paciente_id=historial.paciente_id, metrica=metrica, valor=valor,
+                fecha=historial.fecha, segundos=int(historial.fecha.timestamp()),
+            ))
+        if len(lote) >= 2000:
+            SignoVital.objects.bulk_create(lote)
+            lote = []
+    SignoVital.objects.bulk_create(lote)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0007_respuesta_valores_tipados'),
+        ('a_pacientes', '0003_alter_pacientes_beneficiario_de'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SignoVital',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metrica', models.CharField(choices=[('presion_arterial_sistolica', 'Presion arterial sistolica'), ('presion_arterial_diastolica', 'Presion arterial diastolica'), ('frecuencia_cardiaca', 'Frecuencia cardiaca'), ('frecuencia_respiratoria', 'Frecuencia respiratoria'), ('temperatura', 'Temperatura'), ('saturacion_oxigeno', 'Saturacion oxigeno'), ('peso', 'Peso'), ('talla', 'Talla')], max_length=40)),
+                ('valor', models.FloatField()),
+                ('fecha', models.DateTimeField()),
+                ('segundos', models.BigIntegerField()),
+                ('historial', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='signos', to='a_historiales.historialclinico')),
+                ('paciente', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='a_pacientes.pacientes')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['paciente', 'metrica', 'segundos'], name='signo_vital_serie_idx')],
+                'constraints': [models.UniqueConstraint(fields=('historial', 'metrica'), name='signo_vital_historial_metrica_unico')],
+            },
+        ),
+        migrations.RunPython(copiar_signos, migrations.RunPython.noop),
+    ]
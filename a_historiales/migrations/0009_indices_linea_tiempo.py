@@ -0,0 +1,25 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_especialidades', '0001_initial'),
+        ('a_historiales', '0008_signovital'),
+        ('a_pacientes', '0003_alter_pacientes_beneficiario_de'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='documentoadjunto',
+            index=models.Index(fields=['historial', 'fecha_subida', 'id'], name='documento_historial_fecha_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='historialclinico',
+            index=models.Index(fields=['paciente', 'fecha', 'id'], name='historial_paciente_fecha_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:49
+
+import a_historiales.almacenamiento
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def copiar_nombres(apps, schema_editor):
+    # Los archivos anteriores conservan su nombre en disco; se copia como nombre original
+    DocumentoAdjunto = apps.get_model('a_historiales', 'DocumentoAdjunto')
+    for documento in DocumentoAdjunto.objects.filter(nombre='').only('id', 'archivo').iterator():
+        DocumentoAdjunto.objects.filter(pk=documento.pk).update(nombre=documento.archivo.name.split('/')[-1][:255])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0010_subidadocumento'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Blob',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('tamano', models.PositiveBigIntegerField()),
+                ('creado', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='documentoadjunto',
+            name='nombre',
+            field=models.CharField(blank=True, max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='documentoadjunto',
+            name='archivo',
+            field=models.FileField(storage=a_historiales.almacenamiento.almacenamiento_documentos, upload_to=''),
+        ),
+        migrations.AddField(
+            model_name='documentoadjunto',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='documentos', to='a_historiales.blob'),
+        ),
+        migrations.RunPython(copiar_nombres, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+from django.db import migrations
+
+TABLA = 'a_historiales_historialclinico'
+
+# Columna generada (ver a_historiales/busqueda.py): diagnóstico A, motivo B, fuente C, confiabilidad D
+VECTOR = (
+    "setweight(to_tsvector('spanish', coalesce(diagnostico, '')), 'A') || "
+    "setweight(to_tsvector('spanish', coalesce(motivo_consulta, '')), 'B') || "
+    "setweight(to_tsvector('spanish', coalesce(fuente, '')), 'C') || "
+    "setweight(to_tsvector('spanish', coalesce(confiabilidad, '')), 'D')"
+)
+
+
+def crear_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            # Columna generada: PostgreSQL la recalcula en cada INSERT y UPDATE
+            cursor.execute(f'ALTER TABLE {TABLA} ADD COLUMN busqueda tsvector GENERATED ALWAYS AS ({VECTOR}) STORED')
+            cursor.execute(f'CREATE INDEX historial_busqueda_gin ON {TABLA} USING gin (busqueda)')
+        elif vendor == 'sqlite':
+            # Tabla FTS5 y triggers: los mismos que repara post_migrate
+            from a_historiales.busqueda import instalar_sqlite
+            instalar_sqlite(cursor)
+
+
+def borrar_indice(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'postgresql':
+            cursor.execute(f'ALTER TABLE {TABLA} DROP COLUMN busqueda')
+        elif vendor == 'sqlite':
+            from a_historiales.busqueda import borrar_sqlite
+            borrar_sqlite(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0011_blobs_documentos'),
+    ]
+
+    operations = [
+        migrations.RunPython(crear_indice, borrar_indice),
+    ]
@@ -0,0 +1,71 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:20
+
+import django.db.models.deletion
+import hashlib
+import json
+import uuid
+from django.db import migrations, models
+
+
+def publicar_en_uso(apps, schema_editor):
+    # Las versiones anteriores de los formularios no se guardaron: los historiales que ya tienen
+    # formulario apuntan a una publicación del formulario como está ahora. Mismo JSON y misma
+    # huella que publicaciones.publicar, para que publicar después sin cambios no cree otra.
+    Formulario = apps.get_model('a_historiales', 'Formulario')
+    FormularioPublicado = apps.get_model('a_historiales', 'FormularioPublicado')
+    HistorialClinico = apps.get_model('a_historiales', 'HistorialClinico')
+    en_uso = HistorialClinico.objects.filter(formulario__isnull=False).values('formulario')
+    for formulario in Formulario.objects.filter(pk__in=en_uso).iterator():
+        esquema = {
+            'id': str(formulario.pk),
+            'preguntas': [
+                {'id': str(p.pk), 'texto': p.texto, 'tipo_dato': p.tipo_dato, 'obligatorio': p.obligatorio,
+                 'orden': p.orden, 'respuesta': None}
+                for p in formulario.preguntas.order_by('orden')
+            ],
+            'nombre': formulario.nombre,
+            'activo': formulario.activo,
+            'especialidad': formulario.especialidad_id,
+        }
+        # Como DjangoJSONEncoder en publicaciones.compilar: UUID como texto, enteros como enteros
+        esquema = json.loads(json.dumps(esquema, default=str))
+        crudo = json.dumps(esquema, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+        publicado = FormularioPublicado.objects.create(
+            formulario=formulario, numero=1, esquema=esquema, huella=hashlib.sha256(crudo.encode()).hexdigest(),
+        )
+        HistorialClinico.objects.filter(formulario=formulario).update(formulario_publicado=publicado)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0012_busqueda_texto'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FormularioPublicado',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('numero', models.PositiveIntegerField()),
+                ('esquema', models.JSONField()),
+                ('huella', models.CharField(max_length=64)),
+                ('fecha', models.DateTimeField(auto_now_add=True)),
+                ('formulario', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='publicaciones', to='a_historiales.formulario')),
+            ],
+            options={
+                'verbose_name': 'Formulario publicado',
+                'verbose_name_plural': 'Formularios publicados',
+            },
+        ),
+        migrations.AddField(
+            model_name='historialclinico',
+            name='formulario_publicado',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='historiales', to='a_historiales.formulariopublicado'),
+        ),
+        migrations.AddConstraint(
+            model_name='formulariopublicado',
+            constraint=models.UniqueConstraint(fields=('formulario', 'numero'), name='formulario_publicado_numero_unico'),
+        ),
+        migrations.RunPython(publicar_en_uso, migrations.RunPython.noop),
+    ]
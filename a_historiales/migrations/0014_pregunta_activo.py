@@ -0,0 +1,24 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_historiales', '0013_formularios_publicados'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pregunta',
+            name='activo',
+            field=models.BooleanField(default=True),
+        ),
+        migrations.AlterField(
+            model_name='respuesta',
+            name='pregunta',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.RESTRICT, to='a_historiales.pregunta'),
+        ),
+    ]
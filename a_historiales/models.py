@@ -1,8 +1,11 @@
 from django.db import models
+import os
 import uuid
 from a_usuarios.models import Usuario
 from a_pacientes.models import Pacientes
 from a_sucursales.models import Especialidad
+from .almacenamiento import almacenamiento_documentos, sha256_de_nombre
+from .valores import CAMPOS_TIPADOS, METRICAS, valores_tipados
 
 class Formulario(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -28,16 +31,60 @@ class Pregunta(models.Model):
     tipo_dato = models.CharField(max_length=20, choices=TIPO_DATO_CHOICES)
     obligatorio = models.BooleanField(default=False)
     orden = models.PositiveBigIntegerField()
+    # False si se eliminó teniendo respuestas: los historiales ya completados las siguen mostrando
+    activo = models.BooleanField(default=True)
+
+    def delete(self, *args, **kwargs):
+        """Borra la pregunta, o solo la desactiva si ya tiene respuestas."""
+        if self.respuesta_set.exists():
+            self.activo = False
+            self.save(update_fields=['activo'])
+            return 0, {}
+        return super().delete(*args, **kwargs)
 
     def __str__(self):
         return f"{self.texto} ({self.tipo_dato})"
 
+class FormularioPublicado(models.Model):
+    """
+    Versión publicada de un formulario: su esquema con las preguntas por orden, tal como estaba.
+
+    No se modifica después de creada (ver publicaciones.py); los historiales
+    apuntan a la versión con la que se completaron.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    # Si se borra el formulario, sus versiones publicadas quedan
+    formulario = models.ForeignKey(Formulario, null=True, blank=True, on_delete=models.SET_NULL, related_name='publicaciones')
+    numero = models.PositiveIntegerField()
+    esquema = models.JSONField()
+    huella = models.CharField(max_length=64)
+    fecha = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = 'Formulario publicado'
+        verbose_name_plural = 'Formularios publicados'
+        constraints = [
+            models.UniqueConstraint(fields=['formulario', 'numero'], name='formulario_publicado_numero_unico'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Un formulario publicado no se modifica; hay que publicar una versión nueva")
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.esquema.get('nombre')} v{self.numero}"
+
 class HistorialClinico(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     paciente = models.ForeignKey(Pacientes, on_delete=models.CASCADE)
     usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
     especialidad = models.ForeignKey(Especialidad, on_delete=models.CASCADE)
     formulario = models.ForeignKey(Formulario, null=True, blank=True, on_delete=models.CASCADE)
+    # Versión del formulario con la que se completó; se muestra con ella aunque el formulario cambie
+    formulario_publicado = models.ForeignKey(
+        FormularioPublicado, null=True, blank=True, on_delete=models.PROTECT, related_name='historiales'
+    )
     fecha = models.DateTimeField(auto_now_add=True)
     motivo_consulta = models.TextField()
     fuente = models.CharField(max_length=255)
@@ -49,25 +96,145 @@ class HistorialClinico(models.Model):
         ordering = ['-fecha']
         verbose_name = 'Historial Clinico'
         verbose_name_plural = 'Historiales Clinicos'
+        indexes = [
+            # Línea de tiempo del paciente (linea_tiempo.py): keyset sobre (fecha, id)
+            models.Index(fields=['paciente', 'fecha', 'id'], name='historial_paciente_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"{self.paciente} - {self.fecha}"
     
 class Respuesta(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
-    pregunta = models.ForeignKey(Pregunta, on_delete=models.CASCADE)
+    # Borrar una pregunta con respuestas falla (se desactiva, ver Pregunta.delete); solo se
+    # permite si sus respuestas se borran en la misma operación, p. ej. con el formulario
+    pregunta = models.ForeignKey(Pregunta, on_delete=models.RESTRICT)
     historial_clinico = models.ForeignKey(HistorialClinico, on_delete=models.CASCADE, null=True, blank=True)
     valor = models.TextField()
+    # Copia tipada de valor según pregunta.tipo_dato (ver valores.py); NULL si no aplica
+    valor_numero = models.FloatField(null=True, blank=True, editable=False)
+    valor_booleano = models.BooleanField(null=True, blank=True, editable=False)
+    valor_fecha = models.DateField(null=True, blank=True, editable=False)
+
+    class Meta:
+        constraints = [
+            # Una respuesta por pregunta en cada historial (RespuestaService la actualiza con ON CONFLICT)
+            models.UniqueConstraint(fields=['pregunta', 'historial_clinico'], name='respuesta_pregunta_historial_unica'),
+        ]
+        indexes = [
+            models.Index(fields=['pregunta', 'valor_numero'], name='respuesta_pregunta_numero_idx'),
+            models.Index(fields=['pregunta', 'valor_booleano'], name='respuesta_pregunta_bool_idx'),
+            models.Index(fields=['pregunta', 'valor_fecha'], name='respuesta_pregunta_fecha_idx'),
+        ]
 
     def __str__(self):
         return f"Respuesta a:{self.pregunta.texto}"
+
+    def save(self, *args, **kwargs):
+        for campo, valor in valores_tipados(self.pregunta.tipo_dato, self.valor).items():
+            setattr(self, campo, valor)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'valor' in update_fields:
+            kwargs['update_fields'] = {*update_fields, *CAMPOS_TIPADOS}
+        super().save(*args, **kwargs)
     
+class Blob(models.Model):
+    """Contenido único de uno o más documentos adjuntos, guardado bajo su SHA-256 (ver almacenamiento.py)."""
+    sha256 = models.CharField(max_length=64, primary_key=True)
+    tamano = models.PositiveBigIntegerField()
+    creado = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.sha256
+
 class DocumentoAdjunto(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     historial = models.ForeignKey(HistorialClinico, on_delete=models.CASCADE)
     tipo_documento = models.CharField(max_length=255)
-    archivo = models.FileField()
+    archivo = models.FileField(storage=almacenamiento_documentos)
+    # Nombre original: en disco el archivo se llama como su hash
+    nombre = models.CharField(max_length=255, blank=True)
+    # Cuántos documentos comparten un blob es blob.documentos.count(); sin ninguno, recolectar_blobs lo borra
+    blob = models.ForeignKey(Blob, null=True, blank=True, on_delete=models.PROTECT, related_name='documentos')
     fecha_subida = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['historial', 'fecha_subida', 'id'], name='documento_historial_fecha_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.tipo_documento} - {self.fecha_subida}"
+
+    def save(self, *args, **kwargs):
+        archivo = self.archivo
+        if archivo and not archivo._committed:
+            # Se guarda antes para conocer el hash (el nombre que le da el almacenamiento)
+            self.nombre = self.nombre or os.path.basename(archivo.name)
+            archivo.save(archivo.name, archivo.file, save=False)
+        sha256 = sha256_de_nombre(archivo.name) if archivo else None
+        if sha256 and self.blob_id != sha256:
+            self.blob, _ = Blob.objects.get_or_create(sha256=sha256, defaults={'tamano': archivo.size})
+        super().save(*args, **kwargs)
+
+class SubidaDocumento(models.Model):
+    """
+    Subida por partes de un DocumentoAdjunto (ver subidas.py).
+
+    Las partes se escriben en un archivo temporal y recibido dice hasta qué
+    byte llegó; al finalizar se mueve el archivo y se crea el documento.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    historial = models.ForeignKey(HistorialClinico, on_delete=models.CASCADE)
+    usuario = models.ForeignKey(Usuario, on_delete=models.CASCADE)
+    tipo_documento = models.CharField(max_length=255)
+    nombre = models.CharField(max_length=255)
+    tamano = models.PositiveBigIntegerField()
+    recibido = models.PositiveBigIntegerField(default=0)
+    # SHA-256 esperado (opcional); si viene se compara al finalizar
+    sha256 = models.CharField(max_length=64, blank=True)
+    creado = models.DateTimeField(auto_now_add=True)
+    actualizado = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.nombre} ({self.recibido}/{self.tamano})"
+
+class SignoVital(models.Model):
+    """
+    Un signo vital de un historial, copiado de HistorialClinico.signos_vitales al guardarlo.
+
+    Sirve para las series por paciente (signos.py) sin leer ni recorrer el JSON
+    de cada historial.
+    """
+    METRICA_CHOICES = [(m, m.replace('_', ' ').capitalize()) for m in METRICAS]
+
+    historial = models.ForeignKey(HistorialClinico, on_delete=models.CASCADE, related_name='signos')
+    paciente = models.ForeignKey(Pacientes, on_delete=models.CASCADE)
+    metrica = models.CharField(max_length=40, choices=METRICA_CHOICES)
+    valor = models.FloatField()
+    fecha = models.DateTimeField()
+    # fecha en segundos desde 1970: permite agrupar en intervalos con aritmética entera en cualquier base
+    segundos = models.BigIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['historial', 'metrica'], name='signo_vital_historial_metrica_unico'),
+        ]
+        indexes = [
+            models.Index(fields=['paciente', 'metrica', 'segundos'], name='signo_vital_serie_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.metrica}={self.valor} ({self.fecha})"
+
+class VersionFormularios(models.Model):
+    """
+    Contador único (pk=1) que sube con cada cambio de Formulario o Pregunta.
+
+    Invalida el caché de esquemas de esquemas.py en todos los procesos y sirve
+    de ETag para los endpoints de formularios.
+    """
+    version = models.PositiveBigIntegerField(default=0)
+
     def __str__(self):
-        return f"{self.tipo_documento} - {self.fecha_subida}"
\ No newline at end of file
+        return f"Formularios v{self.version}"
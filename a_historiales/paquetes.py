@@ -0,0 +1,127 @@
+"""
+ZIP con los documentos de un historial o de un paciente, armado mientras se envía.
+
+zipfile escribe sobre un objeto que solo acumula lo escrito (no se puede
+buscar en él, así que usa descriptores de datos) y el generador entrega esos
+bytes después de cada bloque leído: no hay archivo temporal y en memoria
+queda como mucho un bloque. Los formatos que ya vienen comprimidos (imágenes,
+PDF, ZIP, video...) se guardan tal cual para no gastar CPU en comprimirlos de
+nuevo; el resto se comprime con deflate.
+"""
+import os
+import re
+import zipfile
+
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from django.utils.http import content_disposition_header
+
+BLOQUE = 1024 * 1024
+
+YA_COMPRIMIDOS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.tif', '.tiff',
+    '.pdf', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar',
+    '.mp3', '.mp4', '.m4a', '.mov', '.avi', '.mkv', '.webm',
+    '.docx', '.xlsx', '.pptx', '.odt', '.ods',
+}
+
+
+class _Salida:
+    """Destino de zipfile que guarda lo escrito hasta que el generador lo retira."""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def retirar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def compresion(nombre):
+    return zipfile.ZIP_STORED if os.path.splitext(nombre)[1].lower() in YA_COMPRIMIDOS else zipfile.ZIP_DEFLATED
+
+
+def nombre_seguro(texto):
+    return re.sub(r'[\\/:*?"<>|\x00-\x1f]+', '_', str(texto)).strip(' .') or 'documento'
+
+
+def entradas_documentos(documentos, carpeta):
+    """(nombre en el zip, ruta, fecha) de cada documento con archivo; carpeta(documento) da su carpeta."""
+    usados = set()
+    for documento in documentos:
+        if not documento.archivo:
+            continue
+        try:
+            ruta = documento.archivo.path
+        except NotImplementedError:
+            continue
+        if not os.path.exists(ruta):
+            continue
+        base, extension = os.path.splitext(nombre_seguro(documento.nombre or os.path.basename(documento.archivo.name)))
+        nombre = f'{carpeta(documento)}/{base}{extension}'
+        contador = 2
+        while nombre.lower() in usados:
+            nombre = f'{carpeta(documento)}/{base} ({contador}){extension}'
+            contador += 1
+        usados.add(nombre.lower())
+        yield nombre, ruta, documento.fecha_subida
+
+
+def carpeta_historial(documento):
+    return nombre_seguro(documento.tipo_documento or 'otros')
+
+
+def carpeta_paciente(documento):
+    historial = documento.historial
+    # El id corto separa dos consultas del mismo día y especialidad
+    return f"{timezone.localtime(historial.fecha):%Y-%m-%d} {nombre_seguro(historial.especialidad.nombre)} {str(historial.pk)[:8]}"
+
+
+def respuesta_zip(documentos, carpeta, nombre):
+    """StreamingHttpResponse que descarga como nombre el ZIP de los documentos."""
+    respuesta = StreamingHttpResponse(zip_streaming(entradas_documentos(documentos, carpeta)),
+                                      content_type='application/zip')
+    respuesta['Content-Disposition'] = content_disposition_header(True, nombre)
+    # El tamaño final no se conoce; que un proxy no lo acumule antes de enviarlo
+    respuesta['X-Accel-Buffering'] = 'no'
+    respuesta['Cache-Control'] = 'private, no-store'
+    return respuesta
+
+
+def zip_streaming(entradas):
+    """Genera los bytes de un ZIP con cada (nombre, ruta, fecha) de entradas."""
+    salida = _Salida()
+    with zipfile.ZipFile(salida, 'w') as archivo_zip:
+        for nombre, ruta, fecha in entradas:
+            info = zipfile.ZipInfo(nombre, date_time=_fecha_zip(fecha))
+            info.compress_type = compresion(nombre)
+            info.external_attr = 0o644 << 16
+            # force_zip64: el tamaño no se conoce de antemano y puede pasar de 4 GB
+            with open(ruta, 'rb') as origen, archivo_zip.open(info, 'w', force_zip64=True) as destino:
+                for bloque in iter(lambda: origen.read(BLOQUE), b''):
+                    destino.write(bloque)
+                    yield salida.retirar()
+            yield salida.retirar()
+    yield salida.retirar()
+
+
+def _fecha_zip(fecha):
+    # ZIP no admite fechas anteriores a 1980
+    if fecha is None or fecha.year < 1980:
+        return (1980, 1, 1, 0, 0, 0)
+    if timezone.is_aware(fecha):
+        fecha = timezone.localtime(fecha)
+    return fecha.timetuple()[:6]
@@ -0,0 +1,108 @@
+"""
+Miniaturas y vistas previas de los documentos adjuntos que son imágenes.
+
+Al guardar un DocumentoAdjunto (después del commit) se encola su imagen en un
+pool de procesos de tamaño fijo (VISTAS_PREVIAS['PROCESOS']); las peticiones no
+esperan a Pillow. Los archivos derivados van a VISTAS_PREVIAS['DIRECTORIO'] con
+el hash del blob como nombre, así dos documentos con la misma imagen comparten
+sus vistas previas. Mientras no existan, el serializer devuelve null.
+"""
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from django.conf import settings
+
+from .procesos import generar_previas
+
+TIPOS = ('miniatura', 'vista')
+
+_lock = threading.Lock()
+_pool = None
+_pendientes = None
+
+
+def configuracion():
+    return {
+        'DIRECTORIO': os.path.join(settings.MEDIA_ROOT, 'previas'),
+        'MINIATURA': (256, 256),
+        'VISTA': (1600, 1600),
+        'CALIDAD': 82,
+        'PROCESOS': 2,
+        'MAX_PENDIENTES': 200,
+        **getattr(settings, 'VISTAS_PREVIAS', {}),
+    }
+
+
+def clave(documento):
+    return documento.blob_id or str(documento.pk)
+
+
+def ruta_previa(documento, tipo):
+    c = clave(documento)
+    return os.path.join(configuracion()['DIRECTORIO'], c[:2], f'{c}-{tipo}.jpg')
+
+
+def destinos(documento):
+    config = configuracion()
+    return {
+        'miniatura': (ruta_previa(documento, 'miniatura'), tuple(config['MINIATURA']), config['CALIDAD']),
+        'vista': (ruta_previa(documento, 'vista'), tuple(config['VISTA']), config['CALIDAD']),
+    }
+
+
+def existentes(documento):
+    return {tipo: os.path.exists(ruta_previa(documento, tipo)) for tipo in TIPOS}
+
+
+def pool():
+    """Pool de procesos compartido; se crea al primer uso."""
+    global _pool, _pendientes
+    with _lock:
+        if _pool is None:
+            config = configuracion()
+            _pool = ProcessPoolExecutor(max_workers=config['PROCESOS'], mp_context=get_context('spawn'))
+            # Acotar también lo encolado: cada tarea pendiente ocupa memoria en este proceso
+            _pendientes = threading.BoundedSemaphore(config['MAX_PENDIENTES'])
+        return _pool
+
+
+def generar(documento):
+    """Genera las vistas previas en este proceso. Devuelve los tipos generados ([] si no es imagen)."""
+    if not documento.archivo:
+        return []
+    try:
+        return generar_previas(documento.archivo.path, destinos(documento))
+    except Exception as e:
+        print(f"[Previas] Error al generar vistas previas de {documento.pk}: {e}")
+        return []
+
+
+def encolar(documento):
+    """Pide las vistas previas al pool sin esperar. Si la cola está llena no se encola (ver regenerar_previas)."""
+    if not documento.archivo:
+        return None
+    if configuracion()['PROCESOS'] == 0:
+        return generar(documento)
+
+    ejecutor = pool()
+    if not _pendientes.acquire(blocking=False):
+        print(f"[Previas] Cola llena, se omite {documento.pk}")
+        return None
+    try:
+        futuro = ejecutor.submit(generar_previas, documento.archivo.path, destinos(documento))
+    except Exception as e:
+        _pendientes.release()
+        print(f"[Previas] Error al encolar {documento.pk}: {e}")
+        return None
+    futuro.add_done_callback(_terminado(documento.pk))
+    return futuro
+
+
+def _terminado(documento_id):
+    def callback(futuro):
+        _pendientes.release()
+        if futuro.exception() is not None:
+            print(f"[Previas] Error al generar vistas previas de {documento_id}: {futuro.exception()}")
+    return callback
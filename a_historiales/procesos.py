@@ -0,0 +1,118 @@
+"""
+Trabajo que corre en los procesos de los pools de vistas previas (previas.py)
+y de informes PDF (informes.py).
+
+Solo usa Pillow y ReportLab: los procesos se crean con 'spawn' y no cargan
+Django ni abren conexiones a la base de datos. Todo lo que necesitan les llega
+como argumento.
+"""
+import os
+from xml.sax.saxutils import escape
+
+from PIL import Image, ImageOps, UnidentifiedImageError
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import A4
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.lib.units import cm
+from reportlab.platypus import CondPageBreak, Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+
+
+def generar_previas(origen, destinos):
+    """
+    Genera cada destino {tipo: (ruta, (ancho, alto), calidad)} a partir de la imagen origen.
+
+    Devuelve la lista de tipos generados, o [] si origen no es una imagen.
+    Cada archivo se escribe en un temporal y se renombra, así nunca queda uno a medias.
+    """
+    try:
+        imagen = Image.open(origen)
+    except (UnidentifiedImageError, OSError):
+        return []
+
+    with imagen:
+        # Con JPEG, draft() decodifica directamente a una escala menor
+        mayor = max(tamano for _, tamano, _ in destinos.values())
+        imagen.draft('RGB', mayor)
+        imagen = ImageOps.exif_transpose(imagen)
+        if imagen.mode not in ('RGB', 'L'):
+            imagen = imagen.convert('RGB')
+
+        generados = []
+        # De la más grande a la más chica: cada una se reduce desde la anterior
+        for tipo, (ruta, tamano, calidad) in sorted(destinos.items(), key=lambda d: d[1][1], reverse=True):
+            imagen.thumbnail(tamano, Image.Resampling.LANCZOS)
+            os.makedirs(os.path.dirname(ruta), exist_ok=True)
+            temporal = f'{ruta}.{os.getpid()}.tmp'
+            imagen.save(temporal, 'JPEG', quality=calidad, optimize=True, progressive=True)
+            os.replace(temporal, ruta)
+            generados.append(tipo)
+    return generados
+
+
+def renderizar_informe(datos, ruta):
+    """
+    Escribe en ruta el PDF de datos (ver informes.py): {'titulo', 'huella', 'paciente', 'historiales'}.
+
+    Como las vistas previas, se escribe en un temporal y se renombra.
+    """
+    estilos = getSampleStyleSheet()
+    normal, titulo, seccion = estilos['BodyText'], estilos['Title'], estilos['Heading2']
+
+    def texto(valor):
+        return Paragraph(escape(str(valor if valor not in (None, '') else '-')).replace('\n', '<br/>'), normal)
+
+    def tabla(filas, anchos):
+        t = Table([[texto(celda) for celda in fila] for fila in filas], colWidths=anchos, hAlign='LEFT')
+        t.setStyle(TableStyle([
+            ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+            ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+            ('BACKGROUND', (0, 0), (0, -1), colors.whitesmoke),
+        ]))
+        return t
+
+    paciente = datos['paciente']
+    elementos = [
+        Paragraph(escape(datos['titulo']), titulo),
+        tabla([(campo, paciente[campo]) for campo in paciente], [5 * cm, 12 * cm]),
+    ]
+    for historial in datos['historiales']:
+        elementos += [
+            CondPageBreak(6 * cm),
+            Paragraph(escape(f"{historial['fecha']} · {historial['especialidad']}"), seccion),
+            tabla([
+                ('Profesional', historial['profesional']),
+                ('Motivo de consulta', historial['motivo_consulta']),
+                ('Fuente', historial['fuente']),
+                ('Confiabilidad', historial['confiabilidad']),
+                ('Diagnóstico', historial['diagnostico']),
+            ], [5 * cm, 12 * cm]),
+        ]
+        if historial['signos_vitales']:
+            elementos += [Spacer(1, 0.3 * cm), Paragraph('Signos vitales', estilos['Heading4']),
+                          tabla(historial['signos_vitales'], [5 * cm, 12 * cm])]
+        if historial['preguntas']:
+            elementos += [Spacer(1, 0.3 * cm), Paragraph(escape(f"Formulario: {historial['formulario']}"), estilos['Heading4']),
+                          tabla(historial['preguntas'], [7 * cm, 10 * cm])]
+        if historial['documentos']:
+            elementos += [Spacer(1, 0.3 * cm), Paragraph('Documentos adjuntos', estilos['Heading4']),
+                          tabla(historial['documentos'], [7 * cm, 4 * cm, 3.5 * cm, 2.5 * cm])]
+    if not datos['historiales']:
+        elementos.append(texto('Sin historiales clínicos'))
+
+    def pie(canvas, documento):
+        canvas.saveState()
+        canvas.setFont('Helvetica', 8)
+        canvas.drawString(2 * cm, 1.2 * cm, f"{datos['titulo']} · {datos['huella'][:12]}")
+        canvas.drawRightString(A4[0] - 2 * cm, 1.2 * cm, f"Página {documento.page}")
+        canvas.restoreState()
+
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    temporal = f'{ruta}.{os.getpid()}.tmp'
+    try:
+        SimpleDocTemplate(temporal, pagesize=A4, title=datos['titulo'], leftMargin=2 * cm, rightMargin=2 * cm,
+                          topMargin=2 * cm, bottomMargin=2 * cm).build(elementos, onFirstPage=pie, onLaterPages=pie)
+        os.replace(temporal, ruta)
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+    return ruta
@@ -0,0 +1,53 @@
+"""
+Versiones publicadas (inmutables) de los formularios.
+
+Publicar guarda en una fila de FormularioPublicado el esquema compilado del
+formulario: el mismo JSON de /formularios/<id>/, con las preguntas por orden.
+Esa fila no se modifica más. Cada historial apunta a la versión con la que
+se completó, así que editar o borrar preguntas después no cambia cómo se ve
+un historial pasado. Para mostrarlo basta con esa fila, que llega en el mismo
+SELECT del historial (select_related), en vez de las preguntas vigentes.
+Como una versión publicada nunca cambia, se puede cachear para siempre por id.
+"""
+import hashlib
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+
+from .esquemas import esquema_formulario
+from .models import Formulario, FormularioPublicado
+
+
+def huella(esquema):
+    crudo = json.dumps(esquema, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(crudo.encode()).hexdigest()
+
+
+def compilar(formulario):
+    """Esquema del formulario listo para guardar en JSON (UUID y fechas como texto)."""
+    return json.loads(json.dumps(esquema_formulario(formulario.pk), cls=DjangoJSONEncoder))
+
+
+@transaction.atomic
+def publicar(formulario):
+    """
+    (versión publicada, creada) del formulario tal como está ahora.
+
+    Si no cambió desde la última publicación se devuelve esa misma y no se
+    crea otra.
+    """
+    # El bloqueo ordena dos publicaciones simultáneas del mismo formulario (mismo número)
+    list(Formulario.objects.select_for_update().filter(pk=formulario.pk).values_list('pk'))
+    esquema = compilar(formulario)
+    actual = huella(esquema)
+    ultima = formulario.publicaciones.order_by('-numero').first()
+    if ultima is not None and ultima.huella == actual:
+        return ultima, False
+    return FormularioPublicado.objects.create(
+        formulario=formulario,
+        numero=ultima.numero + 1 if ultima else 1,
+        esquema=esquema,
+        huella=actual,
+    ), True
+
@@ -1,21 +1,80 @@
+import os
+
+from django.urls import reverse
 from rest_framework import serializers
-from .models import HistorialClinico, Formulario, Pregunta, Respuesta, DocumentoAdjunto
+from .models import (HistorialClinico, Formulario, FormularioPublicado, Pregunta, Respuesta, DocumentoAdjunto,
+                     SubidaDocumento)
+from .ensamblado import ensamblar, preguntas_historial
+from . import previas
 
 class DocumentoAdjuntoSerializer(serializers.ModelSerializer):
+    # URL de la miniatura y de la vista previa (previas.py); null si no es imagen o todavía no se generó
+    miniatura = serializers.SerializerMethodField()
+    vista_previa = serializers.SerializerMethodField()
+
     class Meta:
         model = DocumentoAdjunto
         fields = '__all__'
+        read_only_fields = ['blob']
+
+    def url_previa(self, obj, tipo):
+        if not obj.archivo or not os.path.exists(previas.ruta_previa(obj, tipo)):
+            return None
+        url = reverse('documentos-previa', kwargs={'pk': obj.pk, 'tipo': tipo})
+        request = self.context.get('request')
+        return request.build_absolute_uri(url) if request else url
+
+    def get_miniatura(self, obj):
+        return self.url_previa(obj, 'miniatura')
+
+    def get_vista_previa(self, obj):
+        return self.url_previa(obj, 'vista')
+
+class SubidaDocumentoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SubidaDocumento
+        fields = ['id', 'historial', 'tipo_documento', 'nombre', 'tamano', 'recibido', 'sha256', 'creado', 'actualizado']
+        read_only_fields = ['recibido', 'creado', 'actualizado']
 
 class RespuestaSerializer(serializers.ModelSerializer):
     class Meta:
         model = Respuesta
         fields = ['id', 'pregunta', 'historial_clinico', 'valor']
 
+class PreguntaListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # Un solo INSERT para toda la lista; bulk_create no dispara señales (ver PreguntaViewSet.perform_create)
+        return Pregunta.objects.bulk_create([Pregunta(**item) for item in validated_data])
+
 class PreguntaSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Pregunta
         fields = '__all__'
+        read_only_fields = ['activo']
+        list_serializer_class = PreguntaListSerializer
+
+class PreguntaNuevaSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Pregunta
+        fields = ['texto', 'tipo_dato', 'obligatorio', 'orden']
+        extra_kwargs = {'orden': {'required': False}}
+
+class PreguntaCambioSerializer(serializers.ModelSerializer):
+    id = serializers.UUIDField()
+
+    class Meta:
+        model = Pregunta
+        fields = ['id', 'texto', 'tipo_dato', 'obligatorio', 'orden']
+        extra_kwargs = {campo: {'required': False} for campo in ['texto', 'tipo_dato', 'obligatorio', 'orden']}
+
+class PreguntasLoteSerializer(serializers.Serializer):
+    """Cambios a las preguntas de un formulario para PreguntaService.aplicar_lote."""
+    formulario = serializers.PrimaryKeyRelatedField(queryset=Formulario.objects.all())
+    crear = PreguntaNuevaSerializer(many=True, default=list)
+    actualizar = PreguntaCambioSerializer(many=True, default=list)
+    eliminar = serializers.ListField(child=serializers.UUIDField(), default=list)
+    orden = serializers.ListField(child=serializers.UUIDField(), required=False)
 
 class PreguntaConRespuestaSerializer(serializers.ModelSerializer):
     respuesta = serializers.SerializerMethodField()
@@ -30,6 +89,10 @@ class PreguntaConRespuestaSerializer(serializers.ModelSerializer):
         
         # Verifica que el historial clínico no sea None
         if historial_clinico:
+            # Si ya se ensamblaron las respuestas (ver ensamblado.py), no se consulta nada
+            respuestas = self.context.get('respuestas')
+            if respuestas is not None:
+                return respuestas.get((historial_clinico.pk, obj.pk))
             respuesta = Respuesta.objects.filter(pregunta=obj, historial_clinico=historial_clinico).first()
             return respuesta.valor if respuesta else None
         return None
@@ -41,37 +104,53 @@ class FormularioSerializer(serializers.ModelSerializer):
         model = Formulario
         fields = '__all__'
 
+class FormularioPublicadoSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = FormularioPublicado
+        fields = ['id', 'formulario', 'numero', 'fecha', 'huella', 'esquema']
+        read_only_fields = fields
+
+class HistorialClinicoListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        # Preguntas y respuestas de toda la página en dos consultas
+        historiales = list(data.all() if hasattr(data, 'all') else data)
+        ensamblar(historiales, self.context)
+        return super().to_representation(historiales)
+
 class HistorialClinicoSerializer(serializers.ModelSerializer):
     documento_adjunto = DocumentoAdjuntoSerializer(many=True, read_only=True, source='documentoadjunto_set')
-    formulario = FormularioSerializer(read_only=True, required=False)  # Hacer que formulario sea opcional
+    formulario = serializers.SerializerMethodField()  # Opcional: None si no tiene formulario
     preguntas_respuestas = serializers.SerializerMethodField()  # Agregar un campo de preguntas_respuestas
 
     class Meta:
         model = HistorialClinico
         fields = '__all__'
+        read_only_fields = ['formulario_publicado']
+        list_serializer_class = HistorialClinicoListSerializer
+
+    def to_representation(self, instance):
+        # Un historial suelto (detalle, create/update) se ensambla solo
+        if instance.pk not in self.context.get('historiales_ensamblados', ()):
+            ensamblar([instance], self.context)
+        return super().to_representation(instance)
+
+    def get_formulario(self, obj):
+        # La versión publicada con la que se completó, tal como estaba; si no tiene, el formulario vigente
+        if obj.formulario_publicado_id:
+            return obj.formulario_publicado.esquema
+        if obj.formulario:
+            return FormularioSerializer(obj.formulario, context=self.context).data
+        return None
 
     def get_preguntas_respuestas(self, obj):
-        # Obtener el formulario asignado al historial
-        formulario = obj.formulario
-        if formulario:
-            # Obtener las preguntas del formulario
-            preguntas = Pregunta.objects.filter(formulario=formulario).order_by('orden')
-            respuestas = []
-
-            for pregunta in preguntas:
-                # Buscar la respuesta asociada a cada pregunta en este historial clínico
-                respuesta = Respuesta.objects.filter(pregunta=pregunta, historial_clinico=obj).first()
-                respuestas.append({
-                    'pregunta_id': pregunta.id,
-                    'texto': pregunta.texto,
-                    'tipo_dato': pregunta.tipo_dato,
-                    'respuesta': respuesta.valor if respuesta else None
-                })
-
-            return respuestas
-        return []   
-
-
-
-
-
+        # Preguntas (ya ordenadas) y respuestas vienen de ensamblar()
+        respuestas = self.context['respuestas']
+        return [
+            {
+                'pregunta_id': pregunta_id,
+                'texto': texto,
+                'tipo_dato': tipo_dato,
+                'respuesta': respuestas.get((obj.pk, pregunta_id)),
+            }
+            for pregunta_id, texto, tipo_dato in preguntas_historial(obj)
+        ]
@@ -0,0 +1,226 @@
+import uuid
+
+from django.db import transaction
+
+from .esquemas import subir_version, version_diferida
+from .models import Pregunta, Respuesta
+from .publicaciones import publicar
+from .valores import CAMPOS_TIPADOS, valores_tipados
+
+
+class RespuestasInvalidas(Exception):
+    def __init__(self, errores):
+        super().__init__('Hay respuestas inválidas')
+        self.errores = errores
+
+
+class PreguntasInvalidas(Exception):
+    def __init__(self, errores):
+        super().__init__('Hay cambios de preguntas inválidos')
+        self.errores = errores
+
+
+class RespuestaService:
+    @staticmethod
+    def validar_respuestas(formulario, respuestas_data):
+        """
+        Valida todos los ítems {'pregunta', 'valor'} con una sola consulta de preguntas.
+
+        Devuelve (respuestas, errores): respuestas es {pregunta_id: campos}, con
+        campos = {'valor', 'valor_numero', 'valor_booleano', 'valor_fecha'}, y
+        errores una lista de {'indice', 'pregunta', 'error'}, uno por ítem inválido.
+        """
+        if not isinstance(respuestas_data, list):
+            return {}, [{'indice': None, 'pregunta': None, 'error': 'respuestas debe ser una lista'}]
+
+        items, errores = [], []
+        for indice, item in enumerate(respuestas_data):
+            pregunta_id = item.get('pregunta') if isinstance(item, dict) else None
+            if not pregunta_id:
+                errores.append({'indice': indice, 'pregunta': None, 'error': 'Falta la pregunta'})
+                continue
+            try:
+                pregunta_id = uuid.UUID(str(pregunta_id))
+            except ValueError:
+                errores.append({'indice': indice, 'pregunta': item.get('pregunta'), 'error': 'Id de pregunta inválido'})
+                continue
+            items.append((indice, pregunta_id, item.get('valor')))
+
+        preguntas = {
+            pregunta_id: (formulario_id, tipo_dato, activo)
+            for pregunta_id, formulario_id, tipo_dato, activo in
+            Pregunta.objects.filter(id__in={pregunta_id for _, pregunta_id, _ in items})
+            .values_list('id', 'formulario_id', 'tipo_dato', 'activo')
+        }
+
+        respuestas = {}
+        for indice, pregunta_id, valor in items:
+            error = None
+            if pregunta_id not in preguntas:
+                error = 'La pregunta no existe'
+            elif preguntas[pregunta_id][0] != formulario.pk:
+                error = 'La pregunta no pertenece al formulario'
+            elif not preguntas[pregunta_id][2]:
+                error = 'La pregunta fue eliminada del formulario'
+            elif pregunta_id in respuestas:
+                error = 'Pregunta repetida'
+            elif valor is None:
+                error = 'Falta el valor'
+
+            if error:
+                errores.append({'indice': indice, 'pregunta': str(pregunta_id), 'error': error})
+            else:
+                valor = str(valor)
+                respuestas[pregunta_id] = {'valor': valor, **valores_tipados(preguntas[pregunta_id][1], valor)}
+
+        errores.sort(key=lambda e: e['indice'])
+        return respuestas, errores
+
+    @staticmethod
+    @transaction.atomic
+    def asignar_formulario(historial, formulario, respuestas_data):
+        """
+        Asigna el formulario y guarda todas las respuestas en una transacción.
+
+        Las respuestas se escriben con un solo INSERT ... ON CONFLICT sobre
+        (pregunta, historial_clinico). Si algún ítem es inválido no se guarda
+        nada y se lanza RespuestasInvalidas con los errores por ítem.
+
+        El historial queda apuntando a la versión publicada del formulario tal
+        como está ahora (se publica una nueva si cambió desde la última).
+        """
+        respuestas, errores = RespuestaService.validar_respuestas(formulario, respuestas_data)
+        if errores:
+            raise RespuestasInvalidas(errores)
+
+        historial.formulario = formulario
+        historial.formulario_publicado, _ = publicar(formulario)
+        historial.save(update_fields=['formulario', 'formulario_publicado'])
+
+        Respuesta.objects.bulk_create(
+            [
+                Respuesta(pregunta_id=pregunta_id, historial_clinico=historial, **campos)
+                for pregunta_id, campos in respuestas.items()
+            ],
+            batch_size=500,
+            update_conflicts=True,
+            unique_fields=['pregunta', 'historial_clinico'],
+            update_fields=['valor', *CAMPOS_TIPADOS],
+        )
+        return len(respuestas)
+
+    @staticmethod
+    def retipar_respuestas(pregunta, lote=2000):
+        """Recalcula las columnas tipadas de las respuestas de la pregunta (tras cambiar su tipo_dato)."""
+        total, pendientes = 0, []
+        for respuesta in Respuesta.objects.filter(pregunta=pregunta).only('id', 'valor').iterator(chunk_size=lote):
+            for campo, valor in valores_tipados(pregunta.tipo_dato, respuesta.valor).items():
+                setattr(respuesta, campo, valor)
+            pendientes.append(respuesta)
+            if len(pendientes) >= lote:
+                total += Respuesta.objects.bulk_update(pendientes, CAMPOS_TIPADOS)
+                pendientes = []
+        if pendientes:
+            total += Respuesta.objects.bulk_update(pendientes, CAMPOS_TIPADOS)
+        return total
+
+
+class PreguntaService:
+    @staticmethod
+    @transaction.atomic
+    def aplicar_lote(formulario, crear=(), actualizar=(), eliminar=(), orden=None):
+        """
+        Crea, actualiza, elimina y reordena preguntas del formulario en una transacción.
+
+        crear: [{texto, tipo_dato, obligatorio, orden?}]; sin orden van al final.
+        actualizar: [{id, campos a cambiar}]. eliminar: [id]; las que ya tienen
+        respuestas no se borran, se desactivan (activo=False).
+        orden: ids de todas las preguntas activas que quedan (sin las nuevas), en su orden nuevo.
+
+        Una sentencia por tipo de operación: un DELETE (más un UPDATE de activo si
+        alguna tiene respuestas), un UPDATE (cambios y orden juntos) y un INSERT. Si algo es inválido no se cambia nada y se lanza
+        PreguntasInvalidas con {'operacion', 'indice', 'id', 'error'} por problema.
+        """
+        existentes = {p.pk: p for p in Pregunta.objects.select_for_update().filter(formulario=formulario, activo=True)}
+        errores = []
+
+        def error(operacion, indice, id_, mensaje):
+            errores.append({'operacion': operacion, 'indice': indice, 'id': str(id_) if id_ else None, 'error': mensaje})
+
+        borrar = set()
+        for indice, id_ in enumerate(eliminar):
+            if id_ not in existentes:
+                error('eliminar', indice, id_, 'La pregunta no pertenece al formulario')
+            elif id_ in borrar:
+                error('eliminar', indice, id_, 'Pregunta repetida')
+            borrar.add(id_)
+
+        cambios = {}
+        for indice, item in enumerate(actualizar):
+            id_ = item['id']
+            if id_ not in existentes:
+                error('actualizar', indice, id_, 'La pregunta no pertenece al formulario')
+            elif id_ in cambios:
+                error('actualizar', indice, id_, 'Pregunta repetida')
+            elif id_ in borrar:
+                error('actualizar', indice, id_, 'La pregunta también se elimina')
+            cambios[id_] = {campo: valor for campo, valor in item.items() if campo != 'id'}
+
+        if orden is not None and (len(orden) != len(set(orden)) or set(orden) != set(existentes) - borrar):
+            error('orden', None, None, 'orden debe incluir una vez cada pregunta que queda en el formulario')
+
+        if errores:
+            raise PreguntasInvalidas(errores)
+
+        modificadas, campos, retipar = {}, set(), []
+        for id_, valores in cambios.items():
+            pregunta = existentes[id_]
+            if valores.get('tipo_dato', pregunta.tipo_dato) != pregunta.tipo_dato:
+                retipar.append(pregunta)
+            for campo, valor in valores.items():
+                setattr(pregunta, campo, valor)
+            campos.update(valores)
+            modificadas[id_] = pregunta
+        for posicion, id_ in enumerate(orden or (), start=1):
+            pregunta = existentes[id_]
+            if pregunta.orden != posicion:
+                pregunta.orden = posicion
+                campos.add('orden')
+                modificadas[id_] = pregunta
+
+        siguiente = max((p.orden for id_, p in existentes.items() if id_ not in borrar), default=0) + 1
+        nuevas = []
+        for item in crear:
+            datos = dict(item)
+            if datos.get('orden') is None:
+                datos['orden'] = siguiente
+                siguiente += 1
+            nuevas.append(Pregunta(formulario=formulario, **datos))
+
+        # post_delete sube la versión de esquemas por cada fila borrada: se junta en una sola
+        with version_diferida():
+            if borrar:
+                # Las que ya tienen respuestas solo se desactivan (como Pregunta.delete): los
+                # historiales completados con una versión anterior siguen mostrando esas respuestas
+                con_respuestas = set(
+                    Respuesta.objects.filter(pregunta_id__in=borrar).values_list('pregunta_id', flat=True).distinct()
+                )
+                if con_respuestas:
+                    Pregunta.objects.filter(pk__in=con_respuestas).update(activo=False)
+                Pregunta.objects.filter(pk__in=borrar - con_respuestas).delete()
+            if modificadas:
+                Pregunta.objects.bulk_update(list(modificadas.values()), sorted(campos))
+            if nuevas:
+                Pregunta.objects.bulk_create(nuevas)
+            # bulk_update y bulk_create no disparan señales
+            for pregunta in retipar:
+                RespuestaService.retipar_respuestas(pregunta)
+            if borrar or modificadas or nuevas:
+                subir_version()
+
+        return {
+            'creadas': len(nuevas),
+            'actualizadas': len(cambios),
+            'eliminadas': len(borrar),
+            'reordenadas': orden is not None,
+        }
@@ -0,0 +1,58 @@
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from .esquemas import subir_version
+from . import busqueda, previas
+from .models import DocumentoAdjunto, Formulario, HistorialClinico, Pregunta
+from .services import RespuestaService
+from .signos import sincronizar
+
+
+@receiver([post_save, post_delete], sender=Formulario)
+@receiver([post_save, post_delete], sender=Pregunta)
+def invalidar_esquemas(sender, **kwargs):
+    # queryset.update() y bulk_create no disparan señales: quien los use debe llamar a subir_version()
+    subir_version()
+
+
+@receiver(pre_save, sender=Pregunta)
+def detectar_cambio_tipo(sender, instance, **kwargs):
+    anterior = Pregunta.objects.filter(pk=instance.pk).values_list('tipo_dato', flat=True).first()
+    instance._retipar = anterior is not None and anterior != instance.tipo_dato
+
+
+@receiver(post_save, sender=Pregunta)
+def retipar_respuestas(sender, instance, created, **kwargs):
+    # Con otro tipo_dato cambian las columnas tipadas de todas sus respuestas
+    if getattr(instance, '_retipar', False):
+        RespuestaService.retipar_respuestas(instance)
+
+
+@receiver(post_save, sender=HistorialClinico)
+def copiar_signos_vitales(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or {'signos_vitales', 'fecha', 'paciente'} & set(update_fields):
+        sincronizar([instance])
+
+
+@receiver(post_save, sender=DocumentoAdjunto)
+def generar_vistas_previas(sender, instance, created, update_fields=None, **kwargs):
+    if not (created or update_fields is None or 'archivo' in update_fields):
+        return
+    # Otro documento con la misma imagen (mismo blob) ya las tiene
+    if all(previas.existentes(instance).values()):
+        return
+    transaction.on_commit(lambda: previas.encolar(instance))
+
+
+@receiver(post_migrate)
+def reparar_busqueda(sender, using='default', **kwargs):
+    # En SQLite, reconstruir la tabla de historiales (AlterField, AddField...) borra los triggers de búsqueda
+    conexion = connections[using]
+    if sender.name != 'a_historiales' or conexion.vendor != 'sqlite':
+        return
+    if busqueda.TABLA_FTS not in conexion.introspection.table_names():
+        return
+    with conexion.cursor() as cursor:
+        if busqueda.instalar_sqlite(cursor):
+            print("[Búsqueda] Triggers de búsqueda recreados y texto reindexado")
@@ -0,0 +1,88 @@
+"""
+Series de signos vitales por paciente.
+
+Al guardar un historial sus signos vitales conocidos (valores.METRICAS) se
+copian a SignoVital, una fila por métrica. Las series se piden en N
+intervalos iguales entre dos fechas y la base de datos devuelve, por
+intervalo, mínimo, máximo, promedio y cantidad: la respuesta tiene a lo sumo
+N puntos por métrica sin importar cuántos años de historiales haya.
+"""
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Avg, BigIntegerField, Count, ExpressionWrapper, F, Max, Min
+
+from .models import SignoVital
+from .valores import extraer_signos
+
+
+def segundos_de(fecha):
+    return int(fecha.timestamp())
+
+
+@transaction.atomic
+def sincronizar(historiales):
+    """Reemplaza las filas de SignoVital de los historiales por las de su signos_vitales actual."""
+    historiales = list(historiales)
+    SignoVital.objects.filter(historial__in=[h.pk for h in historiales]).delete()
+    SignoVital.objects.bulk_create(
+        [
+            SignoVital(
+                historial_id=h.pk, paciente_id=h.paciente_id, metrica=metrica, valor=valor,
+                fecha=h.fecha, segundos=segundos_de(h.fecha),
+            )
+            for h in historiales
+            for metrica, valor in extraer_signos(h.signos_vitales).items()
+        ],
+        batch_size=1000,
+    )
+
+
+def serie(paciente_id, metricas, desde=None, hasta=None, intervalos=100):
+    """
+    {métrica: [{'desde', 'hasta', 'min', 'max', 'avg', 'n'}, ...]} del paciente.
+
+    Sin desde/hasta se usan la primera y la última medición. Los intervalos
+    sin mediciones no aparecen.
+    """
+    filas = SignoVital.objects.filter(paciente_id=paciente_id, metrica__in=metricas)
+    if desde is not None:
+        filas = filas.filter(segundos__gte=segundos_de(desde))
+    if hasta is not None:
+        filas = filas.filter(segundos__lte=segundos_de(hasta))
+
+    if desde is None or hasta is None:
+        limites = filas.aggregate(primero=Min('segundos'), ultimo=Max('segundos'))
+        if limites['primero'] is None:
+            return {metrica: [] for metrica in metricas}
+    inicio = segundos_de(desde) if desde is not None else limites['primero']
+    fin = segundos_de(hasta) if hasta is not None else limites['ultimo']
+    # +1 para que la última medición caiga en el último intervalo y no en uno más
+    ancho = max(1, fin - inicio + 1)
+
+    grupos = (
+        filas
+        .annotate(intervalo=ExpressionWrapper(
+            (F('segundos') - inicio) * intervalos / ancho, output_field=BigIntegerField()
+        ))
+        .values('metrica', 'intervalo')
+        .annotate(min=Min('valor'), max=Max('valor'), avg=Avg('valor'), n=Count('id'))
+        .order_by('metrica', 'intervalo')
+    )
+
+    resultado = {metrica: [] for metrica in metricas}
+    for grupo in grupos:
+        i = grupo['intervalo']
+        resultado[grupo['metrica']].append({
+            'desde': _fecha(inicio + ancho * i / intervalos),
+            'hasta': _fecha(inicio + ancho * (i + 1) / intervalos),
+            'min': grupo['min'],
+            'max': grupo['max'],
+            'avg': round(grupo['avg'], 3),
+            'n': grupo['n'],
+        })
+    return resultado
+
+
+def _fecha(segundos):
+    return datetime.fromtimestamp(segundos, tz=dt_timezone.utc)
@@ -0,0 +1,241 @@
+"""
+Subidas por partes y reanudables de documentos adjuntos.
+
+1. crear(): abre una sesión (SubidaDocumento) y un archivo temporal vacío.
+2. recibir(): cada parte llega con su posición (Content-Range) y se copia del
+   cuerpo de la petición al archivo en bloques, sin cargarla entera en memoria
+   ni tener una transacción abierta, actualizando el SHA-256 a medida que se
+   escribe. Si la conexión se corta a mitad, recibido queda en el último byte
+   escrito y se retoma desde ahí.
+3. finalizar(): con todo recibido, mueve el archivo a su blob (almacenamiento.py)
+   y crea el DocumentoAdjunto en una transacción.
+
+El SHA-256 parcial de cada sesión se guarda en memoria del proceso; si la
+siguiente parte llega a otro proceso (o tras un reinicio) se recalcula una vez
+leyendo lo que ya está en disco.
+"""
+import fcntl
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+from django.utils.text import get_valid_filename
+
+from .models import DocumentoAdjunto, SubidaDocumento
+
+BLOQUE = 64 * 1024
+MAX_HASHES = 256
+
+_lock = threading.Lock()
+_hashes = OrderedDict()  # subida_id -> (recibido, sha256 parcial)
+
+
+class ErrorSubida(Exception):
+    def __init__(self, mensaje, estado=400, **datos):
+        super().__init__(mensaje)
+        self.estado = estado
+        self.datos = datos
+
+
+def configuracion():
+    return {
+        'DIRECTORIO': os.path.join(settings.BASE_DIR, 'var', 'subidas'),
+        'TAMANO_MAXIMO': 2 * 1024 ** 3,
+        'CADUCIDAD_HORAS': 24,
+        **getattr(settings, 'SUBIDAS_DOCUMENTOS', {}),
+    }
+
+
+def ruta_temporal(subida):
+    return os.path.join(configuracion()['DIRECTORIO'], f'{subida.pk}.part')
+
+
+def crear(historial, usuario, tipo_documento, nombre, tamano, sha256=''):
+    if tamano < 1:
+        raise ErrorSubida('El tamaño debe ser mayor que cero')
+    if tamano > configuracion()['TAMANO_MAXIMO']:
+        raise ErrorSubida('El archivo supera el tamaño máximo permitido', estado=413)
+    subida = SubidaDocumento.objects.create(
+        historial=historial, usuario=usuario, tipo_documento=tipo_documento,
+        nombre=get_valid_filename(os.path.basename(nombre)) or 'documento',
+        tamano=tamano, sha256=(sha256 or '').lower(),
+    )
+    os.makedirs(configuracion()['DIRECTORIO'], exist_ok=True)
+    open(ruta_temporal(subida), 'wb').close()
+    return subida
+
+
+def _hash_parcial(subida):
+    """SHA-256 de los primeros subida.recibido bytes: el de memoria o, si no está al día, leído del disco."""
+    with _lock:
+        guardado = _hashes.pop(subida.pk, None)
+    if guardado is not None and guardado[0] == subida.recibido:
+        return guardado[1]
+
+    sha = hashlib.sha256()
+    pendiente = subida.recibido
+    with open(ruta_temporal(subida), 'rb') as archivo:
+        while pendiente:
+            bloque = archivo.read(min(BLOQUE, pendiente))
+            if not bloque:
+                break
+            sha.update(bloque)
+            pendiente -= len(bloque)
+    return sha
+
+
+def _guardar_hash(subida, sha):
+    with _lock:
+        _hashes[subida.pk] = (subida.recibido, sha)
+        while len(_hashes) > MAX_HASHES:
+            _hashes.popitem(last=False)
+
+
+def recibir(subida_id, usuario, inicio, longitud, total, flujo):
+    """
+    Escribe longitud bytes de flujo a partir de inicio. Las partes van en orden:
+    inicio debe ser igual a lo ya recibido (si no, 409 con recibido).
+
+    Ninguna transacción queda abierta mientras se lee del cliente: con la fila
+    bloqueada solo se valida la parte y se reclama la subida (flock sobre el
+    archivo temporal, que se libera solo si el proceso muere); la copia va fuera
+    y al final una transacción corta anota recibido.
+    """
+    with transaction.atomic():
+        subida = obtener(subida_id, usuario, bloquear=True)
+        if total is not None and total != subida.tamano:
+            raise ErrorSubida('El total no coincide con el tamaño de la subida', recibido=subida.recibido)
+        if inicio != subida.recibido:
+            raise ErrorSubida('La parte no empieza donde termina lo recibido', estado=409, recibido=subida.recibido)
+        if longitud < 1 or inicio + longitud > subida.tamano:
+            raise ErrorSubida('La parte se sale del tamaño de la subida', estado=416, recibido=subida.recibido)
+        archivo = _reclamar(subida)
+
+    escritos = 0
+    try:
+        sha = _hash_parcial(subida)
+        archivo.seek(inicio)
+        while escritos < longitud:
+            try:
+                bloque = flujo.read(min(BLOQUE, longitud - escritos))
+            except OSError:
+                # El cliente cortó la conexión
+                bloque = b''
+            if not bloque:
+                break
+            archivo.write(bloque)
+            sha.update(bloque)
+            escritos += len(bloque)
+        archivo.flush()
+    finally:
+        try:
+            # Aunque la conexión se corte, lo escrito cuenta y se retoma desde ahí
+            with transaction.atomic():
+                anotada = SubidaDocumento.objects.filter(pk=subida.pk, recibido=inicio).update(
+                    recibido=inicio + escritos, actualizado=timezone.now(),
+                )
+        finally:
+            # Cerrar el archivo suelta el reclamo
+            archivo.close()
+
+    if not anotada:
+        # Se canceló o venció mientras llegaba la parte
+        raise ErrorSubida('Subida no encontrada', estado=404)
+    subida.recibido = inicio + escritos
+    _guardar_hash(subida, sha)
+    if escritos < longitud:
+        raise ErrorSubida('La parte llegó incompleta', recibido=subida.recibido)
+    return subida
+
+
+def _reclamar(subida):
+    """Archivo temporal abierto y con flock exclusivo; 409 si otra parte de la subida se está recibiendo."""
+    archivo = open(ruta_temporal(subida), 'r+b')
+    try:
+        fcntl.flock(archivo, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        archivo.close()
+        raise ErrorSubida('Ya se está recibiendo una parte de esta subida', estado=409, recibido=subida.recibido)
+    return archivo
+
+
+def finalizar(subida_id, usuario, sha256=''):
+    """Crea el DocumentoAdjunto con el archivo completo. Devuelve (documento, sha256)."""
+    with transaction.atomic():
+        subida = obtener(subida_id, usuario, bloquear=True)
+        if subida.recibido != subida.tamano:
+            raise ErrorSubida('Faltan partes por subir', estado=409, recibido=subida.recibido)
+        # Una parte que todavía se está copiando tiene el archivo reclamado
+        _reclamar(subida).close()
+
+        digest = _hash_parcial(subida).hexdigest()
+        esperado = (sha256 or subida.sha256).lower()
+        if esperado and esperado != digest:
+            raise ErrorSubida('El SHA-256 no coincide con el archivo recibido', sha256=digest)
+
+        # El archivo temporal se mueve a su blob (o se descarta si el contenido ya estaba)
+        almacenamiento = DocumentoAdjunto._meta.get_field('archivo').storage
+        with ArchivoTemporal(ruta_temporal(subida), sha256=digest) as archivo:
+            nombre = almacenamiento.save(subida.nombre, archivo)
+        # Si algo falla desde aquí la transacción revierte la fila de Blob, pero el archivo ya quedó
+        # en blobs/: recolectar_blobs lo borra como archivo sin fila pasada la gracia
+        documento = DocumentoAdjunto.objects.create(
+            historial_id=subida.historial_id, tipo_documento=subida.tipo_documento,
+            archivo=nombre, nombre=subida.nombre,
+        )
+        pk = subida.pk
+        subida.delete()
+
+    _descartar(pk)
+    return documento, digest
+
+
+def cancelar(subida_id, usuario):
+    subida = obtener(subida_id, usuario)
+    pk = subida.pk
+    subida.delete()
+    _descartar(pk)
+
+
+def limpiar_vencidas(ahora=None):
+    """Borra las subidas sin actividad desde hace CADUCIDAD_HORAS y sus archivos temporales."""
+    limite = (ahora or timezone.now()) - timedelta(hours=configuracion()['CADUCIDAD_HORAS'])
+    vencidas = list(SubidaDocumento.objects.filter(actualizado__lt=limite).values_list('pk', flat=True))
+    SubidaDocumento.objects.filter(pk__in=vencidas).delete()
+    for pk in vencidas:
+        _descartar(pk)
+    return len(vencidas)
+
+
+def obtener(subida_id, usuario, bloquear=False):
+    consulta = SubidaDocumento.objects.select_for_update() if bloquear else SubidaDocumento.objects
+    try:
+        return consulta.get(pk=subida_id, usuario=usuario)
+    except SubidaDocumento.DoesNotExist:
+        raise ErrorSubida('Subida no encontrada', estado=404)
+
+
+def _descartar(subida_id):
+    with _lock:
+        _hashes.pop(subida_id, None)
+    ruta = os.path.join(configuracion()['DIRECTORIO'], f'{subida_id}.part')
+    if os.path.exists(ruta):
+        os.remove(ruta)
+
+
+class ArchivoTemporal(File):
+    """Archivo en disco que el almacenamiento puede mover en vez de copiar, con su SHA-256 ya calculado."""
+
+    def __init__(self, ruta, sha256=None):
+        super().__init__(open(ruta, 'rb'), name=os.path.basename(ruta))
+        self.ruta = ruta
+        self.sha256 = sha256
+
+    def temporary_file_path(self):
+        return self.ruta
@@ -1,3 +1,1072 @@
-from django.test import TestCase
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+import zipfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from unittest import mock
 
-# Create your tests here.
+from django.db import IntegrityError, connection
+from django.db.models import RestrictedError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from a_bitacora.models import Bitacora
+from a_bitacora.reglas import agregador_bitacora
+from a_especialidades.models import Especialidad
+from a_pacientes.models import Pacientes
+from a_usuarios.models import Usuario
+from . import blobs, busqueda, esquemas, informes, previas, publicaciones, subidas
+from .models import (Blob, DocumentoAdjunto, Formulario, FormularioPublicado, HistorialClinico, Pregunta, Respuesta,
+                     SubidaDocumento)
+
+
+class HistorialConsultasTests(TestCase):
+    """Listar y ver historiales cuesta lo mismo sin importar cuántos haya ni el tamaño del formulario."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='medico@test.com', nombre='Medico', apellido='Test')
+        cls.especialidad = Especialidad.objects.create(nombre='Cardiología', descripcion='Corazón')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Ana', apellido='Pérez', ci='123', fecha_nacimiento=date(1990, 1, 1), sexo='F', asegurado=True,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_historiales(self, cantidad, preguntas):
+        formulario = Formulario.objects.create(nombre=f'Formulario {preguntas}', especialidad=self.especialidad)
+        lista = Pregunta.objects.bulk_create([
+            Pregunta(formulario=formulario, texto=f'Pregunta {i}', tipo_dato='texto', orden=i)
+            for i in range(preguntas)
+        ])
+        historiales = []
+        for _ in range(cantidad):
+            historial = HistorialClinico.objects.create(
+                paciente=self.paciente, usuario=self.usuario, especialidad=self.especialidad,
+                formulario=formulario, motivo_consulta='Control', fuente='Paciente',
+                diagnostico='Sano', signos_vitales={},
+            )
+            Respuesta.objects.bulk_create([
+                Respuesta(pregunta=pregunta, historial_clinico=historial, valor=f'{historial.pk}-{pregunta.orden}')
+                for pregunta in lista
+            ])
+            historiales.append(historial)
+        return historiales
+
+    def contar_consultas(self, url):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        return len(consultas), respuesta.data
+
+    def test_listado_consultas_constantes(self):
+        self.crear_historiales(2, 3)
+        pequeno, _ = self.contar_consultas('/api/historiales/historiales/')
+
+        self.crear_historiales(8, 40)
+        grande, datos = self.contar_consultas('/api/historiales/historiales/')
+
+        self.assertEqual(pequeno, grande)
+        self.assertEqual(len(datos['results']), 10)
+        for historial in datos['results']:
+            for item in historial['preguntas_respuestas']:
+                self.assertTrue(item['respuesta'].startswith(str(historial['id'])))
+
+    def test_detalle_consultas_constantes(self):
+        pequeno_historial = self.crear_historiales(1, 3)[0]
+        grande_historial = self.crear_historiales(1, 40)[0]
+
+        pequeno, _ = self.contar_consultas(f'/api/historiales/historiales/{pequeno_historial.pk}/')
+        grande, datos = self.contar_consultas(f'/api/historiales/historiales/{grande_historial.pk}/')
+
+        self.assertEqual(pequeno, grande)
+        self.assertEqual([p['respuesta'] for p in datos['preguntas_respuestas']],
+                         [f'{grande_historial.pk}-{i}' for i in range(40)])
+
+    def test_formulario_completo_consultas_constantes(self):
+        historial = self.crear_historiales(1, 3)[0]
+        pequeno, _ = self.contar_consultas(f'/api/historiales/historiales/{historial.pk}/formulario-completo/')
+
+        # El formulario activo de la especialidad pasa a ser uno más grande
+        for formulario in Formulario.objects.all():
+            formulario.activo = False
+            formulario.save()
+        historial = self.crear_historiales(1, 40)[0]
+        grande, datos = self.contar_consultas(f'/api/historiales/historiales/{historial.pk}/formulario-completo/')
+
+        self.assertEqual(pequeno, grande)
+        self.assertEqual(len(datos['preguntas_respuestas']), 40)
+        self.assertEqual(datos['preguntas_respuestas'][5]['respuesta'], f'{historial.pk}-5')
+
+
+class RespuestasTipadasTests(TestCase):
+    """Las respuestas guardan su valor tipado y se pueden filtrar historiales por ellas."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='investigador@test.com', nombre='Inv', apellido='Test')
+        cls.especialidad = Especialidad.objects.create(nombre='Cardiología', descripcion='Corazón')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Luis', apellido='Rojas', ci='456', fecha_nacimiento=date(1980, 5, 5), sexo='M', asegurado=True,
+        )
+        cls.formulario = Formulario.objects.create(nombre='Control', especialidad=cls.especialidad)
+        cls.presion = Pregunta.objects.create(formulario=cls.formulario, texto='Presión', tipo_dato='numero', orden=1)
+        cls.fuma = Pregunta.objects.create(formulario=cls.formulario, texto='¿Fuma?', tipo_dato='booleano', orden=2)
+        cls.control = Pregunta.objects.create(formulario=cls.formulario, texto='Último control', tipo_dato='fecha', orden=3)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def crear_historial(self, presion, fuma, control):
+        historial = HistorialClinico.objects.create(
+            paciente=self.paciente, usuario=self.usuario, especialidad=self.especialidad,
+            motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+        )
+        respuesta = self.client.patch(
+            f'/api/historiales/historiales/{historial.pk}/asignar-formulario/',
+            {'formulario': str(self.formulario.pk), 'respuestas': [
+                {'pregunta': str(self.presion.pk), 'valor': presion},
+                {'pregunta': str(self.fuma.pk), 'valor': fuma},
+                {'pregunta': str(self.control.pk), 'valor': control},
+            ]},
+            format='json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        return historial
+
+    def filtrar(self, *predicados):
+        respuesta = self.client.get('/api/historiales/historiales/', {'respuesta': list(predicados)})
+        return respuesta.status_code, {r['id'] for r in respuesta.data['results']} if respuesta.status_code == 200 else respuesta.data
+
+    def test_columnas_tipadas(self):
+        historial = self.crear_historial('130,5', 'Sí', '15/03/2024')
+        valores = {r.pregunta_id: r for r in Respuesta.objects.filter(historial_clinico=historial)}
+        self.assertEqual(valores[self.presion.pk].valor_numero, 130.5)
+        self.assertIs(valores[self.fuma.pk].valor_booleano, True)
+        self.assertEqual(valores[self.control.pk].valor_fecha, date(2024, 3, 15))
+
+        # save() también las llena y un valor no convertible queda en NULL
+        respuesta = valores[self.presion.pk]
+        respuesta.valor = 'no medida'
+        respuesta.save()
+        respuesta.refresh_from_db()
+        self.assertIsNone(respuesta.valor_numero)
+
+    def test_filtrar_historiales_por_respuestas(self):
+        alto = self.crear_historial('150', 'si', '2024-01-10')
+        bajo = self.crear_historial('110', 'si', '2024-06-01')
+        no_fuma = self.crear_historial('140', 'no', '2023-12-31')
+
+        self.assertEqual(self.filtrar(f'{self.presion.pk}:gt:120'), (200, {str(alto.pk), str(no_fuma.pk)}))
+        self.assertEqual(
+            self.filtrar(f'{self.presion.pk}:gt:120', f'{self.fuma.pk}:eq:true'), (200, {str(alto.pk)})
+        )
+        self.assertEqual(self.filtrar(f'{self.control.pk}:gte:2024-01-01'), (200, {str(alto.pk), str(bajo.pk)}))
+
+        estado, _ = self.filtrar(f'{self.presion.pk}:gt:alto')
+        self.assertEqual(estado, 400)
+        estado, _ = self.filtrar(f'{self.fuma.pk}:gt:1')
+        self.assertEqual(estado, 400)
+
+    def asignar(self, historial, respuestas):
+        return self.client.patch(
+            f'/api/historiales/historiales/{historial.pk}/asignar-formulario/',
+            {'formulario': str(self.formulario.pk), 'respuestas': respuestas}, format='json',
+        )
+
+    def test_asignar_errores_por_item_sin_guardar_nada(self):
+        historial = self.crear_historial('120', 'no', '2024-01-01')
+        Respuesta.objects.all().delete()
+        HistorialClinico.objects.filter(pk=historial.pk).update(formulario=None, formulario_publicado=None)
+        otro = Formulario.objects.create(nombre='Otro', especialidad=self.especialidad)
+        ajena = Pregunta.objects.create(formulario=otro, texto='Ajena', tipo_dato='texto', orden=1)
+
+        respuesta = self.asignar(historial, [
+            {'pregunta': str(self.presion.pk), 'valor': '120'},
+            {'valor': 'sin pregunta'},
+            {'pregunta': 'no-es-uuid', 'valor': 'x'},
+            {'pregunta': str(ajena.pk), 'valor': 'x'},
+            {'pregunta': str(self.presion.pk), 'valor': '130'},
+            {'pregunta': str(self.fuma.pk)},
+            {'pregunta': str(self.control.pk), 'valor': '2024-01-01'},
+        ])
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([(e['indice'], e['error']) for e in respuesta.data['errores']], [
+            (1, 'Falta la pregunta'),
+            (2, 'Id de pregunta inválido'),
+            (3, 'La pregunta no pertenece al formulario'),
+            (4, 'Pregunta repetida'),
+            (5, 'Falta el valor'),
+        ])
+        self.assertEqual(respuesta.data['errores'][3]['pregunta'], str(self.presion.pk))
+
+        # Los ítems válidos tampoco se guardan
+        historial.refresh_from_db()
+        self.assertIsNone(historial.formulario_id)
+        self.assertFalse(Respuesta.objects.exists())
+
+        respuesta = self.asignar(historial, {'pregunta': str(self.presion.pk), 'valor': '120'})
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['errores'][0]['error'], 'respuestas debe ser una lista')
+
+    def test_asignar_todo_o_nada_y_actualiza(self):
+        historial = self.crear_historial('120', 'no', '2024-01-01')
+        publicaciones = FormularioPublicado.objects.count()
+
+        # Si la escritura falla a mitad, el historial no queda con el formulario asignado
+        HistorialClinico.objects.filter(pk=historial.pk).update(formulario=None, formulario_publicado=None)
+        # El formulario cambió: asignarlo publicaría una versión nueva, que también se revierte
+        self.fuma.texto = '¿Fumó alguna vez?'
+        self.fuma.save()
+        with mock.patch('a_historiales.services.Respuesta.objects.bulk_create', side_effect=IntegrityError('falla')):
+            respuesta = self.asignar(historial, [{'pregunta': str(self.presion.pk), 'valor': '140'}])
+        self.assertEqual(respuesta.status_code, 500)
+        historial.refresh_from_db()
+        self.assertIsNone(historial.formulario_id)
+        self.assertEqual(FormularioPublicado.objects.count(), publicaciones)
+        self.assertEqual(Respuesta.objects.get(pregunta=self.presion).valor, '120')
+
+        # Volver a asignar actualiza las respuestas existentes (una por pregunta) y sus columnas tipadas
+        self.assertEqual(self.asignar(historial, [{'pregunta': str(self.presion.pk), 'valor': '140'}]).status_code, 200)
+        self.assertEqual(Respuesta.objects.filter(historial_clinico=historial).count(), 3)
+        self.assertEqual(Respuesta.objects.get(pregunta=self.presion).valor_numero, 140)
+        historial.refresh_from_db()
+        self.assertEqual(historial.formulario_id, self.formulario.pk)
+        self.assertEqual(FormularioPublicado.objects.count(), publicaciones + 1)
+
+    def test_cambiar_tipo_recalcula(self):
+        historial = self.crear_historial('120', 'no', '2024-01-01')
+        self.presion.tipo_dato = 'texto'
+        self.presion.save()
+        respuesta = Respuesta.objects.get(historial_clinico=historial, pregunta=self.presion)
+        self.assertIsNone(respuesta.valor_numero)
+        self.presion.tipo_dato = 'numero'
+        self.presion.save()
+        respuesta.refresh_from_db()
+        self.assertEqual(respuesta.valor_numero, 120)
+
+
+class SignosVitalesTests(TestCase):
+    """Los signos vitales se copian a SignoVital y la serie se resume en la base de datos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='enfermera@test.com', nombre='Enf', apellido='Test')
+        cls.especialidad = Especialidad.objects.create(nombre='Medicina general', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Eva', apellido='Soto', ci='789', fecha_nacimiento=date(1970, 2, 2), sexo='F', asegurado=True,
+        )
+        inicio = datetime(2024, 1, 1, 12, tzinfo=dt_timezone.utc)
+        for dia in range(30):
+            historial = HistorialClinico.objects.create(
+                paciente=cls.paciente, usuario=cls.usuario, especialidad=cls.especialidad,
+                motivo_consulta='Control', fuente='Paciente', diagnostico='-',
+                signos_vitales={'peso': 60 + dia, 'presion_arterial': '120/80', 'temperatura': 'n/d'},
+            )
+            historial.fecha = inicio + timedelta(days=dia)
+            historial.save(update_fields=['fecha'])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.url = f'/api/historiales/pacientes/{self.paciente.pk}/signos-vitales/'
+
+    def test_extraccion(self):
+        historial = HistorialClinico.objects.filter(paciente=self.paciente).order_by('fecha').first()
+        self.assertEqual(
+            dict(historial.signos.values_list('metrica', 'valor')),
+            {'peso': 60, 'presion_arterial_sistolica': 120, 'presion_arterial_diastolica': 80},
+        )
+        historial.signos_vitales = {'peso': '59,5'}
+        historial.save()
+        self.assertEqual(dict(historial.signos.values_list('metrica', 'valor')), {'peso': 59.5})
+
+    def test_serie_en_intervalos(self):
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(self.url, {'metric': 'peso', 'buckets': 3})
+        self.assertEqual(respuesta.status_code, 200)
+        puntos = respuesta.data['series']['peso']
+        self.assertEqual([(p['min'], p['max'], p['n']) for p in puntos], [(60, 69, 10), (70, 79, 10), (80, 89, 10)])
+        self.assertEqual(puntos[1]['avg'], 74.5)
+        self.assertLessEqual(len(consultas), 3)
+
+        respuesta = self.client.get(self.url, {'metric': 'peso', 'from': '2024-01-11', 'to': '2024-01-15', 'buckets': 1})
+        self.assertEqual([(p['min'], p['max'], p['n']) for p in respuesta.data['series']['peso']], [(70, 74, 5)])
+
+    def test_parametros_invalidos(self):
+        self.assertEqual(self.client.get(self.url, {'metric': 'glucosa'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'buckets': 0}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'from': 'ayer'}).status_code, 400)
+        otro = '/api/historiales/pacientes/00000000-0000-0000-0000-000000000000/signos-vitales/'
+        self.assertEqual(self.client.get(otro).status_code, 404)
+
+
+class SubidaPorPartesTests(TestCase):
+    """Un documento se sube en partes, se puede retomar y al finalizar queda como DocumentoAdjunto."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='tecnico@test.com', nombre='Tec', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Imagenología', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Raúl', apellido='Vaca', ci='321', fecha_nacimiento=date(1985, 3, 3), sexo='M', asegurado=True,
+        )
+        cls.historial = HistorialClinico.objects.create(
+            paciente=paciente, usuario=cls.usuario, especialidad=especialidad,
+            motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+        )
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(
+            MEDIA_ROOT=os.path.join(self.directorio, 'media'),
+            SUBIDAS_DOCUMENTOS={'DIRECTORIO': os.path.join(self.directorio, 'subidas'), 'TAMANO_MAXIMO': 10 ** 6},
+        )
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        # Los PUT de partes se agregan por minuto (BITACORA_REGLAS): se escriben antes de revertir la prueba
+        self.addCleanup(agregador_bitacora.vaciar, forzar=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.contenido = os.urandom(200_000)
+
+    def abrir(self, **extra):
+        respuesta = self.client.post('/api/historiales/subidas/', {
+            'historial': str(self.historial.pk), 'tipo_documento': 'Tomografía',
+            'nombre': '../tac abdomen.dcm', 'tamano': len(self.contenido), **extra,
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        return f"/api/historiales/subidas/{respuesta.data['id']}/"
+
+    def parte(self, url, inicio, fin):
+        return self.client.put(
+            url, self.contenido[inicio:fin + 1], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes {inicio}-{fin}/{len(self.contenido)}',
+        )
+
+    def test_subida_retomada(self):
+        url = self.abrir(sha256=hashlib.sha256(self.contenido).hexdigest())
+        self.assertEqual(self.parte(url, 0, 69_999).data['recibido'], 70_000)
+
+        # Una parte que no sigue a lo recibido se rechaza e indica desde dónde retomar
+        respuesta = self.parte(url, 140_000, 199_999)
+        self.assertEqual(respuesta.status_code, 409)
+        self.assertEqual(respuesta.data['recibido'], 70_000)
+
+        # Otro proceso (sin el SHA-256 parcial en memoria) retoma la subida
+        subidas._hashes.clear()
+        self.assertEqual(self.parte(url, 70_000, 199_999).data['recibido'], 200_000)
+
+        respuesta = self.client.post(url + 'finalizar/')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(respuesta.data['sha256'], hashlib.sha256(self.contenido).hexdigest())
+        documento = DocumentoAdjunto.objects.get(pk=respuesta.data['id'])
+        self.assertEqual(documento.historial, self.historial)
+        with documento.archivo.open('rb') as archivo:
+            self.assertEqual(archivo.read(), self.contenido)
+        self.assertFalse(SubidaDocumento.objects.exists())
+        self.assertEqual(os.listdir(os.path.join(self.directorio, 'subidas')), [])
+
+    def test_finalizar_incompleta_o_con_otro_hash(self):
+        url = self.abrir(sha256='0' * 64)
+        self.parte(url, 0, 99_999)
+        self.assertEqual(self.client.post(url + 'finalizar/').status_code, 409)
+        self.parte(url, 100_000, 199_999)
+        respuesta = self.client.post(url + 'finalizar/')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['sha256'], hashlib.sha256(self.contenido).hexdigest())
+        self.assertFalse(DocumentoAdjunto.objects.exists())
+
+    def test_parte_se_copia_sin_transaccion_abierta(self):
+        url = self.abrir()
+        subida = SubidaDocumento.objects.get()
+        contenido = self.contenido
+        profundidad = len(connection.savepoint_ids)
+        durante = []
+
+        class Flujo(io.BytesIO):
+            def read(flujo, *args):
+                if not durante:
+                    # Mientras llega la parte no hay transacción propia y otra parte recibe 409
+                    durante.append(len(connection.savepoint_ids))
+                    with self.assertRaises(subidas.ErrorSubida) as error:
+                        subidas.recibir(subida.pk, self.usuario, 0, 10, None, io.BytesIO(contenido[:10]))
+                    durante.append(error.exception.estado)
+                return super().read(*args)
+
+        subidas.recibir(subida.pk, self.usuario, 0, 100_000, None, Flujo(contenido[:100_000]))
+        self.assertEqual(durante, [profundidad, 409])
+        self.assertEqual(self.parte(url, 100_000, 199_999).data['recibido'], 200_000)
+        self.assertEqual(self.client.post(url + 'finalizar/').data['sha256'], hashlib.sha256(contenido).hexdigest())
+
+    def test_content_length_invalido(self):
+        url = self.abrir()
+        respuesta = self.client.put(
+            url, self.contenido[:10], content_type='application/octet-stream',
+            HTTP_CONTENT_RANGE=f'bytes 0-9/{len(self.contenido)}', CONTENT_LENGTH='diez',
+        )
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(SubidaDocumento.objects.get().recibido, 0)
+
+
+class DocumentosPorContenidoTests(TestCase):
+    """Los adjuntos con el mismo contenido comparten un solo blob en disco."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='archivo@test.com', nombre='Arch', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Laboratorio', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Sara', apellido='Mena', ci='654', fecha_nacimiento=date(1995, 4, 4), sexo='F', asegurado=True,
+        )
+        cls.historiales = [
+            HistorialClinico.objects.create(
+                paciente=paciente, usuario=cls.usuario, especialidad=especialidad,
+                motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+            )
+            for _ in range(2)
+        ]
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def archivos_en_disco(self):
+        return sorted(os.path.relpath(os.path.join(raiz, n), self.media) for raiz, _, nombres in os.walk(self.media) for n in nombres)
+
+    def test_mismo_contenido_un_blob(self):
+        contenido = b'%PDF-1.4 laboratorio'
+        for historial in self.historiales:
+            respuesta = self.client.post('/api/historiales/documentos/', {
+                'historial': str(historial.pk), 'tipo_documento': 'Laboratorio',
+                'archivo': SimpleUploadedFile('hemograma.pdf', contenido),
+            }, format='multipart')
+            self.assertEqual(respuesta.status_code, 201)
+
+        sha256 = hashlib.sha256(contenido).hexdigest()
+        nombre = f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'
+        self.assertEqual(self.archivos_en_disco(), [nombre])
+        self.assertEqual(Blob.objects.get().documentos.count(), 2)
+        self.assertEqual(set(DocumentoAdjunto.objects.values_list('archivo', 'nombre')), {(nombre, 'hemograma.pdf')})
+
+        # Sin documentos, el blob se recolecta
+        DocumentoAdjunto.objects.all().delete()
+        self.assertEqual(blobs.recolectar(gracia_horas=0), 1)
+        self.assertEqual(self.archivos_en_disco(), [])
+
+    def test_recolectar_archivos_sin_fila(self):
+        # Como un finalizar() cuyo DocumentoAdjunto falló: el archivo se movió pero la fila de Blob se revirtió
+        almacenamiento = DocumentoAdjunto._meta.get_field('archivo').storage
+        viejo = almacenamiento.save('a.pdf', SimpleUploadedFile('a.pdf', b'sin fila vieja'))
+        reciente = almacenamiento.save('b.pdf', SimpleUploadedFile('b.pdf', b'sin fila reciente'))
+        con_fila = almacenamiento.save('c.pdf', SimpleUploadedFile('c.pdf', b'con fila'))
+        Blob.objects.create(sha256=con_fila.rsplit('/', 1)[1], tamano=8)
+        temporal = os.path.join(self.media, 'blobs', 'abandonado.tmp')
+        open(temporal, 'wb').close()
+        hace_dos_horas = time.time() - 7200
+        for ruta in (almacenamiento.path(viejo), almacenamiento.path(con_fila), temporal):
+            os.utime(ruta, (hace_dos_horas, hace_dos_horas))
+
+        self.assertEqual(blobs.recolectar(gracia_horas=1, simular=True), 1)
+        self.assertEqual(len(self.archivos_en_disco()), 4)
+        self.assertEqual(blobs.recolectar(gracia_horas=1), 1)
+        self.assertEqual(self.archivos_en_disco(), sorted([reciente, con_fila]))
+
+    def test_deduplicar_archivos_anteriores(self):
+        for i, historial in enumerate(self.historiales):
+            with open(os.path.join(self.media, f'carta{i}.pdf'), 'wb') as archivo:
+                archivo.write(b'carta de referencia')
+            documento = DocumentoAdjunto.objects.create(historial=historial, tipo_documento='Carta', archivo=f'carta{i}.pdf')
+            self.assertIsNone(documento.blob)
+
+        resultado = blobs.deduplicar()
+        self.assertEqual((resultado['documentos'], resultado['duplicados']), (2, 1))
+        sha256 = hashlib.sha256(b'carta de referencia').hexdigest()
+        self.assertEqual(self.archivos_en_disco(), [f'blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}'])
+        self.assertEqual(
+            sorted(DocumentoAdjunto.objects.values_list('blob', 'nombre')), [(sha256, 'carta0.pdf'), (sha256, 'carta1.pdf')]
+        )
+
+
+class DescargaDocumentoTests(TestCase):
+    """La descarga responde 304 con ETag, 206 con Range y puede delegar el envío al servidor web."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='lector@test.com', nombre='Lec', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Radiología', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Iván', apellido='Cruz', ci='987', fecha_nacimiento=date(2000, 6, 6), sexo='M', asegurado=True,
+        )
+        cls.historial = HistorialClinico.objects.create(
+            paciente=paciente, usuario=cls.usuario, especialidad=especialidad,
+            motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+        )
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.contenido = bytes(range(256)) * 40
+        documento = DocumentoAdjunto.objects.create(
+            historial=self.historial, tipo_documento='Informe', archivo=SimpleUploadedFile('informe.pdf', self.contenido),
+        )
+        self.url = f'/api/historiales/documentos/{documento.pk}/descargar/'
+        self.etag = f'"{hashlib.sha256(self.contenido).hexdigest()}"'
+
+    def test_completo_y_condicional(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertEqual(respuesta['ETag'], self.etag)
+        self.assertIn('filename="informe.pdf"', respuesta['Content-Disposition'])
+
+        respuesta = self.client.get(self.url, HTTP_IF_NONE_MATCH=self.etag)
+        self.assertEqual(respuesta.status_code, 304)
+
+    def test_rangos(self):
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=100-299')
+        self.assertEqual(respuesta.status_code, 206)
+        self.assertEqual(respuesta['Content-Range'], f'bytes 100-299/{len(self.contenido)}')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido[100:300])
+
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(b''.join(respuesta.streaming_content), self.contenido[-10:])
+
+        # If-Range con otra versión: archivo completo
+        respuesta = self.client.get(self.url, HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"otro"')
+        self.assertEqual(respuesta.status_code, 200)
+
+        respuesta = self.client.get(self.url, HTTP_RANGE=f'bytes={len(self.contenido)}-')
+        self.assertEqual(respuesta.status_code, 416)
+
+    @override_settings(DESCARGAS={'SERVIDOR': 'x-accel-redirect', 'PREFIJO_INTERNO': '/interno/'})
+    def test_x_accel_redirect(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.content, b'')
+        sha256 = self.etag.strip('"')
+        self.assertEqual(respuesta['X-Accel-Redirect'], f'/interno/blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}')
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+
+
+class PaqueteZipTests(TestCase):
+    """Los ZIP de documentos se arman al vuelo y no recomprimen formatos ya comprimidos."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='zip@test.com', nombre='Zip', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Cardiología', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Rosa', apellido='Vega', ci='555', fecha_nacimiento=date(1980, 2, 2), sexo='F', asegurado=True,
+        )
+        cls.historiales = [
+            HistorialClinico.objects.create(
+                paciente=cls.paciente, usuario=cls.usuario, especialidad=especialidad,
+                motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+            )
+            for _ in range(2)
+        ]
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.texto = b'linea de laboratorio\n' * 2000
+        self.imagen = os.urandom(50000)
+        primero, segundo = self.historiales
+        for historial, tipo, nombre, contenido in [
+            (primero, 'Laboratorio', 'hemograma.txt', self.texto),
+            (primero, 'Imagen', 'torax.jpg', self.imagen),
+            (primero, 'Imagen', 'torax.jpg', self.imagen),
+            (segundo, 'Laboratorio', 'hemograma.txt', b'otro'),
+        ]:
+            DocumentoAdjunto.objects.create(
+                historial=historial, tipo_documento=tipo, archivo=SimpleUploadedFile(nombre, contenido),
+            )
+
+    def abrir(self, respuesta):
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'application/zip')
+        self.assertNotIn('Content-Length', respuesta)
+        return zipfile.ZipFile(io.BytesIO(b''.join(respuesta.streaming_content)))
+
+    def test_zip_del_historial(self):
+        with self.abrir(self.client.get(f'/api/historiales/historiales/{self.historiales[0].pk}/documentos.zip/')) as z:
+            self.assertIsNone(z.testzip())
+            self.assertEqual(
+                sorted(z.namelist()),
+                ['Imagen/torax (2).jpg', 'Imagen/torax.jpg', 'Laboratorio/hemograma.txt'],
+            )
+            self.assertEqual(z.read('Laboratorio/hemograma.txt'), self.texto)
+            self.assertEqual(z.getinfo('Laboratorio/hemograma.txt').compress_type, zipfile.ZIP_DEFLATED)
+            self.assertEqual(z.read('Imagen/torax.jpg'), self.imagen)
+            self.assertEqual(z.getinfo('Imagen/torax.jpg').compress_type, zipfile.ZIP_STORED)
+
+    def test_zip_del_paciente(self):
+        with self.abrir(self.client.get(f'/api/historiales/pacientes/{self.paciente.pk}/documentos.zip/')) as z:
+            self.assertEqual(len(z.namelist()), 4)
+            # Una carpeta por historial
+            self.assertEqual(len({nombre.split('/')[0] for nombre in z.namelist()}), 2)
+            self.assertEqual(sorted(len(z.read(n)) for n in z.namelist() if n.endswith('.txt')), [4, len(self.texto)])
+
+    def test_paciente_inexistente(self):
+        respuesta = self.client.get('/api/historiales/pacientes/00000000-0000-0000-0000-000000000000/documentos.zip/')
+        self.assertEqual(respuesta.status_code, 404)
+
+
+class PreguntasLoteTests(TestCase):
+    """Las preguntas de un formulario se editan en una transacción, una sentencia por operación."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='autor@test.com', nombre='Aut', apellido='Test')
+        cls.especialidad = Especialidad.objects.create(nombre='Pediatría', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Teo', apellido='Gil', ci='963', fecha_nacimiento=date(2015, 4, 4), sexo='M', asegurado=True,
+        )
+        cls.historial = HistorialClinico.objects.create(
+            paciente=paciente, usuario=cls.usuario, especialidad=cls.especialidad,
+            motivo_consulta='Control', fuente='Madre', diagnostico='-', signos_vitales={},
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.formulario = Formulario.objects.create(nombre='Control pediátrico', especialidad=self.especialidad)
+        self.preguntas = Pregunta.objects.bulk_create([
+            Pregunta(formulario=self.formulario, texto=f'Pregunta {i}', tipo_dato='texto', orden=i)
+            for i in range(1, 6)
+        ])
+        Respuesta.objects.create(historial_clinico=self.historial, pregunta=self.preguntas[1], valor='12,5')
+        Respuesta.objects.create(historial_clinico=self.historial, pregunta=self.preguntas[4], valor='x')
+
+    def sentencias(self, consultas, verbo):
+        tabla = Pregunta._meta.db_table
+        return [c['sql'] for c in consultas.captured_queries if c['sql'].startswith(verbo) and f'"{tabla}"' in c['sql']]
+
+    def test_lote(self):
+        p = self.preguntas
+        version = esquemas.version_actual()
+        entradas = Bitacora.objects.count()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/historiales/preguntas/lote/', {
+                'formulario': str(self.formulario.pk),
+                'crear': [{'texto': 'Peso', 'tipo_dato': 'numero'}, {'texto': 'Vacunas al día', 'tipo_dato': 'booleano'}],
+                'actualizar': [{'id': str(p[1].pk), 'texto': 'Talla (cm)', 'tipo_dato': 'numero'}],
+                'eliminar': [str(p[4].pk), str(p[2].pk)],
+                'orden': [str(p[3].pk), str(p[1].pk), str(p[0].pk)],
+            }, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual((respuesta.data['creadas'], respuesta.data['actualizadas'], respuesta.data['eliminadas']), (2, 1, 2))
+        self.assertEqual(
+            [q['texto'] for q in respuesta.data['preguntas']],
+            ['Pregunta 4', 'Talla (cm)', 'Pregunta 1', 'Peso', 'Vacunas al día'],
+        )
+        self.assertEqual([q['orden'] for q in respuesta.data['preguntas']], [1, 2, 3, 4, 5])
+
+        # Un UPDATE más: la eliminada con respuestas solo se desactiva
+        for verbo, cantidad in (('INSERT', 1), ('UPDATE', 2), ('DELETE', 1)):
+            self.assertEqual(len(self.sentencias(consultas, verbo)), cantidad, verbo)
+        # Cambió el tipo: la respuesta existente tiene su columna numérica
+        self.assertEqual(Respuesta.objects.get(pregunta=p[1]).valor_numero, 12.5)
+        self.assertFalse(Pregunta.objects.filter(pk=p[2].pk).exists())
+        self.assertFalse(Pregunta.objects.get(pk=p[4].pk).activo)
+        self.assertEqual(Respuesta.objects.get(pregunta=p[4]).valor, 'x')
+        self.assertEqual(esquemas.version_actual(), version + 1)
+        self.assertEqual(Bitacora.objects.count(), entradas + 1)
+
+    def test_lote_invalido_no_cambia_nada(self):
+        otra = Pregunta.objects.create(
+            formulario=Formulario.objects.create(nombre='Otro', especialidad=self.especialidad),
+            texto='Ajena', tipo_dato='texto', orden=1,
+        )
+        respuesta = self.client.post('/api/historiales/preguntas/lote/', {
+            'formulario': str(self.formulario.pk),
+            'crear': [{'texto': 'Nueva', 'tipo_dato': 'texto'}],
+            'eliminar': [str(otra.pk)],
+            'orden': [str(self.preguntas[0].pk)],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual([e['operacion'] for e in respuesta.data['errores']], ['eliminar', 'orden'])
+        self.assertEqual(Pregunta.objects.filter(formulario=self.formulario).count(), 5)
+
+    def test_crear_lista_en_un_insert(self):
+        entradas = Bitacora.objects.count()
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.post('/api/historiales/preguntas/', [
+                {'formulario': str(self.formulario.pk), 'texto': f'Extra {i}', 'tipo_dato': 'texto', 'orden': 10 + i}
+                for i in range(20)
+            ], format='json')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(len(respuesta.data), 20)
+        self.assertEqual(len(self.sentencias(consultas, 'INSERT')), 1)
+        self.assertEqual(Bitacora.objects.count(), entradas + 1)
+
+
+class FormulariosPublicadosTests(TestCase):
+    """Un historial se muestra con la versión del formulario con la que se completó."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='version@test.com', nombre='Ver', apellido='Test')
+        cls.especialidad = Especialidad.objects.create(nombre='Neumología', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Iris', apellido='Paz', ci='741', fecha_nacimiento=date(1980, 2, 2), sexo='F', asegurado=True,
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.formulario = Formulario.objects.create(nombre='Control respiratorio', especialidad=self.especialidad)
+        self.preguntas = Pregunta.objects.bulk_create([
+            Pregunta(formulario=self.formulario, texto='Fuma', tipo_dato='booleano', orden=1),
+            Pregunta(formulario=self.formulario, texto='Saturación', tipo_dato='numero', orden=2),
+        ])
+        self.historial = HistorialClinico.objects.create(
+            paciente=self.paciente, usuario=self.usuario, especialidad=self.especialidad,
+            motivo_consulta='Tos', fuente='Paciente', diagnostico='Bronquitis', signos_vitales={},
+        )
+
+    def asignar(self):
+        respuesta = self.client.patch(f'/api/historiales/historiales/{self.historial.pk}/asignar-formulario/', {
+            'formulario': str(self.formulario.pk),
+            'respuestas': [
+                {'pregunta': str(self.preguntas[0].pk), 'valor': 'no'},
+                {'pregunta': str(self.preguntas[1].pk), 'valor': '97'},
+            ],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.historial.refresh_from_db()
+
+    def test_publicar_solo_si_cambio(self):
+        primera, creada = publicaciones.publicar(self.formulario)
+        self.assertTrue(creada)
+        self.assertEqual(publicaciones.publicar(self.formulario), (primera, False))
+
+        self.preguntas[1].texto = 'Saturación de O2'
+        self.preguntas[1].save()
+        segunda, creada = publicaciones.publicar(self.formulario)
+        self.assertTrue(creada)
+        self.assertEqual((primera.numero, segunda.numero), (1, 2))
+        primera.refresh_from_db()
+        self.assertEqual([p['texto'] for p in primera.esquema['preguntas']], ['Fuma', 'Saturación'])
+        with self.assertRaises(ValueError):
+            primera.save()
+
+    def test_historial_conserva_su_version(self):
+        self.asignar()
+        publicado = self.historial.formulario_publicado
+        self.assertIsNotNone(publicado)
+
+        # Cambia el formulario después de completar el historial
+        self.client.post('/api/historiales/preguntas/lote/', {
+            'formulario': str(self.formulario.pk),
+            'crear': [{'texto': 'Disnea', 'tipo_dato': 'texto'}],
+            'actualizar': [{'id': str(self.preguntas[1].pk), 'texto': 'SpO2 (%)'}],
+        }, format='json')
+
+        with CaptureQueriesContext(connection) as consultas:
+            datos = self.client.get(f'/api/historiales/historiales/{self.historial.pk}/').data
+        self.assertEqual([(p['texto'], p['respuesta']) for p in datos['preguntas_respuestas']],
+                         [('Fuma', 'no'), ('Saturación', '97')])
+        self.assertEqual(datos['formulario'], publicado.esquema)
+        self.assertEqual(datos['formulario_publicado'], publicado.pk)
+        # Las preguntas vienen de la versión publicada, no de la tabla de preguntas
+        self.assertFalse([c for c in consultas.captured_queries if f'"{Pregunta._meta.db_table}"' in c['sql']])
+
+        completo = self.client.get(f'/api/historiales/historiales/{self.historial.pk}/formulario-completo/').data
+        self.assertEqual([p['texto'] for p in completo['preguntas_respuestas']], ['Fuma', 'Saturación'])
+
+        # Volver a asignar el formulario pasa a la versión vigente
+        self.asignar()
+        self.assertEqual(self.historial.formulario_publicado.numero, 2)
+        self.assertEqual(len(self.historial.formulario_publicado.esquema['preguntas']), 3)
+
+    def test_eliminar_pregunta_conserva_respuestas(self):
+        self.asignar()
+        fuma, saturacion = self.preguntas
+        respuesta = self.client.post('/api/historiales/preguntas/lote/', {
+            'formulario': str(self.formulario.pk), 'eliminar': [str(saturacion.pk)],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 200, respuesta.data)
+        self.assertEqual(self.client.delete(f'/api/historiales/preguntas/{fuma.pk}/').status_code, 204)
+
+        # Las dos quedan desactivadas con sus respuestas; el historial se sigue viendo con su versión
+        self.assertEqual(Pregunta.objects.filter(formulario=self.formulario, activo=False).count(), 2)
+        datos = self.client.get(f'/api/historiales/historiales/{self.historial.pk}/').data
+        self.assertEqual([(p['texto'], p['respuesta']) for p in datos['preguntas_respuestas']],
+                         [('Fuma', 'no'), ('Saturación', '97')])
+
+        # Ya no son parte del formulario vigente ni se pueden responder
+        self.assertEqual(self.client.get('/api/historiales/preguntas/', {'formulario': self.formulario.pk}).data['results'], [])
+        self.assertEqual(self.client.get(f'/api/historiales/formularios/{self.formulario.pk}/').data['preguntas'], [])
+        respuesta = self.client.patch(f'/api/historiales/historiales/{self.historial.pk}/asignar-formulario/', {
+            'formulario': str(self.formulario.pk), 'respuestas': [{'pregunta': str(fuma.pk), 'valor': 'sí'}],
+        }, format='json')
+        self.assertEqual(respuesta.status_code, 400)
+        self.assertEqual(respuesta.data['errores'][0]['error'], 'La pregunta fue eliminada del formulario')
+
+        # Un borrado directo no se lleva las respuestas; con el formulario entero sí
+        with self.assertRaises(RestrictedError):
+            Pregunta.objects.filter(pk=fuma.pk).delete()
+        self.formulario.delete()
+        self.assertFalse(Respuesta.objects.filter(pregunta__in=self.preguntas).exists())
+
+    def test_version_publicada_cacheable_por_id(self):
+        entradas = Bitacora.objects.count()
+        respuesta = self.client.post(f'/api/historiales/formularios/{self.formulario.pk}/publicar/')
+        self.assertEqual(respuesta.status_code, 201)
+        self.assertEqual(Bitacora.objects.count(), entradas + 1)
+        self.assertEqual(self.client.post(f'/api/historiales/formularios/{self.formulario.pk}/publicar/').status_code, 200)
+
+        url = f'/api/historiales/formularios-publicados/{respuesta.data["id"]}/'
+        respuesta = self.client.get(url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertIn('max-age=31536000', respuesta['Cache-Control'])
+        self.assertEqual([p['texto'] for p in respuesta.data['esquema']['preguntas']], ['Fuma', 'Saturación'])
+
+        with CaptureQueriesContext(connection) as consultas:
+            respuesta = self.client.get(url, HTTP_IF_NONE_MATCH=respuesta['ETag'])
+        self.assertEqual(respuesta.status_code, 304)
+        self.assertIn('immutable', respuesta['Cache-Control'])
+        self.assertFalse([c for c in consultas.captured_queries if 'formulariopublicado' in c['sql']])
+
+
+class BusquedaTextoTests(TestCase):
+    """?q= busca sin importar acentos, ordena por relevancia y se mantiene al escribir."""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = Usuario.objects.create_user(email='busca@test.com', nombre='Bus', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Medicina interna', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Luis', apellido='Mora', ci='852', fecha_nacimiento=date(1960, 3, 3), sexo='M', asegurado=True,
+        )
+        cls.usuario = usuario
+        cls.historiales = {}
+        for clave, motivo, diagnostico in [
+            ('diagnostico', 'Control de glucemia', 'Diabetes mellitus tipo 2'),
+            ('motivo', 'Antecedente familiar de diabetes', 'Sano'),
+            ('otro', 'Cefalea', 'Hipertensión arterial'),
+        ]:
+            cls.historiales[clave] = HistorialClinico.objects.create(
+                paciente=paciente, usuario=usuario, especialidad=especialidad,
+                motivo_consulta=motivo, fuente='Paciente', diagnostico=diagnostico, signos_vitales={},
+            )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def buscar(self, q):
+        respuesta = self.client.get('/api/historiales/historiales/', {'q': q})
+        self.assertEqual(respuesta.status_code, 200)
+        return respuesta.data['results']
+
+    def test_relevancia_y_resaltado(self):
+        resultados = self.buscar('diabetes')
+        self.assertEqual(
+            [r['id'] for r in resultados],
+            [str(self.historiales['diagnostico'].pk), str(self.historiales['motivo'].pk)],
+        )
+        self.assertGreater(resultados[0]['rango'], resultados[1]['rango'])
+        self.assertIn('<mark>Diabetes</mark>', resultados[0]['resaltado']['diagnostico'])
+        self.assertIn('<mark>diabetes</mark>', resultados[1]['resaltado']['motivo_consulta'])
+
+    def test_resaltado_escapa_el_texto(self):
+        HistorialClinico.objects.filter(pk=self.historiales['otro'].pk).update(
+            diagnostico='<img src=x onerror=alert(1)> Hipertensión & "crisis"',
+        )
+        resaltado = self.buscar('hipertension')[0]['resaltado']['diagnostico']
+        # El fragmento puede empezar a mitad de la etiqueta; lo que importa es que llegue escapada
+        self.assertNotIn('<img', resaltado)
+        self.assertIn('&gt; <mark>Hipertensión</mark> &amp; &quot;crisis', resaltado)
+
+    def test_sin_acentos(self):
+        self.assertEqual([r['id'] for r in self.buscar('hipertension')], [str(self.historiales['otro'].pk)])
+
+    def test_se_mantiene_al_escribir(self):
+        # update() no dispara señales: el índice lo mantiene la base
+        HistorialClinico.objects.filter(pk=self.historiales['otro'].pk).update(diagnostico='Migraña')
+        self.assertEqual(self.buscar('hipertension'), [])
+        self.assertEqual(len(self.buscar('migraña')), 1)
+        self.historiales['motivo'].delete()
+        self.assertEqual(len(self.buscar('diabetes')), 1)
+
+    def test_raices_en_espanol(self):
+        if connection.vendor != 'postgresql':
+            self.skipTest('Solo PostgreSQL tiene raíces en español')
+        self.assertEqual(len(self.buscar('diabético')), 2)
+
+    def test_reparar_triggers_sqlite(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('Solo SQLite usa triggers')
+        with connection.cursor() as cursor:
+            cursor.execute(f'DROP TRIGGER {busqueda.TABLA_FTS}_update')
+            self.assertTrue(busqueda.instalar_sqlite(cursor))
+            self.assertFalse(busqueda.instalar_sqlite(cursor))
+        self.assertEqual(len(self.buscar('diabetes')), 2)
+
+
+class InformesPDFTests(TestCase):
+    """Los informes PDF se guardan por la huella de sus datos y se generan de nuevo solo si cambian."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='informe@test.com', nombre='Inf', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Neumología', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Ana', apellido='Ríos', ci='321', fecha_nacimiento=date(1975, 5, 5), sexo='F', asegurado=True,
+        )
+        formulario = Formulario.objects.create(nombre='Respiratorio', especialidad=especialidad)
+        pregunta = Pregunta.objects.create(formulario=formulario, texto='¿Fuma?', tipo_dato='texto', orden=1)
+        cls.historiales = []
+        for diagnostico in ('Asma', 'EPOC'):
+            historial = HistorialClinico.objects.create(
+                paciente=cls.paciente, usuario=cls.usuario, especialidad=especialidad, formulario=formulario,
+                motivo_consulta='Tos <persistente>', fuente='Paciente', diagnostico=diagnostico,
+                signos_vitales={'temperatura': 37.2, 'presion_arterial': '120/80'},
+            )
+            Respuesta.objects.create(historial_clinico=historial, pregunta=pregunta, valor='No')
+            cls.historiales.append(historial)
+
+    def setUp(self):
+        self.directorio = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directorio)
+        ajustes = override_settings(INFORMES_PDF={'DIRECTORIO': self.directorio, 'PROCESOS': 0})
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+        self.url = f'/api/historiales/historiales/{self.historiales[0].pk}/informe-pdf/'
+
+    def pdfs(self):
+        return sorted(os.path.join(raiz, n) for raiz, _, nombres in os.walk(self.directorio) for n in nombres)
+
+    def test_cache_por_huella(self):
+        respuesta = self.client.get(self.url)
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(respuesta.streaming_content).startswith(b'%PDF'))
+        guardados = self.pdfs()
+        self.assertEqual(len(guardados), 1)
+        etag = respuesta['ETag']
+
+        # Sin cambios: el mismo archivo, sin generarlo otra vez, y 304 con el ETag
+        modificado = os.stat(guardados[0]).st_mtime_ns
+        self.assertEqual(self.client.get(self.url)['ETag'], etag)
+        self.assertEqual(os.stat(guardados[0]).st_mtime_ns, modificado)
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        # Una respuesta distinta cambia la huella y reemplaza el informe anterior
+        Respuesta.objects.filter(historial_clinico=self.historiales[0]).update(valor='Sí')
+        respuesta = self.client.get(self.url)
+        self.assertNotEqual(respuesta['ETag'], etag)
+        self.assertEqual(len(self.pdfs()), 1)
+        self.assertNotEqual(self.pdfs(), guardados)
+
+    def test_informe_del_paciente(self):
+        respuesta = self.client.get(f'/api/historiales/pacientes/{self.paciente.pk}/informe-pdf/')
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('filename="paciente-', respuesta['Content-Disposition'])
+        datos = informes.informe_paciente(self.paciente)
+        self.assertEqual([h['diagnostico'] for h in datos['historiales']], ['Asma', 'EPOC'])
+        self.assertEqual(datos['historiales'][0]['preguntas'], [('¿Fuma?', 'No')])
+
+    def test_generar_en_paralelo(self):
+        call_command('generar_informes', procesos=2, stdout=io.StringIO())
+        self.assertEqual(len(self.pdfs()), 2)
+        salida = io.StringIO()
+        call_command('generar_informes', procesos=2, stdout=salida)
+        self.assertIn('0 informes generados, 2 ya guardados', salida.getvalue())
+
+
+class VistasPreviasTests(TestCase):
+    """Las imágenes adjuntas tienen miniatura y vista previa, generadas fuera de la petición."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = Usuario.objects.create_user(email='visor@test.com', nombre='Vis', apellido='Test')
+        especialidad = Especialidad.objects.create(nombre='Dermatología', descripcion='-')
+        paciente = Pacientes.objects.create(
+            nombre='Nora', apellido='Paz', ci='147', fecha_nacimiento=date(1992, 7, 7), sexo='F', asegurado=True,
+        )
+        cls.historial = HistorialClinico.objects.create(
+            paciente=paciente, usuario=cls.usuario, especialidad=especialidad,
+            motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+        )
+
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media)
+        ajustes = override_settings(MEDIA_ROOT=self.media, VISTAS_PREVIAS={
+            'DIRECTORIO': os.path.join(self.media, 'previas'), 'PROCESOS': 0,
+        })
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def subir(self, nombre, contenido):
+        with self.captureOnCommitCallbacks(execute=True):
+            respuesta = self.client.post('/api/historiales/documentos/', {
+                'historial': str(self.historial.pk), 'tipo_documento': 'Foto',
+                'archivo': SimpleUploadedFile(nombre, contenido),
+            }, format='multipart')
+        self.assertEqual(respuesta.status_code, 201)
+        return respuesta.data['id']
+
+    def test_imagen_con_vistas_previas(self):
+        imagen = io.BytesIO()
+        Image.new('RGB', (2000, 1000), 'red').save(imagen, 'PNG')
+        documento_id = self.subir('lesion.png', imagen.getvalue())
+        pdf_id = self.subir('informe.pdf', b'%PDF-1.4 no es imagen')
+
+        datos = self.client.get(f'/api/historiales/documentos/{documento_id}/').data
+        self.assertTrue(datos['miniatura'].endswith(f'/api/historiales/documentos/{documento_id}/previa/miniatura/'))
+        respuesta = self.client.get(datos['vista_previa'])
+        self.assertEqual(respuesta['Content-Type'], 'image/jpeg')
+        with Image.open(io.BytesIO(b''.join(respuesta.streaming_content))) as vista:
+            self.assertEqual(vista.size, (1600, 800))
+        with Image.open(io.BytesIO(b''.join(self.client.get(datos['miniatura']).streaming_content))) as miniatura:
+            self.assertEqual(miniatura.size, (256, 128))
+
+        datos = self.client.get(f'/api/historiales/documentos/{pdf_id}/').data
+        self.assertIsNone(datos['miniatura'])
+        self.assertEqual(self.client.get(f'/api/historiales/documentos/{pdf_id}/previa/vista/').status_code, 404)
+
+    def test_regenerar_en_paralelo(self):
+        imagen = io.BytesIO()
+        Image.new('RGB', (300, 600), 'blue').save(imagen, 'JPEG')
+        documento = DocumentoAdjunto.objects.create(
+            historial=self.historial, tipo_documento='Foto', archivo=SimpleUploadedFile('foto.jpg', imagen.getvalue()),
+        )
+        call_command('regenerar_previas', procesos=2, stdout=io.StringIO())
+        self.assertEqual(previas.existentes(documento), {'miniatura': True, 'vista': True})
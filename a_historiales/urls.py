@@ -1,17 +1,26 @@
 from rest_framework.routers import DefaultRouter
 from django.urls import path, include
 from .views import (HistorialClinicoViewSet, DocumentoAdjuntoViewSet, 
-                    FormularioViewSet, PreguntaViewSet, RespuestaViewSet,
-                    DescargarDocumentoAPIView)
+                    FormularioViewSet, FormularioPublicadoViewSet, PreguntaViewSet, RespuestaViewSet,
+                    DescargarDocumentoAPIView, SignosVitalesAPIView, DocumentosPacienteZipAPIView,
+                    InformePacienteAPIView,
+                    SubidasDocumentoAPIView, SubidaDocumentoAPIView, FinalizarSubidaAPIView)
 
 router = DefaultRouter()
 router.register(r"historiales", HistorialClinicoViewSet, basename="historiales")
 router.register(r"documentos", DocumentoAdjuntoViewSet, basename="documentos")
 router.register(r"formularios", FormularioViewSet, basename="formularios")
+router.register(r"formularios-publicados", FormularioPublicadoViewSet, basename="formularios-publicados")
 router.register(r"preguntas", PreguntaViewSet, basename="preguntas")
 router.register(r"respuestas", RespuestaViewSet, basename="respuestas")
 
 urlpatterns = [
     path("", include(router.urls)),
     path('documentos/<uuid:documento_id>/descargar/', DescargarDocumentoAPIView.as_view(), name='descargar_documento'),
+    path('subidas/', SubidasDocumentoAPIView.as_view(), name='subidas_documento'),
+    path('subidas/<uuid:subida_id>/', SubidaDocumentoAPIView.as_view(), name='subida_documento'),
+    path('subidas/<uuid:subida_id>/finalizar/', FinalizarSubidaAPIView.as_view(), name='finalizar_subida'),
+    path('pacientes/<uuid:paciente_id>/signos-vitales/', SignosVitalesAPIView.as_view(), name='signos_vitales'),
+    path('pacientes/<uuid:paciente_id>/informe-pdf/', InformePacienteAPIView.as_view(), name='informe_paciente'),
+    path('pacientes/<uuid:paciente_id>/documentos.zip/', DocumentosPacienteZipAPIView.as_view(), name='documentos_paciente_zip'),
 ]
\ No newline at end of file
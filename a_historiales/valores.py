@@ -0,0 +1,114 @@
+"""
+Conversión del valor de una respuesta (texto) a su tipo según Pregunta.tipo_dato.
+
+Respuesta.valor se guarda siempre como texto; además se llenan las columnas
+valor_numero, valor_booleano y valor_fecha según el tipo de la pregunta, con
+índices (pregunta, columna), para poder filtrar historiales por respuestas sin
+leer y convertir todas las filas en Python. Si el texto no se puede convertir
+la columna queda en NULL.
+"""
+import math
+from datetime import datetime
+
+from django.utils.dateparse import parse_date, parse_datetime
+
+COLUMNAS = {
+    'numero': 'valor_numero',
+    'booleano': 'valor_booleano',
+    'fecha': 'valor_fecha',
+}
+CAMPOS_TIPADOS = list(COLUMNAS.values())
+
+VERDADEROS = {'true', 't', '1', 'si', 'sí', 's', 'verdadero', 'v', 'yes', 'on'}
+FALSOS = {'false', 'f', '0', 'no', 'n', 'falso', 'off'}
+
+
+def a_numero(texto):
+    texto = str(texto).strip().replace(' ', '')
+    # Se acepta coma decimal ("36,5") si no hay punto
+    if ',' in texto and '.' not in texto:
+        texto = texto.replace(',', '.')
+    try:
+        numero = float(texto)
+    except ValueError:
+        return None
+    return numero if math.isfinite(numero) else None
+
+
+def a_booleano(texto):
+    texto = str(texto).strip().lower()
+    if texto in VERDADEROS:
+        return True
+    if texto in FALSOS:
+        return False
+    return None
+
+
+def a_fecha(texto):
+    texto = str(texto).strip()
+    try:
+        fecha = parse_date(texto)
+        if fecha is None:
+            fecha_hora = parse_datetime(texto)
+            fecha = fecha_hora.date() if fecha_hora else None
+        if fecha is None:
+            # Formato local dd/mm/aaaa
+            fecha = datetime.strptime(texto, '%d/%m/%Y').date()
+    except ValueError:
+        return None
+    return fecha
+
+
+CONVERSORES = {
+    'valor_numero': a_numero,
+    'valor_booleano': a_booleano,
+    'valor_fecha': a_fecha,
+}
+
+
+def convertir(tipo_dato, texto):
+    """Valor tipado de texto para tipo_dato, o None si no aplica o no se puede convertir."""
+    columna = COLUMNAS.get(tipo_dato)
+    if columna is None or texto is None:
+        return None
+    return CONVERSORES[columna](texto)
+
+
+def valores_tipados(tipo_dato, texto):
+    """{columna: valor} para las tres columnas tipadas (las que no aplican quedan en None)."""
+    valores = dict.fromkeys(CAMPOS_TIPADOS)
+    columna = COLUMNAS.get(tipo_dato)
+    if columna is not None:
+        valores[columna] = convertir(tipo_dato, texto)
+    return valores
+
+
+# Claves de HistorialClinico.signos_vitales que se copian a SignoVital (ver signos.py)
+METRICAS = (
+    'presion_arterial_sistolica',
+    'presion_arterial_diastolica',
+    'frecuencia_cardiaca',
+    'frecuencia_respiratoria',
+    'temperatura',
+    'saturacion_oxigeno',
+    'peso',
+    'talla',
+)
+
+
+def extraer_signos(signos_vitales):
+    """{métrica: número} de las claves conocidas de signos_vitales que se pueden convertir."""
+    if not isinstance(signos_vitales, dict):
+        return {}
+    valores = {}
+    # "presion_arterial": "120/80" se reparte en sistólica y diastólica
+    presion = signos_vitales.get('presion_arterial')
+    if isinstance(presion, str) and '/' in presion:
+        sistolica, _, diastolica = presion.partition('/')
+        valores['presion_arterial_sistolica'] = a_numero(sistolica)
+        valores['presion_arterial_diastolica'] = a_numero(diastolica)
+    for metrica in METRICAS:
+        valor = signos_vitales.get(metrica)
+        if valor is not None and not isinstance(valor, (bool, dict, list)):
+            valores[metrica] = a_numero(valor)
+    return {metrica: valor for metrica, valor in valores.items() if valor is not None}
@@ -2,26 +2,104 @@ from django.shortcuts import render
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.serializers import ListSerializer
 from rest_framework.views import APIView
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.permissions import IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
-from django.http import FileResponse
-from .models import HistorialClinico, Formulario, Pregunta, Respuesta, DocumentoAdjunto
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.core.exceptions import ValidationError
+import os
+import re
+from datetime import datetime, time
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from a_pacientes.models import Pacientes
+from .models import HistorialClinico, Formulario, FormularioPublicado, Pregunta, Respuesta, DocumentoAdjunto
 from .serializers import (
     HistorialClinicoSerializer, FormularioSerializer, PreguntaSerializer, 
-    RespuestaSerializer, DocumentoAdjuntoSerializer, PreguntaConRespuestaSerializer)
+    RespuestaSerializer, DocumentoAdjuntoSerializer, PreguntaConRespuestaSerializer,
+    SubidaDocumentoSerializer, PreguntasLoteSerializer, FormularioPublicadoSerializer)
 from a_bitacora.base import BitacoraModelViewSet
+from a_bitacora.cambios import identificar
+from a_bitacora.utils import RegistroBitacora
+from .ensamblado import cargar_respuestas
+from .filters import HistorialClinicoFilter, RespuestaFilter
+from .esquemas import subir_version, version_actual, etag, esquema_formulario, formulario_activo, formularios_especialidad
+from .services import PreguntaService, PreguntasInvalidas, RespuestaService, RespuestasInvalidas
+from .signos import serie
+from .descargas import respuesta_archivo, respuesta_documento
+from . import busqueda
+from . import informes
+from . import paquetes
+from . import previas
+from . import publicaciones
+from . import subidas
+from .valores import METRICAS
+
+def no_modificado_desde(request, etiqueta):
+    """304 si el cliente ya tiene esta versión (If-None-Match), o None."""
+    respuesta = get_conditional_response(request, etag=etiqueta)
+    if respuesta is not None:
+        respuesta['ETag'] = etiqueta
+    return respuesta
+
+def con_etag(respuesta, etiqueta):
+    # no-cache: el cliente guarda la respuesta pero revalida siempre con el ETag
+    respuesta['ETag'] = etiqueta
+    patch_cache_control(respuesta, private=True, no_cache=True)
+    return respuesta
+
+def respuesta_informe(request, datos, nombre):
+    """El PDF de datos (ver informes.py); 202 mientras se genera, 503 si la cola está llena."""
+    try:
+        ruta = informes.obtener(datos)
+    except informes.InformeOcupado:
+        return Response({'detail': 'Hay demasiados informes en proceso, reintente en unos segundos'},
+                        status=503, headers={'Retry-After': '10'})
+    except Exception as e:
+        print(f"[Informes] Error al generar informe {datos['tipo']} {datos['id']}: {e}")
+        return Response({'detail': f'Error al generar el informe: {str(e)}'}, status=500)
+    if ruta is None:
+        return Response({'estado': 'en_proceso'}, status=status.HTTP_202_ACCEPTED, headers={'Retry-After': '5'})
+    return respuesta_archivo(request, ruta, nombre, f'"{datos["huella"]}"',
+                             adjunto=request.query_params.get('inline') != 'true')
 
 class HistorialClinicoViewSet(BitacoraModelViewSet):
     queryset = HistorialClinico.objects.all()
     serializer_class = HistorialClinicoSerializer
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     search_fields = ['motivo_consulta', 'diagnostico', 'fuente', 'confiabilidad']
-    filterset_fields = ['paciente', 'usuario', 'especialidad', 'fecha']
+    # ?q= es la búsqueda de texto completo con relevancia (ver list y busqueda.py)
+    # Además de los campos, ?respuesta=<pregunta>:<op>:<valor> filtra por respuestas tipadas
+    filterset_class = HistorialClinicoFilter
     ordering_fields = ['fecha']
     ordering = ['-fecha']
 
+    def get_queryset(self):
+        # Preguntas y respuestas las carga HistorialClinicoSerializer (ver ensamblado.py)
+        return (super().get_queryset().select_related('formulario', 'formulario_publicado')
+                .prefetch_related('documentoadjunto_set'))
+
+    def list(self, request, *args, **kwargs):
+        # ?q= busca en texto completo y ordena por relevancia (ver busqueda.py); ?search= sigue igual
+        q = request.query_params.get('q', '').strip()
+        if not q:
+            return super().list(request, *args, **kwargs)
+
+        queryset = busqueda.buscar(self.filter_queryset(self.get_queryset()), q)
+        pagina = self.paginate_queryset(queryset)
+        historiales = pagina if pagina is not None else list(queryset)
+        datos = self.get_serializer(historiales, many=True).data
+        for item, historial in zip(datos, historiales):
+            item['rango'] = historial.rango
+            item['resaltado'] = {
+                'diagnostico': busqueda.resaltar(historial.resaltado_diagnostico),
+                'motivo_consulta': busqueda.resaltar(historial.resaltado_motivo),
+            }
+        return self.get_paginated_response(datos) if pagina is not None else Response(datos)
+
     @action(detail=True, methods=['get'], url_path='formulario-completo')
     def formulario_completo(self, request, pk=None):
         try:
@@ -32,27 +110,27 @@ class HistorialClinicoViewSet(BitacoraModelViewSet):
             if not historia:
                 return Response({'detail': 'Historial Clínico no encontrado'}, status=404)
 
-            # Acceder a la especialidad
-            especialidad = historia.especialidad
-            if not especialidad:
-                return Response({'detail': 'Especialidad no encontrada en el historial clínico'}, status=404)
-
-            # Obtener formulario relacionado con la especialidad
-            formulario = Formulario.objects.filter(especialidad=especialidad, activo=True).first()
+            # La versión publicada con la que se completó; si no tiene, el formulario activo de la especialidad
+            if historia.formulario_publicado_id:
+                formulario = historia.formulario_publicado.esquema
+            else:
+                formulario = formulario_activo(historia.especialidad_id)
             if not formulario:
                 return Response({'detail': 'No hay formulario asociado'}, status=404)
 
-            # Obtener preguntas relacionadas con el formulario
-            preguntas = Pregunta.objects.filter(formulario=formulario).order_by('orden')
-            if not preguntas:
+            if not formulario['preguntas']:
                 return Response({'detail': 'No hay preguntas asociadas al formulario'}, status=404)
 
-            # Pasar el historial_clinico al contexto para que las respuestas puedan ser recuperadas correctamente
-            serializer = PreguntaConRespuestaSerializer(preguntas, many=True, context={'historial_clinico': historia})
+            # Las respuestas del historial en una consulta, unidas a las preguntas del esquema
+            respuestas = {str(pregunta_id): valor for (_, pregunta_id), valor in cargar_respuestas([historia]).items()}
+            preguntas_respuestas = [
+                {**pregunta, 'respuesta': respuestas.get(str(pregunta['id']))}
+                for pregunta in formulario['preguntas']
+            ]
 
             return Response({
-                'formulario': FormularioSerializer(formulario).data,
-                'preguntas_respuestas': serializer.data
+                'formulario': formulario,
+                'preguntas_respuestas': preguntas_respuestas
             })
 
         except HistorialClinico.DoesNotExist:
@@ -72,45 +150,15 @@ class HistorialClinicoViewSet(BitacoraModelViewSet):
             # Obtener el formulario
             try:
                 formulario = Formulario.objects.get(id=formulario_id)
-            except Formulario.DoesNotExist:
+            except (Formulario.DoesNotExist, ValidationError):
                 return Response({'detail': 'Formulario no encontrado'}, status=404)
 
-            # Asignar formulario al historial
-            historial.formulario = formulario
-            historial.save()
-
-            # Procesar las respuestas enviadas
-            respuestas_data = request.data.get('respuestas', [])
-            
-            for respuesta_item in respuestas_data:
-                pregunta_id = respuesta_item.get('pregunta')
-                valor = respuesta_item.get('valor')
-
-                if not pregunta_id:
-                    continue
-
-                try:
-                    pregunta = Pregunta.objects.get(id=pregunta_id)
-                except Pregunta.DoesNotExist:
-                    continue
-
-                # Buscar si ya existe una respuesta para esta pregunta y historial
-                respuesta_existente = Respuesta.objects.filter(
-                    pregunta=pregunta, 
-                    historial_clinico=historial
-                ).first()
-
-                if respuesta_existente:
-                    # Actualizar respuesta existente
-                    respuesta_existente.valor = valor
-                    respuesta_existente.save()
-                else:
-                    # Crear nueva respuesta
-                    Respuesta.objects.create(
-                        pregunta=pregunta,
-                        historial_clinico=historial,
-                        valor=valor
-                    )
+            # Asignar formulario y guardar todas las respuestas en una sola transacción
+            try:
+                RespuestaService.asignar_formulario(historial, formulario, request.data.get('respuestas', []))
+            except RespuestasInvalidas as e:
+                return Response({'detail': 'Hay respuestas inválidas', 'errores': e.errores},
+                                status=status.HTTP_400_BAD_REQUEST)
 
             # Serializar el historial actualizado
             historial_serializado = HistorialClinicoSerializer(historial).data
@@ -129,17 +177,49 @@ class HistorialClinicoViewSet(BitacoraModelViewSet):
         try:
             # Obtener la historia clínica
             historia = self.get_object()
-            especialidad_id = historia.especialidad.id
+            especialidad_id = historia.especialidad_id
+
+            # Los esquemas solo cambian cuando sube la versión de formularios
+            version = version_actual()
+            etiqueta = etag('especialidad', especialidad_id, version=version)
+            no_modificado = no_modificado_desde(request, etiqueta)
+            if no_modificado is not None:
+                return no_modificado
 
             # Obtener formularios asociados a la especialidad
-            formularios = Formulario.objects.filter(especialidad=especialidad_id, activo=True)
-            serializer = FormularioSerializer(formularios, many=True)
+            formularios = formularios_especialidad(especialidad_id, version=version)
 
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            return con_etag(Response(formularios, status=status.HTTP_200_OK), etiqueta)
         
         except Exception as e:
             return Response({'detail': f'Error al obtener formularios: {str(e)}'}, status=500)
 
+    @action(detail=True, methods=['get'], url_path='informe-pdf')
+    def informe_pdf(self, request, pk=None):
+        """Informe PDF del historial, guardado mientras sus datos no cambien (ver informes.py)."""
+        historial = self.get_object()
+        return respuesta_informe(
+            request, informes.informe_historial(historial),
+            f"historial-{timezone.localtime(historial.fecha):%Y-%m-%d}-{str(historial.pk)[:8]}.pdf",
+        )
+
+    @action(detail=True, methods=['get'], url_path=r'documentos\.zip', url_name='documentos-zip')
+    def documentos_zip(self, request, pk=None):
+        """ZIP con los documentos del historial, una carpeta por tipo de documento (ver paquetes.py)."""
+        historial = self.get_object()
+        documentos = historial.documentoadjunto_set.order_by('fecha_subida', 'id')
+        RegistroBitacora.registrar(
+            usuario=request.user,
+            accion=f"Exportó documentos del historial: {historial.pk}",
+            ip=self.get_client_ip(),
+            modulo=self.bitacora_modulo,
+            detalles=self.get_detalles_objeto(historial, documentos=documentos.count()),
+        )
+        return paquetes.respuesta_zip(
+            documentos, paquetes.carpeta_historial,
+            f"historial-{timezone.localtime(historial.fecha):%Y-%m-%d}-{str(historial.pk)[:8]}.zip",
+        )
+
 class FormularioViewSet(BitacoraModelViewSet):
     queryset = Formulario.objects.all()
     serializer_class = FormularioSerializer
@@ -148,6 +228,40 @@ class FormularioViewSet(BitacoraModelViewSet):
     ordering_fields = ['nombre']
     ordering = ['nombre']
 
+    def retrieve(self, request, *args, **kwargs):
+        # Esquema compilado desde el caché; con If-None-Match vigente se responde 304
+        version = version_actual()
+        etiqueta = etag('formulario', kwargs['pk'], version=version)
+        no_modificado = no_modificado_desde(request, etiqueta)
+        if no_modificado is not None:
+            return no_modificado
+
+        formulario = esquema_formulario(kwargs['pk'], version=version)
+        if formulario is None:
+            return Response({'detail': 'Formulario no encontrado'}, status=status.HTTP_404_NOT_FOUND)
+        return con_etag(Response(formulario), etiqueta)
+
+    @action(detail=True, methods=['post'], url_path='publicar')
+    def publicar(self, request, pk=None):
+        """Publica el formulario tal como está; si no cambió desde la última publicación devuelve esa (200)."""
+        formulario = self.get_object()
+        publicado, creado = publicaciones.publicar(formulario)
+        if creado:
+            objeto_tipo, objeto_id = identificar(formulario)
+            try:
+                RegistroBitacora.registrar(
+                    usuario=request.user,
+                    accion=f"Publicó el formulario: {formulario.nombre} (v{publicado.numero})",
+                    ip=self.get_client_ip(),
+                    modulo=self.bitacora_modulo,
+                    detalles={'objeto': formulario.nombre, 'objeto_tipo': objeto_tipo, 'objeto_id': objeto_id,
+                              'publicacion': str(publicado.pk), 'numero': publicado.numero},
+                )
+            except Exception as e:
+                print(f"[Bitácora] Error al registrar publicación: {e}")
+        return Response(FormularioPublicadoSerializer(publicado).data,
+                        status=status.HTTP_201_CREATED if creado else status.HTTP_200_OK)
+
     def get_queryset(self):
         queryset = super().get_queryset()
 
@@ -169,8 +283,28 @@ class FormularioViewSet(BitacoraModelViewSet):
 
         return queryset
 
+class FormularioPublicadoViewSet(viewsets.ReadOnlyModelViewSet):
+    """Versiones publicadas de los formularios; nunca cambian, así que se cachean para siempre."""
+    queryset = FormularioPublicado.objects.all()
+    serializer_class = FormularioPublicadoSerializer
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['formulario']
+    ordering_fields = ['numero', 'fecha']
+    ordering = ['-fecha']
+
+    def retrieve(self, request, *args, **kwargs):
+        # El id basta como ETag: el contenido de una versión publicada no cambia
+        etiqueta = f'"{kwargs["pk"]}"'
+        respuesta = no_modificado_desde(request, etiqueta)
+        if respuesta is None:
+            respuesta = super().retrieve(request, *args, **kwargs)
+            respuesta['ETag'] = etiqueta
+        patch_cache_control(respuesta, private=True, max_age=60 * 60 * 24 * 365, immutable=True)
+        return respuesta
+
 class PreguntaViewSet(BitacoraModelViewSet):
-    queryset = Pregunta.objects.all()
+    # Las desactivadas (eliminadas con respuestas) ya no son parte del formulario
+    queryset = Pregunta.objects.filter(activo=True)
     serializer_class = PreguntaSerializer
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['formulario']
@@ -190,11 +324,63 @@ class PreguntaViewSet(BitacoraModelViewSet):
         self.perform_create(serializer)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    def perform_create(self, serializer):
+        if not isinstance(serializer, ListSerializer):
+            return super().perform_create(serializer)
+        preguntas = serializer.save()
+        # El INSERT en lote no dispara las señales que invalidan los esquemas
+        subir_version()
+        try:
+            RegistroBitacora.registrar(
+                usuario=self.request.user,
+                accion=f"Creó {len(preguntas)} preguntas",
+                ip=self.get_client_ip(),
+                modulo=self.bitacora_modulo,
+                detalles={'objeto': f"{len(preguntas)} preguntas", 'preguntas': [str(p.pk) for p in preguntas]},
+            )
+        except Exception as e:
+            print(f"[Bitácora] Error al registrar creación: {e}")
+
+    @action(detail=False, methods=['post'], url_path='lote')
+    def lote(self, request):
+        """
+        Crea, actualiza, elimina y reordena preguntas de un formulario en una sola transacción.
+
+        Cuerpo: {formulario, crear: [...], actualizar: [{id, ...}], eliminar: [id], orden: [id]}
+        (ver PreguntaService.aplicar_lote). Responde las preguntas del formulario ya ordenadas.
+        """
+        serializer = PreguntasLoteSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+        formulario = datos['formulario']
+
+        try:
+            resumen = PreguntaService.aplicar_lote(
+                formulario, datos['crear'], datos['actualizar'], datos['eliminar'], datos.get('orden'),
+            )
+        except PreguntasInvalidas as e:
+            return Response({'detail': 'Hay cambios inválidos', 'errores': e.errores}, status=status.HTTP_400_BAD_REQUEST)
+
+        objeto_tipo, objeto_id = identificar(formulario)
+        try:
+            RegistroBitacora.registrar(
+                usuario=request.user,
+                accion=f"Editó preguntas del formulario: {formulario.nombre}",
+                ip=self.get_client_ip(),
+                modulo=self.bitacora_modulo,
+                detalles={'objeto': formulario.nombre, 'objeto_tipo': objeto_tipo, 'objeto_id': objeto_id, **resumen},
+            )
+        except Exception as e:
+            print(f"[Bitácora] Error al registrar edición de preguntas: {e}")
+
+        preguntas = Pregunta.objects.filter(formulario=formulario, activo=True).order_by('orden')
+        return Response({**resumen, 'preguntas': PreguntaSerializer(preguntas, many=True).data})
+
 class RespuestaViewSet(BitacoraModelViewSet):
     queryset = Respuesta.objects.all()
     serializer_class = RespuestaSerializer
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['pregunta', 'historial_clinico']
+    filterset_class = RespuestaFilter
 
 class DocumentoAdjuntoViewSet(BitacoraModelViewSet):
     queryset = DocumentoAdjunto.objects.all()
@@ -205,6 +391,21 @@ class DocumentoAdjuntoViewSet(BitacoraModelViewSet):
     ordering_fields = ['fecha_subida']
     ordering = ['-fecha_subida']
 
+    @action(detail=True, methods=['get'], url_path='previa/(?P<tipo>miniatura|vista)')
+    def previa(self, request, pk=None, tipo=None):
+        """Miniatura o vista previa JPEG del documento, si es una imagen y ya se generó."""
+        documento = self.get_object()
+        ruta = previas.ruta_previa(documento, tipo)
+        if not os.path.exists(ruta):
+            return Response({'detail': 'Vista previa no disponible'}, status=404)
+
+        base = os.path.splitext(documento.nombre or 'documento')[0]
+        interno = os.path.relpath(ruta, settings.MEDIA_ROOT)
+        return respuesta_archivo(
+            request, ruta, f'{base}-{tipo}.jpg', f'"{previas.clave(documento)}-{tipo}"', adjunto=False,
+            nombre_interno=None if interno.startswith('..') else interno,
+        )
+
 class AdjuntarDocumentoAPIView(APIView):
     parser_classes = [MultiPartParser]
 
@@ -226,26 +427,196 @@ class AdjuntarDocumentoAPIView(APIView):
         return Response({'message': 'Documento adjuntado exitosamente'}, status=201)
     
 class DescargarDocumentoAPIView(APIView):
+    """
+    Descarga de un documento con ETag, Range y su Content-Type (ver descargas.py).
+
+    ?inline=true lo muestra en el navegador en vez de descargarlo.
+    """
     permission_classes = [IsAuthenticated]
 
     def get(self, request, documento_id):
         try:
             # Obtener el documento adjunto
             documento = DocumentoAdjunto.objects.get(id=documento_id)
-            file_path = documento.archivo.path
-            file_name = documento.archivo.name.split("/")[-1]  # Obtener solo el nombre del archivo
 
             # Verificar si el archivo existe
-            if not documento.archivo:
+            if not documento.archivo or not documento.archivo.storage.exists(documento.archivo.name):
                 return Response({'detail': 'Archivo no encontrado'}, status=404)
 
-            # Usar FileResponse para devolver el archivo
-            response = FileResponse(open(file_path, 'rb'), as_attachment=True, filename=file_name)
-            response['Content-Type'] = 'application/octet-stream'  # Asegurar tipo binario
-            response['Content-Disposition'] = f'attachment; filename="{file_name}"'  # Forzar descarga
-
-            return response
+            return respuesta_documento(request, documento, adjunto=request.query_params.get('inline') != 'true')
 
         except DocumentoAdjunto.DoesNotExist:
             return Response({'detail': 'Documento no encontrado'}, status=404)
 
+
+
+def _fecha_parametro(texto, fin_del_dia=False):
+    """Fecha o fecha-hora ISO como datetime con zona; una fecha sola es el inicio (o fin) de ese día."""
+    try:
+        # Primero como fecha sola: parse_datetime también acepta "2024-01-15" (como las 00:00)
+        dia = parse_date(texto) if len(texto) == 10 else None
+        if dia is not None:
+            fecha = datetime.combine(dia, time.max if fin_del_dia else time.min)
+        else:
+            fecha = parse_datetime(texto)
+            if fecha is None:
+                raise ValueError
+    except ValueError:
+        raise ValidationError(f"'{texto}' no es una fecha válida")
+    return timezone.make_aware(fecha) if timezone.is_naive(fecha) else fecha
+
+class SignosVitalesAPIView(APIView):
+    """
+    Series de signos vitales de un paciente, resumidas en ?buckets=N intervalos.
+
+    Parámetros: metric (una o varias separadas por coma; por defecto todas),
+    from, to (fecha o fecha-hora ISO) y buckets (por defecto 100, máximo 1000).
+    Cada intervalo trae min, max, avg y n; los que no tienen mediciones se omiten.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, paciente_id):
+        if not Pacientes.objects.filter(pk=paciente_id).exists():
+            return Response({'detail': 'Paciente no encontrado'}, status=404)
+
+        metricas = [m for m in request.query_params.get('metric', '').split(',') if m] or list(METRICAS)
+        desconocidas = [m for m in metricas if m not in METRICAS]
+        if desconocidas:
+            return Response({'metric': f"Métricas desconocidas: {', '.join(desconocidas)}", 'disponibles': METRICAS}, status=400)
+        try:
+            buckets = int(request.query_params.get('buckets', 100))
+            desde = request.query_params.get('from')
+            hasta = request.query_params.get('to')
+            desde = _fecha_parametro(desde) if desde else None
+            hasta = _fecha_parametro(hasta, fin_del_dia=True) if hasta else None
+        except ValueError:
+            return Response({'buckets': 'Debe ser un número entero'}, status=400)
+        except ValidationError as e:
+            return Response({'detail': e.messages[0]}, status=400)
+        if not 1 <= buckets <= 1000:
+            return Response({'buckets': 'Debe estar entre 1 y 1000'}, status=400)
+
+        return Response({
+            'paciente': paciente_id,
+            'from': desde,
+            'to': hasta,
+            'buckets': buckets,
+            'series': serie(paciente_id, metricas, desde, hasta, buckets),
+        })
+
+
+class InformePacienteAPIView(APIView):
+    """Informe PDF con todos los historiales del paciente (ver informes.py)."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, paciente_id):
+        paciente = Pacientes.objects.filter(pk=paciente_id).first()
+        if paciente is None:
+            return Response({'detail': 'Paciente no encontrado'}, status=404)
+        return respuesta_informe(request, informes.informe_paciente(paciente), f"paciente-{str(paciente.pk)[:8]}.pdf")
+
+class DocumentosPacienteZipAPIView(APIView):
+    """ZIP con los documentos de todos los historiales del paciente, una carpeta por historial."""
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, paciente_id):
+        paciente = Pacientes.objects.filter(pk=paciente_id).first()
+        if paciente is None:
+            return Response({'detail': 'Paciente no encontrado'}, status=404)
+
+        documentos = (
+            DocumentoAdjunto.objects.filter(historial__paciente_id=paciente_id)
+            .select_related('historial__especialidad')
+            .order_by('historial__fecha', 'fecha_subida', 'id')
+        )
+        objeto_tipo, objeto_id = identificar(paciente)
+        RegistroBitacora.registrar(
+            usuario=request.user,
+            accion=f"Exportó documentos del paciente: {paciente}",
+            ip=request.META.get('HTTP_X_FORWARDED_FOR', request.META.get('REMOTE_ADDR')),
+            modulo="Historiales",
+            detalles={'objeto': str(paciente), 'objeto_tipo': objeto_tipo, 'objeto_id': objeto_id,
+                      'documentos': documentos.count()},
+        )
+        return paquetes.respuesta_zip(documentos, paquetes.carpeta_paciente, f"paciente-{str(paciente.pk)[:8]}-documentos.zip")
+
+
+RANGO_PARTE = re.compile(r'^bytes (\d+)-(\d+)/(\d+|\*)$')
+
+def error_subida(e):
+    return Response({'detail': str(e), **e.datos}, status=e.estado)
+
+class SubidasDocumentoAPIView(APIView):
+    """
+    Abre una subida por partes: {historial, tipo_documento, nombre, tamano, sha256 (opcional)}.
+
+    Después: PUT de cada parte en subidas/<id>/ con Content-Range, GET para ver
+    cuánto se recibió (para retomar) y POST a subidas/<id>/finalizar/.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        serializer = SubidaDocumentoSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        datos = serializer.validated_data
+        try:
+            subida = subidas.crear(
+                datos['historial'], request.user, datos['tipo_documento'], datos['nombre'],
+                datos['tamano'], datos.get('sha256', ''),
+            )
+        except subidas.ErrorSubida as e:
+            return error_subida(e)
+        return Response(SubidaDocumentoSerializer(subida).data, status=201)
+
+class SubidaDocumentoAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, subida_id):
+        try:
+            subida = subidas.obtener(subida_id, request.user)
+        except subidas.ErrorSubida as e:
+            return error_subida(e)
+        return Response(SubidaDocumentoSerializer(subida).data)
+
+    def put(self, request, subida_id):
+        # El cuerpo es la parte en crudo; se lee del flujo sin pasar por request.data
+        rango = RANGO_PARTE.match(request.headers.get('Content-Range', ''))
+        if rango is None:
+            return Response({'detail': 'Falta Content-Range: bytes <inicio>-<fin>/<total>'}, status=400)
+        inicio, fin = int(rango.group(1)), int(rango.group(2))
+        total = None if rango.group(3) == '*' else int(rango.group(3))
+        longitud = fin - inicio + 1
+        largo = request.headers.get('Content-Length')
+        if largo:
+            try:
+                largo = int(largo)
+            except ValueError:
+                return Response({'detail': 'Content-Length inválido'}, status=400)
+            if largo != longitud:
+                return Response({'detail': 'Content-Length no coincide con Content-Range'}, status=400)
+
+        if request.stream is None:
+            return Response({'detail': 'La parte está vacía'}, status=400)
+
+        try:
+            subida = subidas.recibir(subida_id, request.user, inicio, longitud, total, request.stream)
+        except subidas.ErrorSubida as e:
+            return error_subida(e)
+        return Response({'id': subida.pk, 'recibido': subida.recibido, 'tamano': subida.tamano})
+
+    def delete(self, request, subida_id):
+        try:
+            subidas.cancelar(subida_id, request.user)
+        except subidas.ErrorSubida as e:
+            return error_subida(e)
+        return Response(status=204)
+
+class FinalizarSubidaAPIView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request, subida_id):
+        try:
+            documento, sha256 = subidas.finalizar(subida_id, request.user, request.data.get('sha256', ''))
+        except subidas.ErrorSubida as e:
+            return error_subida(e)
+        return Response({**DocumentoAdjuntoSerializer(documento).data, 'sha256': sha256}, status=201)
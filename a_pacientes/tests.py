@@ -1,3 +1,74 @@
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+
 from django.test import TestCase
+from rest_framework.test import APIClient
+
+from a_especialidades.models import Especialidad
+from a_historiales.models import DocumentoAdjunto, Formulario, HistorialClinico, Pregunta, Respuesta
+from a_roles.models import Permiso, Rol
+from a_usuarios.models import Usuario
+from .models import Pacientes
+
+
+class LineaTiempoTests(TestCase):
+    """La línea de tiempo mezcla historiales y documentos en orden y pagina por cursor."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rol = Rol.objects.create(nombre='Médico')
+        rol.permisos.add(Permiso.objects.create(codename='view_pacientes'))
+        cls.usuario = Usuario.objects.create_user(email='medico@test.com', nombre='Medico', apellido='Test', rol=rol)
+        especialidad = Especialidad.objects.create(nombre='Cardiología', descripcion='-')
+        cls.paciente = Pacientes.objects.create(
+            nombre='Ana', apellido='Pérez', ci='123', fecha_nacimiento=date(1990, 1, 1), sexo='F', asegurado=True,
+        )
+        otro = Pacientes.objects.create(
+            nombre='Otro', apellido='Paciente', ci='999', fecha_nacimiento=date(1990, 1, 1), sexo='M', asegurado=True,
+        )
+        formulario = Formulario.objects.create(nombre='Control', especialidad=especialidad)
+        pregunta = Pregunta.objects.create(formulario=formulario, texto='Presión', tipo_dato='numero', orden=1)
+
+        inicio = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+        cls.esperado = []
+        for i in range(7):
+            for paciente in (cls.paciente, otro):
+                historial = HistorialClinico.objects.create(
+                    paciente=paciente, usuario=cls.usuario, especialidad=especialidad, formulario=formulario,
+                    motivo_consulta='Control', fuente='Paciente', diagnostico='-', signos_vitales={},
+                )
+                HistorialClinico.objects.filter(pk=historial.pk).update(fecha=inicio + timedelta(days=i))
+                Respuesta.objects.create(pregunta=pregunta, historial_clinico=historial, valor='120')
+                documento = DocumentoAdjunto.objects.create(historial=historial, tipo_documento='Laboratorio', archivo=f'lab{i}.pdf')
+                # Los de los días pares se suben el mismo instante que el historial
+                DocumentoAdjunto.objects.filter(pk=documento.pk).update(
+                    fecha_subida=inicio + timedelta(days=i, hours=0 if i % 2 == 0 else 3)
+                )
+                if paciente == cls.paciente:
+                    cls.esperado += [('historial', str(historial.pk)), ('documento', str(documento.pk))]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.usuario)
+
+    def test_paginas_en_orden_sin_repetir(self):
+        url = f'/api/pacientes/{self.paciente.pk}/timeline/?page_size=4'
+        vistas, paginas = [], 0
+        while url:
+            with self.assertNumQueries(4):  # usuario/permisos, paciente, historiales, documentos
+                respuesta = self.client.get(url)
+            self.assertEqual(respuesta.status_code, 200)
+            vistas += respuesta.data['results']
+            url = respuesta.data['next']
+            paginas += 1
+
+        self.assertEqual(paginas, 4)
+        self.assertEqual(len(vistas), 14)
+        self.assertEqual({(e['tipo'], str(e['id'])) for e in vistas}, set(self.esperado))
+        fechas = [e['fecha'] for e in vistas]
+        self.assertEqual(fechas, sorted(fechas, reverse=True))
+        historial = next(e for e in vistas if e['tipo'] == 'historial')
+        self.assertEqual(historial['respuestas'], {'formulario': 'Control', 'total': 1})
 
-# Create your tests here.
+    def test_cursor_invalido(self):
+        respuesta = self.client.get(f'/api/pacientes/{self.paciente.pk}/timeline/?cursor=xyz')
+        self.assertEqual(respuesta.status_code, 400)
@@ -3,12 +3,15 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.exceptions import PermissionDenied
 from rest_framework.filters import OrderingFilter
+from rest_framework.decorators import action
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
 from .models import Pacientes
 from .serializers import PacientesSerializer
 from .filters import PacientesFilter
 from a_bitacora.base import BitacoraModelViewSet
 from a_usuarios.permissions import PermisosMixin
+from a_historiales import linea_tiempo
 
 class PacientesViewSet(PermisosMixin, BitacoraModelViewSet):
     queryset = Pacientes.objects.all()
@@ -21,3 +24,22 @@ class PacientesViewSet(PermisosMixin, BitacoraModelViewSet):
     bitacora_modulo = "pacientes"
     modulo_permisos = "pacientes"
 
+    @action(detail=True, methods=['get'])
+    def timeline(self, request, pk=None):
+        """
+        Historiales y documentos del paciente, del más reciente al más antiguo.
+
+        Paginada por cursor: ?cursor= viene en 'next'; ?page_size= hasta 100.
+        """
+        self.check_permiso("view")
+        paciente = self.get_object()
+        try:
+            tamano = max(1, min(int(request.query_params.get('page_size', 20)), 100))
+        except ValueError:
+            tamano = 20
+
+        entradas, siguiente = linea_tiempo.pagina(paciente.pk, request.query_params.get('cursor'), tamano)
+        return Response({
+            'next': replace_query_param(request.build_absolute_uri(), 'cursor', siguiente) if siguiente else None,
+            'results': entradas,
+        })
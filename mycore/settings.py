@@ -234,3 +234,92 @@ MEDIA_URL = '/media/'
 
 # Ruta del sistema de archivos donde se guardan los archivos
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Bitácora
+# 'sincrono': cada entrada se inserta dentro de la petición.
+# 'buffer': las entradas se encolan y un hilo las inserta por lotes (a_bitacora/buffer.py).
+BITACORA_MODO = 'sincrono'
+
+# Las escrituras sin ninguna acción registrada se atribuyen también al usuario autenticado por JWT.
+# Antes de juntar los hechos por petición el middleware solo veía la sesión y esas peticiones no
+# dejaban entrada; False vuelve a ese comportamiento (las que registran alguna acción se escriben igual).
+BITACORA_REGISTRAR_JWT = True
+
+BITACORA_BUFFER = {
+    'TAMANO_LOTE': 200,  # se vacía al juntar este número de entradas...
+    'INTERVALO': 2.0,  # ...o cada tantos segundos
+    'DIRECTORIO_SPOOL': os.path.join(BASE_DIR, 'var', 'bitacora'),
+}
+
+# Reportes PDF de bitácora: por encima de este número de entradas se generan en segundo plano
+BITACORA_REPORTE_LIMITE_SINCRONO = 20000
+BITACORA_REPORTES_DIR = os.path.join(BASE_DIR, 'var', 'reportes')
+# Segundos sin que avance el .part de un reporte en segundo plano para darlo por abandonado
+BITACORA_REPORTE_ABANDONO = 300
+
+# Archivo frío de bitácora: meses completos que quedan en la tabla en vivo (ver archivar_bitacora)
+BITACORA_RETENCION_MESES = 12
+BITACORA_ARCHIVO_DIR = os.path.join(BASE_DIR, 'var', 'archivo')
+
+# Textos más largos que esto se guardan en los cambios de la bitácora como extracto + sha256
+BITACORA_CAMBIOS_MAX_TEXTO = 200
+
+# Purga de bitácora por módulo (purgar_bitacora): días que se conservan y qué hacer con lo vencido
+# ('borrar' o 'archivar'). '*' aplica a los módulos sin entrada propia; 'dias': None conserva todo.
+BITACORA_PURGA = {
+    'LOTE': 1000,  # entradas por DELETE
+    'PAUSA': 0.5,  # segundos entre lotes
+    'MODULOS': {
+        '*': {'dias': 365, 'accion': 'archivar'},
+    },
+    'ESTADO': os.path.join(BASE_DIR, 'var', 'purga_bitacora.json'),
+}
+
+# Reglas de auditoría (a_bitacora/reglas.py): la primera que coincide con método, módulo y ruta decide.
+# 'accion': 'registrar' | 'omitir' | 'muestrear' (con 'n': 1 de cada n) | 'agregar' (una entrada por minuto).
+# Sin regla que coincida se registran POST/PUT/PATCH/DELETE y las lecturas que registren algo.
+BITACORA_REGLAS = [
+    {'ruta': r'^/static/', 'accion': 'omitir'},
+    {'ruta': r'^/admin/', 'accion': 'omitir'},
+    # El autoguardado de respuestas hace muchas escrituras pequeñas
+    {'ruta': r'^/api/historiales/respuestas/', 'metodos': ['POST', 'PUT', 'PATCH'], 'accion': 'agregar'},
+    # Cada parte de una subida de documento es un PUT
+    {'ruta': r'^/api/historiales/subidas/[^/]+/$', 'metodos': ['PUT'], 'accion': 'agregar'},
+]
+
+# Subidas por partes de documentos adjuntos (a_historiales/subidas.py): archivos temporales,
+# tamaño máximo en bytes y horas sin actividad tras las que limpiar_subidas las borra.
+SUBIDAS_DOCUMENTOS = {
+    'DIRECTORIO': os.path.join(BASE_DIR, 'var', 'subidas'),
+    'TAMANO_MAXIMO': 2 * 1024 ** 3,
+    'CADUCIDAD_HORAS': 24,
+}
+
+# Descargas de documentos (a_historiales/descargas.py). Con 'SERVIDOR': 'x-accel-redirect' (nginx)
+# o 'x-sendfile' (Apache/lighttpd) el archivo lo envía el servidor web; para nginx, PREFIJO_INTERNO
+# es la location 'internal' que apunta a MEDIA_ROOT. Con None lo envía Django.
+DESCARGAS = {
+    'SERVIDOR': None,
+    'PREFIJO_INTERNO': '/media-interno/',
+}
+
+# Miniaturas y vistas previas de documentos que son imágenes (a_historiales/previas.py): tamaños
+# máximos, calidad JPEG, procesos del pool (0 = en el mismo proceso) y tareas encoladas como máximo.
+VISTAS_PREVIAS = {
+    'DIRECTORIO': os.path.join(MEDIA_ROOT, 'previas'),
+    'MINIATURA': (256, 256),
+    'VISTA': (1600, 1600),
+    'CALIDAD': 82,
+    'PROCESOS': 2,
+    'MAX_PENDIENTES': 200,
+}
+
+# Informes PDF de historiales y pacientes (a_historiales/informes.py): dónde se guardan, procesos del
+# pool (0 = en la misma petición), segundos que la petición espera antes de responder 202 y tareas
+# encoladas como máximo.
+INFORMES_PDF = {
+    'DIRECTORIO': os.path.join(BASE_DIR, 'var', 'informes'),
+    'PROCESOS': 2,
+    'ESPERA': 10,
+    'MAX_PENDIENTES': 100,
+}